@@ -0,0 +1,546 @@
+import time
+import hashlib
+import multiprocessing
+
+from asyncio import AbstractEventLoop, CancelledError
+from collections import OrderedDict, deque, namedtuple
+from typing import Dict, List, Optional, Sequence, Tuple  # noqa
+
+from .const import Status
+from .exceptions import GRPCError
+
+
+_DEFAULT_LAG_INTERVAL = 0.1
+# how many times event loop lag is measured during the lag interval
+_LAG_PROBES = 10
+
+_NOT_LIMITED = object()
+
+_LOCAL_BACKEND_MAX_KEYS = 10000
+_SHARED_MEMORY_BACKEND_SIZE = 4096
+# how many consecutive slots are probed to find a bucket of the key
+_SHARED_MEMORY_BACKEND_PROBES = 8
+
+
+def _validate_limit(name, value):
+    if value is not None and (not isinstance(value, int) or value < 1):
+        raise ValueError('Invalid {}: {!r}'.format(name, value))
+
+
+class AdmissionControl:
+    """
+    Limits amount of work, accepted by the
+    :py:class:`~grpclib.server.Server`, to keep latency bounded when server
+    is overloaded
+
+    .. code-block:: python
+
+        admission = AdmissionControl(
+            max_in_flight=100,
+            max_loop_lag=0.05,
+            method_limits={
+                '/coffee.CoffeeMachine/MakeLatte': 10,
+                '/grpc.health.v1.Health/Check': None,
+            },
+            loop=loop,
+        )
+        server = Server(handlers, loop=loop, admission=admission)
+
+    New requests are rejected right after their headers are received,
+    before anything is decoded, using trailers-only responses:
+
+    - with RESOURCE_EXHAUSTED status, when number of in-flight requests has
+      reached ``max_in_flight`` limit or the limit of the requested method;
+    - with UNAVAILABLE status, when event loop lag stays above
+      ``max_loop_lag`` during the whole ``lag_interval``. Like in the CoDel
+      algorithm, short bursts are tolerated, and only the standing queue is
+      considered as overload. Requests are rejected until lag drops below
+      ``max_loop_lag`` again.
+    """
+
+    def __init__(self, *, loop: AbstractEventLoop,
+                 max_in_flight: Optional[int] = None,
+                 max_loop_lag: Optional[float] = None,
+                 lag_interval: float = _DEFAULT_LAG_INTERVAL,
+                 method_limits: Optional[Dict[str, Optional[int]]] = None
+                 ) -> None:
+        """
+        :param loop: asyncio-compatible event loop
+        :param max_in_flight: maximum number of concurrently running requests
+        :param max_loop_lag: target event loop lag (seconds)
+        :param lag_interval: how long event loop lag should stay above the
+            target, to consider server as overloaded (seconds)
+        :param method_limits: maximum number of concurrently running
+            requests per method, keys are paths of the methods
+            (``/package.Service/Method``); ``None`` value means that method
+            is exempt from admission control (e.g. health checks)
+        """
+        _validate_limit('max_in_flight', max_in_flight)
+        if max_loop_lag is not None and not max_loop_lag > 0:
+            raise ValueError('Invalid max_loop_lag: {!r}'
+                             .format(max_loop_lag))
+        if not lag_interval > 0:
+            raise ValueError('Invalid lag_interval: {!r}'
+                             .format(lag_interval))
+        method_limits = dict(method_limits or {})
+        for path, limit in method_limits.items():
+            _validate_limit('limit for {}'.format(path), limit)
+
+        self._loop = loop
+        self._max_in_flight = max_in_flight
+        self._max_loop_lag = max_loop_lag
+        self._lag_interval = lag_interval
+        self._method_limits = method_limits
+        self._in_flight = 0
+        self._method_in_flight = {}  # type: Dict[str, int]
+        self._above_target_since = None  # type: Optional[float]
+        self._probe_handle = None
+        self.overloaded = False
+
+    @property
+    def in_flight(self) -> int:
+        """Number of admitted and still running requests"""
+        return self._in_flight
+
+    def _schedule_probe(self):
+        period = self._lag_interval / _LAG_PROBES
+        self._probe_handle = self._loop.call_later(
+            period, self._probe, self._loop.time() + period,
+        )
+
+    def _probe(self, scheduled_at):
+        now = self._loop.time()
+        if now - scheduled_at < self._max_loop_lag:
+            self._above_target_since = None
+            self.overloaded = False
+        elif self._above_target_since is None:
+            self._above_target_since = scheduled_at
+        elif now - self._above_target_since >= self._lag_interval:
+            self.overloaded = True
+        self._schedule_probe()
+
+    def admit(self, path: str) -> Optional[Tuple[Status, str]]:
+        """Returns ``None`` if request was admitted, and then
+        :py:meth:`release` should be called when it is finished, otherwise
+        returns status and message for the rejection response
+        """
+        limit = self._method_limits.get(path, _NOT_LIMITED)
+        if limit is None:
+            return None
+
+        if self._max_loop_lag is not None:
+            if self._probe_handle is None:
+                self._schedule_probe()
+            if self.overloaded:
+                return Status.UNAVAILABLE, 'Server is overloaded'
+
+        if (
+            self._max_in_flight is not None
+            and self._in_flight >= self._max_in_flight
+        ):
+            return Status.RESOURCE_EXHAUSTED, 'Too many requests'
+
+        if limit is not _NOT_LIMITED:
+            method_in_flight = self._method_in_flight.get(path, 0)
+            if method_in_flight >= limit:
+                return Status.RESOURCE_EXHAUSTED, 'Too many requests'
+            self._method_in_flight[path] = method_in_flight + 1
+
+        self._in_flight += 1
+        return None
+
+    def release(self, path: str):
+        """Should be called when admitted request is finished"""
+        limit = self._method_limits.get(path, _NOT_LIMITED)
+        if limit is None:
+            return
+        if limit is not _NOT_LIMITED:
+            self._method_in_flight[path] -= 1
+        self._in_flight -= 1
+
+    def close(self):
+        """Stops event loop lag measurement"""
+        if self._probe_handle is not None:
+            self._probe_handle.cancel()
+            self._probe_handle = None
+        self._above_target_since = None
+        self.overloaded = False
+
+
+PriorityClass = namedtuple('PriorityClass', ['name', 'weight'])
+
+
+class PriorityScheduler:
+    """
+    Schedules requests of different priority classes, so latency-critical
+    requests wouldn't compete with batch requests on equal terms
+
+    .. code-block:: python
+
+        scheduler = PriorityScheduler(
+            [PriorityClass('interactive', 8), PriorityClass('batch', 1)],
+            max_concurrency=100,
+            max_queued=1000,
+            methods={'/coffee.CoffeeMachine/Backfill': 'batch'},
+            default='interactive',
+            loop=loop,
+        )
+        server = Server(handlers, loop=loop, scheduler=scheduler)
+
+    Classes are listed from the highest priority to the lowest. Request
+    class is determined by the ``metadata_key`` metadata value, if it is
+    specified and contains a known class name, then by the ``methods``
+    mapping, otherwise request belongs to the ``default`` class.
+
+    Up to ``max_concurrency`` requests run concurrently, other requests wait
+    in a queue. When slot becomes free, it is given to the class with the
+    lowest ratio of running requests to class weight, so when server is
+    saturated, concurrency is divided between classes according to their
+    weights. When queue is full, newest queued request of the lowest
+    priority class, lower than the class of the new request, is rejected
+    with RESOURCE_EXHAUSTED status, or new request itself, if there is
+    nothing to shed.
+
+    .. warning:: Clients can choose priority class using metadata, so
+        ``metadata_key`` should be used only with trusted clients.
+    """
+
+    def __init__(self, classes: List[PriorityClass], *,
+                 loop: AbstractEventLoop, max_concurrency: int,
+                 max_queued: int = 0,
+                 methods: Optional[Dict[str, str]] = None,
+                 metadata_key: Optional[str] = None,
+                 default: Optional[str] = None) -> None:
+        """
+        :param classes: list of priority classes, from the highest priority
+            to the lowest, weight should be a positive number
+        :param loop: asyncio-compatible event loop
+        :param max_concurrency: maximum number of concurrently running
+            requests
+        :param max_queued: maximum number of requests, waiting for a free
+            slot
+        :param methods: mapping of the method paths
+            (``/package.Service/Method``) to the class names
+        :param metadata_key: name of the metadata key, which may contain
+            class name
+        :param default: class of the requests, which were not classified,
+            the lowest priority class by default
+        """
+        classes = [PriorityClass(*c) for c in classes]
+        if not classes:
+            raise ValueError('At least one priority class is required')
+        for priority_class in classes:
+            if (
+                not isinstance(priority_class.weight, (int, float))
+                or not priority_class.weight > 0
+            ):
+                raise ValueError('Invalid weight of the {!r} class: {!r}'
+                                 .format(priority_class.name,
+                                         priority_class.weight))
+        _validate_limit('max_concurrency', max_concurrency)
+        if not isinstance(max_queued, int) or max_queued < 0:
+            raise ValueError('Invalid max_queued: {!r}'.format(max_queued))
+
+        self._loop = loop
+        self._weights = {c.name: c.weight for c in classes}
+        self._order = {c.name: i for i, c in enumerate(classes)}
+        self._max_concurrency = max_concurrency
+        self._max_queued = max_queued
+
+        methods = dict(methods or {})
+        if default is None:
+            default = classes[-1].name
+        for name in list(methods.values()) + [default]:
+            if name not in self._weights:
+                raise ValueError('Unknown priority class: {!r}'.format(name))
+        self._methods = methods
+        self._metadata_key = metadata_key
+        self._default = default
+
+        self._running = {c.name: 0 for c in classes}
+        self._queues = {c.name: deque() for c in classes}
+        self._running_total = 0
+        self._queued_total = 0
+
+    @property
+    def running(self) -> int:
+        """Number of running requests"""
+        return self._running_total
+
+    @property
+    def queued(self) -> int:
+        """Number of requests, waiting for a free slot"""
+        return self._queued_total
+
+    def classify(self, headers) -> str:
+        """Returns class name of the request with given headers"""
+        path = None
+        for name, value in headers:
+            if name == self._metadata_key and value in self._weights:
+                return value
+            elif name == ':path':
+                path = value
+        return self._methods.get(path, self._default)
+
+    def _start(self, name):
+        self._running[name] += 1
+        self._running_total += 1
+
+    def _shed(self, name):
+        for victim in sorted(self._queues, key=self._order.get,
+                             reverse=True):
+            if self._order[victim] <= self._order[name]:
+                break
+            queue = self._queues[victim]
+            if queue:
+                waiter = queue.pop()
+                self._queued_total -= 1
+                if not waiter.cancelled():
+                    waiter.set_exception(GRPCError(
+                        Status.RESOURCE_EXHAUSTED, 'Server is overloaded',
+                    ))
+                return True
+        return False
+
+    def _wakeup(self):
+        while (
+            self._queued_total
+            and self._running_total < self._max_concurrency
+        ):
+            name = min((n for n, q in self._queues.items() if q),
+                       key=lambda n: (self._running[n] / self._weights[n],
+                                      self._order[n]))
+            waiter = self._queues[name].popleft()
+            self._queued_total -= 1
+            # waiter could be cancelled, but not yet removed from the queue
+            if not waiter.cancelled():
+                self._start(name)
+                waiter.set_result(None)
+
+    async def acquire(self, name: str):
+        """Waits for a free slot, :py:meth:`release` should be called when
+        request is finished
+
+        :raise GRPCError: with RESOURCE_EXHAUSTED status, when request was
+            shed
+        """
+        if (
+            not self._queued_total
+            and self._running_total < self._max_concurrency
+        ):
+            self._start(name)
+            return
+
+        if self._queued_total >= self._max_queued and not self._shed(name):
+            raise GRPCError(Status.RESOURCE_EXHAUSTED,
+                            'Server is overloaded')
+
+        waiter = self._loop.create_future()
+        self._queues[name].append(waiter)
+        self._queued_total += 1
+        try:
+            await waiter
+        except CancelledError:
+            if waiter.cancelled():
+                queue = self._queues[name]
+                if waiter in queue:
+                    queue.remove(waiter)
+                    self._queued_total -= 1
+            elif waiter.exception() is None:
+                # slot was already given to this request
+                self.release(name)
+            raise
+
+    def release(self, name: str):
+        """Releases slot of the finished request"""
+        self._running[name] -= 1
+        self._running_total -= 1
+        self._wakeup()
+
+
+class RateLimit(namedtuple('RateLimit', ['rate', 'burst'])):
+    """Token bucket parameters: ``rate`` is a number of requests per second,
+    ``burst`` is a bucket capacity - maximum number of requests, which can
+    be made at once
+    """
+    __slots__ = ()
+
+    def __new__(cls, rate, burst=1):
+        if not isinstance(rate, (int, float)) or not rate > 0:
+            raise ValueError('Invalid rate: {!r}'.format(rate))
+        if not isinstance(burst, (int, float)) or not burst >= 1:
+            raise ValueError('Invalid burst: {!r}'.format(burst))
+        return super().__new__(cls, rate, burst)
+
+
+def _refill(tokens, updated_at, now, limit):
+    return min(tokens + (now - updated_at) * limit.rate, limit.burst)
+
+
+class LocalBackend:
+    """Stores token buckets in the memory of the current process
+
+    At most ``max_keys`` buckets are stored, least recently used bucket is
+    dropped to make room for a new key.
+    """
+
+    def __init__(self, *, max_keys: int = _LOCAL_BACKEND_MAX_KEYS) -> None:
+        _validate_limit('max_keys', max_keys)
+        self._max_keys = max_keys
+        self._buckets = OrderedDict() \
+            # type: Dict[str, Tuple[float, float, RateLimit]]
+
+    def consume(self, key: str, limit: RateLimit) -> bool:
+        now = time.monotonic()
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            if len(self._buckets) >= self._max_keys:
+                self._buckets.popitem(last=False)
+            tokens = limit.burst
+        else:
+            self._buckets.move_to_end(key)
+            tokens = _refill(bucket[0], bucket[1], now, limit)
+        allowed = tokens >= 1
+        self._buckets[key] = (tokens - 1 if allowed else tokens, now, limit)
+        return allowed
+
+
+def _fingerprint(key):
+    digest = hashlib.sha1(key.encode('utf-8')).digest()
+    # zero fingerprint marks unused slots
+    return int.from_bytes(digest[:8], 'big') or 1
+
+
+class SharedMemoryBackend:
+    """Stores token buckets in the shared memory, so processes, forked after
+    backend was created (e.g. :py:class:`~grpclib.workers.Workers`), enforce
+    one combined limit
+
+    Buckets are stored in a fixed-size hash table with open addressing: key's
+    bucket is looked up in a few consecutive slots, starting from the slot of
+    the key's hash. Fully refilled bucket is the same as a new one, so it's
+    slot can be taken by another key. When all these slots are occupied by
+    other keys, key falls back to the :py:class:`LocalBackend`, so it is
+    limited separately in every process.
+    """
+
+    def __init__(self, *, size: int = _SHARED_MEMORY_BACKEND_SIZE) -> None:
+        _validate_limit('size', size)
+        self._size = size
+        self._lock = multiprocessing.Lock()
+        # fingerprints of the keys, zero means that slot is not used yet
+        self._keys = multiprocessing.RawArray('Q', size)
+        # triples of the tokens number, update time and time, when bucket
+        # will be fully refilled
+        self._buckets = multiprocessing.RawArray('d', size * 3)
+        self._fallback = LocalBackend()
+
+    def _find_slot(self, fingerprint, now):
+        """Returns slot of the key, or a slot, which can be taken by the key,
+        or ``None`` if there are no such slots
+        """
+        free = None
+        for n in range(min(_SHARED_MEMORY_BACKEND_PROBES, self._size)):
+            i = (fingerprint + n) % self._size
+            slot_key = self._keys[i]
+            if slot_key == fingerprint:
+                return i
+            if slot_key == 0:
+                # slots are never emptied, so key can't be found further
+                return i if free is None else free
+            if free is None and self._buckets[i * 3 + 2] <= now:
+                free = i
+        return free
+
+    def consume(self, key: str, limit: RateLimit) -> bool:
+        fingerprint = _fingerprint(key)
+        with self._lock:
+            now = time.monotonic()
+            i = self._find_slot(fingerprint, now)
+            if i is not None:
+                j = i * 3
+                if self._keys[i] == fingerprint:
+                    tokens = _refill(self._buckets[j], self._buckets[j + 1],
+                                     now, limit)
+                else:
+                    self._keys[i] = fingerprint
+                    tokens = limit.burst
+                allowed = tokens >= 1
+                if allowed:
+                    tokens -= 1
+                self._buckets[j] = tokens
+                self._buckets[j + 1] = now
+                self._buckets[j + 2] = now + (limit.burst - tokens) / limit.rate
+        if i is None:
+            return self._fallback.consume(key, limit)
+        return allowed
+
+
+class RateLimiter:
+    """
+    Limits rate of the requests, using token buckets
+
+    .. code-block:: python
+
+        limiter = RateLimiter(
+            default=RateLimit(100, burst=20),
+            methods={
+                '/coffee.CoffeeMachine/MakeLatte': RateLimit(10),
+                '/grpc.health.v1.Health/Check': None,
+            },
+            metadata_keys=['x-tenant'],
+        )
+        server = Server(handlers, loop=loop, rate_limiter=limiter)
+
+    Every method has its own bucket, if ``metadata_keys`` are specified,
+    or ``by_peer`` is ``True``, buckets are also separate for every
+    combination of metadata values and peer address. Requests exceeding the
+    limit are rejected with RESOURCE_EXHAUSTED status, right after their
+    headers were received, before anything is decoded.
+
+    :py:class:`SharedMemoryBackend` can be used to enforce one combined
+    limit in all worker processes on a host, in this case limiter should be
+    created before worker processes are started.
+    """
+
+    def __init__(self, *, default: Optional[RateLimit] = None,
+                 methods: Optional[Dict[str, Optional[RateLimit]]] = None,
+                 metadata_keys: Sequence[str] = (),
+                 by_peer: bool = False, backend=None) -> None:
+        """
+        :param default: limit of the methods, which are not listed in the
+            ``methods`` mapping, ``None`` means no limit
+        :param methods: limits of the methods, keys are method paths
+            (``/package.Service/Method``), ``None`` value means no limit
+        :param metadata_keys: metadata keys, which identify the caller
+        :param by_peer: if ``True``, every peer address has it's own limits
+        :param backend: storage of the token buckets,
+            :py:class:`LocalBackend` by default
+        """
+        self._default = default
+        self._methods = dict(methods or {})
+        self._metadata_keys = frozenset(metadata_keys)
+        self.by_peer = by_peer
+        self._backend = backend if backend is not None else LocalBackend()
+
+    def check(self, headers, peer=None) -> Optional[Tuple[Status, str]]:
+        """Returns ``None`` if request is allowed, otherwise returns status
+        and message for the rejection response
+        """
+        path = None
+        key = []  # type: List[str]
+        for name, value in headers:
+            if name == ':path':
+                path = value
+            elif name in self._metadata_keys:
+                key.append('{}={}'.format(name, value))
+        limit = self._methods.get(path, self._default)
+        if limit is None:
+            return None
+        key.sort()
+        key.insert(0, str(path))
+        if self.by_peer:
+            key.append('peer={}'.format(peer))
+        if not self._backend.consume('\n'.join(key), limit):
+            return Status.RESOURCE_EXHAUSTED, 'Rate limit exceeded'
+        return None
@@ -0,0 +1,390 @@
+import abc
+import random
+import asyncio
+import logging
+import itertools
+
+from typing import List, Tuple, Optional  # noqa
+from weakref import WeakKeyDictionary
+
+from .const import Status
+from .client import Channel, Stream, _load
+from .exceptions import GRPCError
+
+
+log = logging.getLogger(__name__)
+
+DEFAULT_RESOLVE_INTERVAL = 30
+
+_RETRY_DELAY = 1.
+_MAX_RETRY_DELAY = 60.
+
+
+class Subchannel:
+    """
+    Connection to one of the endpoints of the
+    :py:class:`BalancedChannel`, this object is used by the policies to
+    pick an endpoint for the request
+    """
+    _retry_at = None
+    _retry_delay = _RETRY_DELAY
+
+    def __init__(self, endpoint: Tuple[str, int], channel: Channel,
+                 *, loop) -> None:
+        #: ``(host, port)`` tuple
+        self.endpoint = endpoint
+        self.channel = channel
+        self._loop = loop
+
+    def __repr__(self):
+        return 'Subchannel({!r})'.format(self.endpoint)
+
+    @property
+    def in_flight(self) -> int:
+        """Number of active and queued requests"""
+        return sum(map(_load, self.channel._protocols))
+
+    @property
+    def available(self) -> bool:
+        """``False`` if connection to the endpoint recently failed"""
+        return self._retry_at is None or self._loop.time() >= self._retry_at
+
+    async def __connect__(self):
+        try:
+            protocol = await self.channel.__connect__()
+        except OSError:
+            # taking subchannel out of rotation for some time
+            self._retry_at = self._loop.time() + self._retry_delay
+            self._retry_delay = min(self._retry_delay * 2, _MAX_RETRY_DELAY)
+            raise
+        else:
+            self._retry_at = None
+            self._retry_delay = _RETRY_DELAY
+            return protocol
+
+
+class PolicyBase(abc.ABC):
+    """
+    Base class for the policies, which are used by the
+    :py:class:`BalancedChannel` to pick an endpoint for every request
+    """
+
+    @abc.abstractmethod
+    def pick(self, subchannels: List[Subchannel]) -> Subchannel:
+        """Returns one of the given subchannels
+
+        :param subchannels: non-empty list of subchannels
+        """
+        pass
+
+    def observe(self, subchannel: Subchannel, latency: float):
+        """Called when request was finished
+
+        :param subchannel: subchannel, which was used for the request
+        :param latency: duration of the request (seconds)
+        """
+        pass
+
+
+class RoundRobin(PolicyBase):
+    """Picks subchannels in turn"""
+
+    def __init__(self):
+        self._counter = itertools.count()
+
+    def pick(self, subchannels):
+        return subchannels[next(self._counter) % len(subchannels)]
+
+
+class PowerOfTwoChoices(PolicyBase):
+    """Picks two random subchannels and uses the one with less in-flight
+    requests
+    """
+
+    def pick(self, subchannels):
+        if len(subchannels) == 1:
+            return subchannels[0]
+        first, second = random.sample(subchannels, 2)
+        if second.in_flight < first.in_flight:
+            return second
+        else:
+            return first
+
+
+class EWMA(PolicyBase):
+    """Picks subchannel with the lowest exponentially weighted moving average
+    of the request latency, multiplied by the number of in-flight requests
+
+    Subchannels without observed requests are picked first.
+    """
+
+    def __init__(self, *, alpha=0.3):
+        """
+        :param alpha: weight of the latest observation, between 0 and 1
+        """
+        if not 0 < alpha <= 1:
+            raise ValueError('Invalid alpha: {!r}'.format(alpha))
+        self._alpha = alpha
+        self._latency = WeakKeyDictionary()
+
+    def _cost(self, subchannel):
+        latency = self._latency.get(subchannel, 0.)
+        return latency * (subchannel.in_flight + 1)
+
+    def pick(self, subchannels):
+        return min(subchannels, key=self._cost)
+
+    def observe(self, subchannel, latency):
+        previous = self._latency.get(subchannel)
+        if previous is None:
+            self._latency[subchannel] = latency
+        else:
+            self._latency[subchannel] = (self._alpha * latency
+                                         + (1 - self._alpha) * previous)
+
+
+class _Stream(Stream):
+    _subchannel = None
+    _started_at = None
+
+    def __init__(self, channel, *args, **kwargs):
+        super().__init__(channel, *args, **kwargs)
+        self._balanced_channel = channel
+
+    async def send_request(self):
+        if not self._send_request_done:
+            with self._wrapper:
+                self._subchannel = await self._balanced_channel._pick()
+            self._channel = self._subchannel
+            self._started_at = self._balanced_channel._loop.time()
+        await super().send_request()
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        try:
+            await super().__aexit__(exc_type, exc_val, exc_tb)
+        finally:
+            if self._send_request_done:
+                self._balanced_channel._observe(self._subchannel,
+                                                self._started_at)
+
+
+class BalancedChannel(Channel):
+    """
+    Spreads requests across multiple endpoints of the service, can be
+    used with generated stub classes in place of the
+    :py:class:`~grpclib.client.Channel`.
+
+    .. code-block:: python
+
+        channel = BalancedChannel([('10.0.0.1', 50051),
+                                   ('10.0.0.2', 50051)],
+                                  loop=loop, policy=PowerOfTwoChoices())
+        client = cafe_grpc.CoffeeMachineStub(channel)
+
+    Every endpoint has it's own connection (or a pool of connections, see
+    :py:class:`~grpclib.config.Configuration`). Endpoints, which failed to
+    connect, are taken out of rotation for some time.
+    """
+    _stream_type = _Stream
+
+    def __init__(self, endpoints=None, *, loop, resolver=None, policy=None,
+                 authority=None, codec=None, ssl=None, config=None,
+                 resolve_interval=DEFAULT_RESOLVE_INTERVAL, compression=None):
+        """
+        :param endpoints: list of ``(host, port)`` tuples
+
+        :param resolver: callable object which returns awaitable object,
+            where result is a list of ``(host, port)`` tuples, it is called
+            to get endpoints initially, periodically in the background, and
+            after connection failures. If specified, ``endpoints`` should be
+            omitted (must be None).
+
+        :param policy: :py:class:`PolicyBase` implementation, which is used
+            to pick an endpoint for every request,
+            :py:class:`PowerOfTwoChoices` by default
+
+        :param authority: value of the ``:authority`` pseudo-header, by
+            default it is derived from the first of the ``endpoints``,
+            required if ``resolver`` is used
+
+        :param ssl: ``True`` or :py:class:`~python:ssl.SSLContext` object; if
+            ``True``, default SSL context is used.
+
+        :param config: :py:class:`~grpclib.config.Configuration` object to
+            tune connection options
+
+        :param resolve_interval: how often endpoints are resolved again
+            (seconds)
+
+        :param compression: name of the encoding to compress requests
+        """
+        if (endpoints is None) == (resolver is None):
+            raise ValueError("Either 'endpoints' or 'resolver' parameter "
+                             "should be specified.")
+        if authority is None:
+            if resolver is not None:
+                raise ValueError("The 'authority' parameter is required when "
+                                 "'resolver' parameter is used.")
+            elif not endpoints:
+                raise ValueError("The 'endpoints' parameter can not be "
+                                 "empty.")
+            authority = '{}:{}'.format(*endpoints[0])
+
+        super().__init__(loop=loop, codec=codec, ssl=ssl, config=config,
+                         compression=compression)
+        self._authority = authority
+        self._endpoints_resolver = resolver
+        self._resolve_interval = resolve_interval
+        self._policy = policy or PowerOfTwoChoices()
+
+        self._subchannels = []  # type: List[Subchannel]
+        self._removed = []  # type: List[Subchannel]
+        self._resolve_lock = asyncio.Lock(loop=loop)
+        self._resolve_task = None  # type: Optional[asyncio.Task]
+        self._resolve_at = None  # type: Optional[float]
+        if endpoints is not None:
+            self._update(endpoints)
+        elif self._config.channel_eager_connect:
+            self._resolve_task = self._loop.create_task(
+                self._resolve_in_background()
+            )
+
+    def __repr__(self):
+        return ('BalancedChannel({!r}, ...)'
+                .format([s.endpoint for s in self._subchannels]))
+
+    def _update(self, endpoints):
+        current = {s.endpoint: s for s in self._subchannels}
+        subchannels = []
+        for endpoint in endpoints:
+            endpoint = tuple(endpoint)
+            subchannel = current.pop(endpoint, None)
+            if subchannel is None:
+                host, port = endpoint
+                subchannel = Subchannel(
+                    endpoint,
+                    Channel(host, port, loop=self._loop, codec=self._codec,
+                            ssl=self._ssl, config=self._config,
+                            resolver=self._resolver),
+                    loop=self._loop,
+                )
+            subchannels.append(subchannel)
+        self._subchannels = subchannels
+        # removed subchannels are closed, when all their requests are done
+        self._removed.extend(current.values())
+
+    def _close_removed(self):
+        removed = []
+        for subchannel in self._removed:
+            if subchannel.in_flight:
+                removed.append(subchannel)
+            else:
+                subchannel.channel.close()
+        self._removed = removed
+
+    async def _resolve(self):
+        try:
+            self._update(await self._endpoints_resolver())
+        finally:
+            self._resolve_at = self._loop.time() + self._resolve_interval
+
+    async def _ensure_resolved(self):
+        if self._resolve_at is None:
+            async with self._resolve_lock:
+                if self._resolve_at is None:
+                    await self._resolve()
+
+    async def _resolve_in_background(self):
+        try:
+            if self._resolve_at is None:
+                await self._ensure_resolved()
+            else:
+                await self._resolve()
+        except Exception:
+            log.warning('Failed to resolve endpoints', exc_info=True)
+        finally:
+            self._resolve_task = None
+
+    async def _pick(self):
+        if self._endpoints_resolver is not None:
+            if self._resolve_at is None:
+                await self._ensure_resolved()
+            elif (
+                self._resolve_task is None
+                and self._loop.time() >= self._resolve_at
+            ):
+                self._resolve_task = self._loop.create_task(
+                    self._resolve_in_background()
+                )
+        if self._removed:
+            self._close_removed()
+
+        subchannels = [s for s in self._subchannels if s.available]
+        if not subchannels:
+            # all endpoints failed recently, trying all of them and
+            # resolving endpoints again
+            subchannels = self._subchannels
+            self._resolve_at = min(self._resolve_at or 0, self._loop.time())
+        if not subchannels:
+            if self._endpoints_resolver is not None:
+                self._resolve_at = None
+            raise GRPCError(Status.UNAVAILABLE, 'No endpoints available')
+        return self._policy.pick(subchannels)
+
+    def _connect_eagerly(self):
+        # every subchannel connects eagerly on it's own
+        pass
+
+    async def ready(self):
+        """Coroutine to wait until channel is connected to any of the
+        endpoints.
+
+        See :py:meth:`Channel.ready() <grpclib.client.Channel.ready>`.
+        """
+        if self._endpoints_resolver is not None:
+            await self._ensure_resolved()
+        pending = {self._loop.create_task(s.channel.ready())
+                   for s in self._subchannels}
+        if not pending:
+            raise GRPCError(Status.UNAVAILABLE, 'No endpoints available')
+        try:
+            error = None
+            while pending:
+                done, pending = await asyncio.wait(
+                    pending, loop=self._loop,
+                    return_when=asyncio.FIRST_COMPLETED,
+                )
+                for task in done:
+                    if task.exception() is None:
+                        return
+                    error = task.exception()
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    def _observe(self, subchannel, started_at):
+        self._policy.observe(subchannel, self._loop.time() - started_at)
+
+    @property
+    def _connected(self):
+        return any(s.channel._connected for s in self._subchannels)
+
+    async def __connect__(self):
+        subchannel = await self._pick()
+        return await subchannel.__connect__()
+
+    @property
+    def queued_requests(self) -> int:
+        return sum(s.channel.queued_requests
+                   for s in self._subchannels + self._removed)
+
+    def close(self):
+        """Closes connections to all endpoints.
+        """
+        if self._resolve_task is not None:
+            self._resolve_task.cancel()
+        subchannels = self._subchannels + self._removed
+        self._subchannels, self._removed = [], []
+        for subchannel in subchannels:
+            subchannel.channel.close()
@@ -1,6 +1,11 @@
 import http
 import asyncio
+import random
+import logging
 import warnings
+import itertools
+
+from typing import List, Optional, FrozenSet, Set  # noqa
 
 try:
     import ssl
@@ -11,7 +16,9 @@ from h2.config import H2Configuration
 
 from .utils import Wrapper, DeadlineWrapper
 from .const import Status
-from .stream import send_message, recv_message
+from .config import Configuration
+from .resolver import CachingResolver
+from .stream import send_message, recv_message, CodecExecutor
 from .stream import StreamIterator
 from .protocol import H2Protocol, AbstractHandler
 from .metadata import Request, Deadline, USER_AGENT, decode_grpc_message
@@ -19,10 +26,16 @@ from .metadata import encode_metadata, decode_metadata
 from .exceptions import GRPCError, ProtocolError, StreamTerminatedError
 from .encoding.base import GRPC_CONTENT_TYPE
 from .encoding.proto import ProtoCodec
+from . import compression as compression_registry
+
 
+log = logging.getLogger(__name__)
 
 _H2_OK = '200'
 
+_RECONNECT_MULTIPLIER = 1.6
+_RECONNECT_JITTER = 0.2
+
 # https://github.com/grpc/grpc/blob/master/doc/http-grpc-status-mapping.md
 _H2_TO_GRPC_STATUS_MAP = {
     # 400
@@ -51,8 +64,19 @@ async def _to_list(stream):
     return result
 
 
+def _load(protocol):
+    """Number of active and queued streams of the connection"""
+    return (len(protocol.processor.streams)
+            + protocol.connection.streams_limit.queued)
+
+
 class Handler(AbstractHandler):
     connection_lost = False
+    #: encodings, supported by the server, ``None`` if unknown
+    accept_encoding = None  # type: Optional[FrozenSet[str]]
+
+    def __init__(self, *, on_close=None):
+        self._on_close = on_close
 
     def accept(self, stream, headers, release_stream):
         raise NotImplementedError('Client connection can not accept requests')
@@ -62,6 +86,8 @@ class Handler(AbstractHandler):
 
     def close(self):
         self.connection_lost = True
+        if self._on_close is not None:
+            self._on_close()
 
 
 class Stream(StreamIterator):
@@ -109,10 +135,22 @@ class Stream(StreamIterator):
     #: after :py:meth:`recv_trailing_metadata` coroutine succeeds.
     trailing_metadata = None
 
-    def __init__(self, channel, request, codec, send_type, recv_type):
+    _handler = None
+    _compressor = None
+    _recv_compressor = None
+
+    def __init__(self, channel, request, codec, send_type, recv_type,
+                 *, codec_executor=None, compression=None,
+                 compression_min_size=0, max_receive_message_size=None,
+                 max_send_message_size=None):
         self._channel = channel
         self._request = request
         self._codec = codec
+        self._codec_executor = codec_executor
+        self._compression = compression
+        self._compression_min_size = compression_min_size
+        self._max_receive_message_size = max_receive_message_size
+        self._max_send_message_size = max_send_message_size
         self._send_type = send_type
         self._recv_type = recv_type
 
@@ -130,10 +168,23 @@ class Stream(StreamIterator):
 
         with self._wrapper:
             protocol = await self._channel.__connect__()
+            request = self._request
+            accept_encoding = protocol.handler.accept_encoding
+            if (
+                self._compression is not None
+                and self._compression != compression_registry.IDENTITY
+                and (accept_encoding is None
+                     or self._compression in accept_encoding)
+            ):
+                # server's supported encodings are unknown until the first
+                # response, and requests are compressed optimistically
+                self._compressor = compression_registry.get(self._compression)
+                request = request._replace(message_encoding=self._compression)
+            self._handler = protocol.handler
             stream = protocol.processor.connection\
                 .create_stream(wrapper=self._wrapper)
             release_stream = await stream.send_request(
-                self._request.to_headers(), _processor=protocol.processor,
+                request.to_headers(), _processor=protocol.processor,
             )
             self._stream = stream
             self._release_stream = release_stream
@@ -167,7 +218,13 @@ class Stream(StreamIterator):
 
         with self._wrapper:
             await send_message(self._stream, self._codec, message,
-                               self._send_type, end=end)
+                               self._send_type, end=end,
+                               codec_executor=self._codec_executor,
+                               compressor=self._compressor,
+                               compression_min_size=(
+                                   self._compression_min_size
+                               ),
+                               max_size=self._max_send_message_size)
             self._send_message_count += 1
             if end:
                 self._end_done = True
@@ -188,6 +245,12 @@ class Stream(StreamIterator):
         await self._stream.end()
         self._end_done = True
 
+    def _update_accept_encoding(self, headers_map):
+        accept_encoding = headers_map.get('grpc-accept-encoding')
+        if accept_encoding is not None:
+            self._handler.accept_encoding = \
+                compression_registry.parse_accept_encoding(accept_encoding)
+
     def _raise_for_status(self, headers_map):
         status = headers_map[':status']
         if status is not None and status != _H2_OK:
@@ -244,6 +307,7 @@ class Stream(StreamIterator):
                 self.initial_metadata = decode_metadata(headers)
 
                 headers_map = dict(headers)
+                self._update_accept_encoding(headers_map)
                 self._raise_for_status(headers_map)
                 self._raise_for_grpc_status(headers_map, optional=True)
 
@@ -261,6 +325,18 @@ class Stream(StreamIterator):
                     raise GRPCError(Status.UNKNOWN,
                                     'Invalid content-type: {!r}'
                                     .format(content_type))
+
+                message_encoding = headers_map.get('grpc-encoding')
+                if (
+                    message_encoding is not None
+                    and message_encoding != compression_registry.IDENTITY
+                ):
+                    self._recv_compressor = \
+                        compression_registry.get(message_encoding)
+                    if self._recv_compressor is None:
+                        raise GRPCError(Status.INTERNAL,
+                                        'Unsupported grpc-encoding: {!r}'
+                                        .format(message_encoding))
         except StreamTerminatedError:
             # Server can send RST_STREAM frame right after sending trailers-only
             # response, so we have to check received headers and probably raise
@@ -270,6 +346,7 @@ class Stream(StreamIterator):
                 raise
             else:
                 headers_map = dict(headers)
+                self._update_accept_encoding(headers_map)
                 self._raise_for_status(headers_map)
                 self._raise_for_grpc_status(headers_map, optional=True)
                 # If there are no errors in the headers, just reraise original
@@ -307,7 +384,12 @@ class Stream(StreamIterator):
 
         with self._wrapper:
             message = await recv_message(self._stream, self._codec,
-                                         self._recv_type)
+                                         self._recv_type,
+                                         codec_executor=self._codec_executor,
+                                         compressor=self._recv_compressor,
+                                         max_size=(
+                                             self._max_receive_message_size
+                                         ))
             self._recv_message_count += 1
             return message
 
@@ -407,10 +489,12 @@ class Channel:
 
         channel.close()
     """
-    _protocol = None
+    _protocols = ()
+    _draining = frozenset()  # type: Set[H2Protocol]
+    _stream_type = Stream
 
     def __init__(self, host=None, port=None, *, loop,  path=None, codec=None,
-                 ssl=None):
+                 ssl=None, config=None, resolver=None, compression=None):
         """Initialize connection to the server
 
         :param host: server host name.
@@ -422,6 +506,20 @@ class Channel:
 
         :param ssl: ``True`` or :py:class:`~python:ssl.SSLContext` object; if
             ``True``, default SSL context is used.
+
+        :param config: :py:class:`~grpclib.config.Configuration` object to
+            tune connection options
+
+        :param resolver: :py:class:`~grpclib.resolver.ResolverBase` object to
+            resolve server host name, by default results of the
+            :py:class:`~grpclib.resolver.DNSResolver` are cached using
+            :py:class:`~grpclib.resolver.CachingResolver`. Host name is
+            resolved only when new connection is created, new connections
+            are spread across all the resolved addresses.
+
+        :param compression: name of the encoding to compress requests (e.g.
+            ``'gzip'``), it can be changed for every call, see
+            :py:mod:`grpclib.compression`
         """
         if path is not None and (host is not None or port is not None):
             raise ValueError("The 'path' parameter can not be used with the "
@@ -439,9 +537,19 @@ class Channel:
         self._path = path
 
         self._codec = codec or ProtoCodec()
-
-        self._config = H2Configuration(client_side=True,
-                                       header_encoding='ascii')
+        compression_registry.validate(compression)
+        self._compression = compression
+        self._resolver = resolver or CachingResolver(loop=loop)
+        self._address_counter = itertools.count()
+
+        self._config = config or Configuration()
+        self._codec_executor = None
+        if self._config.codec_executor_threshold is not None:
+            self._codec_executor = CodecExecutor(
+                self._config.codec_executor_threshold, loop=loop,
+            )
+        self._h2_config = H2Configuration(client_side=True,
+                                          header_encoding='ascii')
         self._authority = '{}:{}'.format(self._host, self._port)
 
         if ssl is True:
@@ -450,35 +558,161 @@ class Channel:
         self._ssl = ssl or None
         self._scheme = 'https' if self._ssl else 'http'
         self._connect_lock = asyncio.Lock(loop=self._loop)
+        self._protocols = []  # type: List[H2Protocol]
+        # connections, which received GOAWAY frame, and are still finishing
+        # their streams
+        self._draining = set()  # type: Set[H2Protocol]
+
+        self._connected_event = asyncio.Event(loop=self._loop)
+        self._connection_lost_event = asyncio.Event(loop=self._loop)
+        self._reconnect_task = None  # type: Optional[asyncio.Task]
+        if self._config.channel_eager_connect:
+            self._connect_eagerly()
 
     def __repr__(self):
         return ('Channel({!r}, {!r}, ..., path={!r})'
                 .format(self._host, self._port, self._path))
 
     def _protocol_factory(self):
-        return H2Protocol(Handler(), self._config, loop=self._loop)
+        return H2Protocol(Handler(on_close=self._on_connection_lost),
+                          self._h2_config, loop=self._loop,
+                          config=self._config)
+
+    def _on_connection_lost(self):
+        self._live_protocols()
+        self._connection_lost_event.set()
+        if not self._connected:
+            self._connected_event.clear()
+
+    def _add_protocol(self, protocol):
+        self._protocols.append(protocol)
+        self._connected_event.set()
+
+    def _connect_eagerly(self):
+        self._reconnect_task = self._loop.create_task(self._reconnect())
+
+    async def _reconnect(self):
+        pool_size = self._config.channel_pool_size
+        min_delay = self._config.channel_reconnect_min_delay
+        delay = min_delay
+        while True:
+            self._connection_lost_event.clear()
+            try:
+                async with self._connect_lock:
+                    while len(self._live_protocols()) < pool_size:
+                        self._add_protocol(await self._create_connection())
+            except asyncio.CancelledError:
+                raise
+            except Exception as exc:
+                log.debug('Failed to connect to %r: %r', self, exc)
+                jitter = random.uniform(1 - _RECONNECT_JITTER,
+                                        1 + _RECONNECT_JITTER)
+                await asyncio.sleep(delay * jitter, loop=self._loop)
+                delay = min(delay * _RECONNECT_MULTIPLIER,
+                            self._config.channel_reconnect_max_delay)
+            else:
+                delay = min_delay
+                await self._connection_lost_event.wait()
+
+    async def ready(self):
+        """Coroutine to wait until channel is connected to the server.
+
+        When ``channel_eager_connect`` option is enabled (see
+        :py:class:`~grpclib.config.Configuration`), this coroutine waits
+        for the connection, which is established in the background,
+        otherwise it connects to the server and may raise
+        :py:class:`OSError`.
+        """
+        if self._reconnect_task is not None:
+            await self._connected_event.wait()
+        else:
+            await self.__connect__()
 
     async def _create_connection(self):
         if self._path is not None:
             _, protocol = await self._loop.create_unix_connection(
                 self._protocol_factory, self._path, ssl=self._ssl)
         else:
-            _, protocol = await self._loop.create_connection(
-                self._protocol_factory, self._host, self._port,
-                ssl=self._ssl)
+            addresses = await self._resolver.resolve(self._host, self._port)
+            if not addresses:
+                raise OSError('No addresses resolved for {}:{}'
+                              .format(self._host, self._port))
+            offset = next(self._address_counter)
+            kwargs = {'server_hostname': self._host} if self._ssl else {}
+            for i in range(len(addresses)):
+                host, port = addresses[(offset + i) % len(addresses)]
+                try:
+                    _, protocol = await self._loop.create_connection(
+                        self._protocol_factory, host, port,
+                        ssl=self._ssl, **kwargs)
+                except OSError:
+                    if i == len(addresses) - 1:
+                        raise
+                else:
+                    break
         return protocol
 
+    def _live_protocols(self):
+        live = []
+        for protocol in self._protocols:
+            if not protocol.handler.connection_lost:
+                live.append(protocol)
+            elif not protocol.connection.closed:
+                self._draining.add(protocol)
+        self._protocols = live
+        self._draining = {protocol for protocol in self._draining
+                          if not protocol.connection.closed}
+        return self._protocols
+
     @property
     def _connected(self):
-        return (self._protocol is not None
-                and not self._protocol.handler.connection_lost)
+        return bool(self._live_protocols())
+
+    def _pick_protocol(self):
+        """Returns least-loaded connection, or ``None`` if new connection
+        should be opened
+        """
+        protocols = self._live_protocols()
+        if len(protocols) < self._config.channel_pool_size:
+            return None
+        protocol = min(protocols, key=_load)
+        max_size = self._config.channel_pool_max_size
+        if max_size is not None and len(protocols) < max_size:
+            streams_limit = protocol.connection.streams_limit
+            if streams_limit.available() <= streams_limit.queued:
+                return None
+        return protocol
 
     async def __connect__(self):
-        if not self._connected:
+        protocol = self._pick_protocol()
+        if protocol is None:
             async with self._connect_lock:
-                if not self._connected:
-                    self._protocol = await self._create_connection()
-        return self._protocol
+                protocol = self._pick_protocol()
+                if protocol is None:
+                    protocol = await self._create_connection()
+                    self._add_protocol(protocol)
+        return protocol
+
+    @property
+    def queued_requests(self) -> int:
+        """Number of requests, waiting for a free stream slot, when
+        concurrent streams limit, advertised by the server, is reached
+        """
+        return sum(protocol.connection.streams_limit.queued
+                   for protocol in self._protocols)
+
+    @property
+    def rtt(self) -> Optional[float]:
+        """Largest round-trip time (seconds), measured using keepalive PING
+        frames among the live connections, or ``None`` if it wasn't measured
+        yet, see ``keepalive_time`` in
+        :py:class:`~grpclib.config.Configuration`
+        """
+        measured = [protocol.connection.keepalive.rtt
+                    for protocol in self._live_protocols()
+                    if protocol.connection.keepalive is not None
+                    and protocol.connection.keepalive.rtt is not None]
+        return max(measured) if measured else None
 
     # https://python-hyper.org/projects/h2/en/stable/negotiating-http2.html
     def _get_default_ssl_context(self):
@@ -501,7 +735,7 @@ class Channel:
         return GRPC_CONTENT_TYPE + '+' + self._codec.__content_subtype__
 
     def request(self, name, request_type, reply_type, *, timeout=None,
-                deadline=None, metadata=None):
+                deadline=None, metadata=None, compression=None):
         if timeout is not None and deadline is None:
             deadline = Deadline.from_timeout(timeout)
         elif timeout is not None and deadline is not None:
@@ -512,28 +746,45 @@ class Channel:
         if metadata is not None:
             metadata = encode_metadata(metadata)
 
+        if compression is None:
+            compression = self._compression
+        else:
+            compression_registry.validate(compression)
+
         request = Request(
             method='POST',
             scheme=self._scheme,
             path=name,
             authority=self._authority,
             content_type=self._content_type,
+            message_accept_encoding=compression_registry.accept_encoding(),
             user_agent=USER_AGENT,
             metadata=metadata,
             deadline=deadline,
         )
 
-        return Stream(self, request, self._codec, request_type, reply_type)
+        return self._stream_type(
+            self, request, self._codec, request_type, reply_type,
+            codec_executor=self._codec_executor, compression=compression,
+            compression_min_size=self._config.compression_min_size,
+            max_receive_message_size=self._config.max_receive_message_size,
+            max_send_message_size=self._config.max_send_message_size,
+        )
 
     def close(self):
-        """Closes connection to the server.
+        """Closes connections to the server.
         """
-        if self._protocol is not None:
-            self._protocol.processor.close()
-            del self._protocol
+        if self._reconnect_task is not None:
+            self._reconnect_task.cancel()
+            self._reconnect_task = None
+        self._connected_event.clear()
+        protocols, self._protocols = self._protocols, []
+        draining, self._draining = self._draining, set()
+        for protocol in protocols + list(draining):
+            protocol.processor.close()
 
     def __del__(self):
-        if self._protocol is not None:
+        if self._protocols or self._draining:
             message = 'Unclosed connection: {!r}'.format(self)
             warnings.warn(message, ResourceWarning)
             if self._loop.is_closed():
@@ -553,7 +804,8 @@ class ServiceMethod:
         self.request_type = request_type
         self.reply_type = reply_type
 
-    def open(self, *, timeout=None, metadata=None) -> Stream:
+    def open(self, *, timeout=None, metadata=None,
+             compression=None) -> Stream:
         """Creates and returns :py:class:`Stream` object to perform request
         to the server.
 
@@ -564,11 +816,15 @@ class ServiceMethod:
 
         :param float timeout: request timeout (seconds)
         :param metadata: custom request metadata, dict or list of pairs
+        :param compression: name of the encoding to compress request
+            messages, overrides channel's setting, ``'identity'`` disables
+            compression
         :return: :py:class:`Stream` object
         """
         return self.channel.request(self.name, self.request_type,
                                     self.reply_type, timeout=timeout,
-                                    metadata=metadata)
+                                    metadata=metadata,
+                                    compression=compression)
 
 
 class UnaryUnaryMethod(ServiceMethod):
@@ -579,15 +835,19 @@ class UnaryUnaryMethod(ServiceMethod):
     .. autocomethod:: open
         :async-with:
     """
-    async def __call__(self, message, *, timeout=None, metadata=None):
+    async def __call__(self, message, *, timeout=None, metadata=None,
+                       compression=None):
         """Coroutine to perform defined call.
 
         :param message: message
         :param float timeout: request timeout (seconds)
         :param metadata: custom request metadata, dict or list of pairs
+        :param compression: name of the encoding to compress request
+            messages
         :return: message
         """
-        async with self.open(timeout=timeout, metadata=metadata) as stream:
+        async with self.open(timeout=timeout, metadata=metadata,
+                             compression=compression) as stream:
             await stream.send_message(message, end=True)
             return await stream.recv_message()
 
@@ -600,15 +860,19 @@ class UnaryStreamMethod(ServiceMethod):
     .. autocomethod:: open
         :async-with:
     """
-    async def __call__(self, message, *, timeout=None, metadata=None):
+    async def __call__(self, message, *, timeout=None, metadata=None,
+                       compression=None):
         """Coroutine to perform defined call.
 
         :param message: message
         :param float timeout: request timeout (seconds)
         :param metadata: custom request metadata, dict or list of pairs
+        :param compression: name of the encoding to compress request
+            messages
         :return: sequence of messages
         """
-        async with self.open(timeout=timeout, metadata=metadata) as stream:
+        async with self.open(timeout=timeout, metadata=metadata,
+                             compression=compression) as stream:
             await stream.send_message(message, end=True)
             return await _to_list(stream)
 
@@ -621,15 +885,19 @@ class StreamUnaryMethod(ServiceMethod):
     .. autocomethod:: open
         :async-with:
     """
-    async def __call__(self, messages, *, timeout=None, metadata=None):
+    async def __call__(self, messages, *, timeout=None, metadata=None,
+                       compression=None):
         """Coroutine to perform defined call.
 
         :param messages: sequence of messages
         :param float timeout: request timeout (seconds)
         :param metadata: custom request metadata, dict or list of pairs
+        :param compression: name of the encoding to compress request
+            messages
         :return: message
         """
-        async with self.open(timeout=timeout, metadata=metadata) as stream:
+        async with self.open(timeout=timeout, metadata=metadata,
+                             compression=compression) as stream:
             for message in messages[:-1]:
                 await stream.send_message(message)
             if messages:
@@ -647,15 +915,19 @@ class StreamStreamMethod(ServiceMethod):
     .. autocomethod:: open
         :async-with:
     """
-    async def __call__(self, messages, *, timeout=None, metadata=None):
+    async def __call__(self, messages, *, timeout=None, metadata=None,
+                       compression=None):
         """Coroutine to perform defined call.
 
         :param messages: sequence of messages
         :param float timeout: request timeout (seconds)
         :param metadata: custom request metadata, dict or list of pairs
+        :param compression: name of the encoding to compress request
+            messages
         :return: sequence of messages
         """
-        async with self.open(timeout=timeout, metadata=metadata) as stream:
+        async with self.open(timeout=timeout, metadata=metadata,
+                             compression=compression) as stream:
             for message in messages[:-1]:
                 await stream.send_message(message)
             if messages:
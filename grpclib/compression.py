@@ -0,0 +1,125 @@
+import abc
+import gzip
+import zlib
+
+from typing import Dict, Optional  # noqa
+
+
+IDENTITY = 'identity'
+
+
+class CompressorBase(abc.ABC):
+    """
+    Base class for message compressors, which are used when
+    ``grpc-encoding`` is negotiated between client and server
+
+    .. code-block:: python
+
+        class SnappyCompressor(CompressorBase):
+            __encoding__ = 'snappy'
+
+            def compress(self, data):
+                return snappy.compress(data)
+
+            def decompress(self, data, max_length=None):
+                return snappy.uncompress(data)
+
+        register(SnappyCompressor())
+    """
+
+    @property
+    @abc.abstractmethod
+    def __encoding__(self):
+        """Name of the encoding, sent in the ``grpc-encoding`` header"""
+        pass
+
+    @abc.abstractmethod
+    def compress(self, data: bytes) -> bytes:
+        pass
+
+    @abc.abstractmethod
+    def decompress(self, data: bytes,
+                   max_length: Optional[int] = None) -> bytes:
+        """Decompresses data
+
+        If ``max_length`` is specified and decompressed data is larger, it is
+        allowed to stop decompression early and return any data, which is
+        larger than ``max_length``, so huge messages wouldn't be decompressed
+        into memory only to be rejected
+        """
+        pass
+
+
+def _decompress(data, wbits, max_length):
+    decompressor = zlib.decompressobj(wbits)
+    if max_length is None:
+        result = decompressor.decompress(data)
+    else:
+        result = decompressor.decompress(data, max_length + 1)
+        if len(result) > max_length:
+            return result
+    if not decompressor.eof:
+        raise zlib.error('Incomplete or truncated stream')
+    return result
+
+
+class GzipCompressor(CompressorBase):
+    __encoding__ = 'gzip'
+
+    def __init__(self, *, level=6):
+        self._level = level
+
+    def compress(self, data):
+        return gzip.compress(data, compresslevel=self._level)
+
+    def decompress(self, data, max_length=None):
+        return _decompress(data, 16 + zlib.MAX_WBITS, max_length)
+
+
+class DeflateCompressor(CompressorBase):
+    __encoding__ = 'deflate'
+
+    def __init__(self, *, level=6):
+        self._level = level
+
+    def compress(self, data):
+        return zlib.compress(data, self._level)
+
+    def decompress(self, data, max_length=None):
+        return _decompress(data, zlib.MAX_WBITS, max_length)
+
+
+_registry = {}  # type: Dict[str, CompressorBase]
+
+
+def register(compressor: CompressorBase):
+    """Registers compressor, so it can be used by clients and servers
+
+    Compressor, registered with the same encoding name, is replaced.
+    """
+    _registry[compressor.__encoding__] = compressor
+
+
+def get(encoding: str) -> Optional[CompressorBase]:
+    """Returns registered compressor for the encoding or ``None``"""
+    return _registry.get(encoding)
+
+
+def validate(encoding: Optional[str]):
+    if encoding is not None and encoding != IDENTITY:
+        if encoding not in _registry:
+            raise ValueError('Unsupported compression: {!r}'
+                             .format(encoding))
+
+
+def accept_encoding() -> str:
+    """Returns value of the ``grpc-accept-encoding`` header"""
+    return ','.join([IDENTITY] + sorted(_registry))
+
+
+def parse_accept_encoding(value: str):
+    return frozenset(filter(None, (e.strip() for e in value.split(','))))
+
+
+register(GzipCompressor())
+register(DeflateCompressor())
@@ -0,0 +1,273 @@
+from collections import namedtuple
+
+
+_DEFAULT_WINDOW_SIZE = 2 ** 16 - 1
+_MAX_WINDOW_SIZE = 2 ** 31 - 1
+_MIN_FRAME_SIZE = 2 ** 14
+_MAX_FRAME_SIZE = 2 ** 24 - 1
+
+
+def _validate(name, value, min_value=0, max_value=None):
+    if value is None:
+        return
+    if (
+        not isinstance(value, int)
+        or value < min_value
+        or (max_value is not None and value > max_value)
+    ):
+        raise ValueError('Invalid {}: {!r}'.format(name, value))
+
+
+def _validate_timeout(name, value, required=False):
+    if value is None and not required:
+        return
+    if (
+        not isinstance(value, (int, float))
+        or isinstance(value, bool)
+        or value <= 0
+    ):
+        raise ValueError('Invalid {}: {!r}'.format(name, value))
+
+
+class Configuration(namedtuple('Configuration', [
+    'write_coalescing', 'write_coalescing_limit',
+    'http2_stream_window_size', 'http2_connection_window_size',
+    'http2_max_frame_size', 'http2_header_table_size',
+    'http2_max_header_list_size', 'http2_max_concurrent_streams',
+    'http2_bdp_probe',
+    'http2_bdp_max_window_size', 'http2_window_update_threshold',
+    'channel_pool_size', 'channel_pool_max_size', 'channel_eager_connect',
+    'channel_reconnect_min_delay', 'channel_reconnect_max_delay',
+    'keepalive_time', 'keepalive_timeout', 'keepalive_permit_without_calls',
+    'keepalive_min_recv_interval', 'server_max_connection_age',
+    'server_max_connection_age_grace', 'server_max_connection_idle',
+    'codec_executor_threshold', 'compression_min_size',
+    'max_receive_message_size', 'max_send_message_size',
+])):
+    """Connection-level options, which can be used to tune
+    :py:class:`~grpclib.client.Channel` and :py:class:`~grpclib.server.Server`
+
+    .. code-block:: python
+
+        config = Configuration(write_coalescing=True)
+        channel = Channel(loop=loop, config=config)
+        server = Server(handlers, loop=loop, config=config)
+
+    HTTP/2 settings are sent to the other party right after connection is
+    made. ``None`` value means that default value from the HTTP/2
+    specification will be used.
+
+    :param write_coalescing: if ``True``, outgoing data is written into the
+        transport once per event loop iteration, instead of writing it
+        after every operation on every stream
+
+    :param write_coalescing_limit: when ``write_coalescing`` is enabled,
+        buffered data is written immediately if its size exceeds this limit
+        (in bytes); ``None`` means no limit
+
+    :param http2_stream_window_size: initial flow-control window size for
+        every stream (SETTINGS_INITIAL_WINDOW_SIZE)
+
+    :param http2_connection_window_size: flow-control window size for the
+        whole connection, can only be greater than default 65535 bytes
+
+    :param http2_max_frame_size: largest frame payload size we are willing
+        to receive (SETTINGS_MAX_FRAME_SIZE)
+
+    :param http2_header_table_size: maximum size of the header compression
+        table used to decode header blocks (SETTINGS_HEADER_TABLE_SIZE)
+
+    :param http2_max_header_list_size: maximum size of header list we are
+        willing to accept (SETTINGS_MAX_HEADER_LIST_SIZE)
+
+    :param http2_max_concurrent_streams: maximum number of concurrent
+        streams, which other party is permitted to open
+        (SETTINGS_MAX_CONCURRENT_STREAMS); :py:class:`~grpclib.server.Server`
+        uses it to limit number of concurrent requests per connection,
+        excess streams are refused with REFUSED_STREAM error code
+
+    :param http2_bdp_probe: if ``True``, bandwidth-delay product of the
+        connection is estimated using PING frames, sent along with received
+        DATA frames, and flow-control windows are grown accordingly
+
+    :param http2_bdp_max_window_size: flow-control windows are not grown by
+        BDP estimation beyond this size
+
+    :param http2_window_update_threshold: fraction of the flow-control
+        window, which should be consumed before WINDOW_UPDATE frame is sent,
+        consumed data is acknowledged in batches to reduce control-frame
+        traffic
+
+    :param channel_pool_size: number of connections, which
+        :py:class:`~grpclib.client.Channel` opens to the server, new streams
+        are created using the least-loaded connection
+
+    :param channel_pool_max_size: if greater than ``channel_pool_size``,
+        additional connections are opened on demand, when all the opened
+        connections have reached concurrent streams limit of the server
+
+    :param channel_eager_connect: if ``True``,
+        :py:class:`~grpclib.client.Channel` opens ``channel_pool_size``
+        connections right after it was created, and reconnects in the
+        background when connections are lost, so requests wouldn't wait for
+        connection establishment
+
+    :param channel_reconnect_min_delay: delay before the first reconnect
+        attempt in the background (seconds), it is growing exponentially with
+        every failed attempt and randomized by 20%
+
+    :param channel_reconnect_max_delay: maximum delay between reconnect
+        attempts (seconds)
+
+    :param keepalive_time: if specified, PING frame is sent, when nothing was
+        received from the other party during this time (seconds)
+
+    :param keepalive_timeout: if PING acknowledgement wasn't received during
+        this time (seconds), connection is considered as dead and closed
+
+    :param keepalive_permit_without_calls: if ``True``, PING frames are sent
+        even if there are no active streams; also other party is permitted
+        to do the same
+
+    :param keepalive_min_recv_interval: if specified, other party is not
+        permitted to send PING frames more often than this interval
+        (seconds), and it isn't permitted to send them at all without active
+        streams, unless ``keepalive_permit_without_calls`` is ``True``. Two
+        violations are tolerated, third one closes connection with
+        ENHANCE_YOUR_CALM error code; violations are forgiven every time
+        headers or data are sent
+
+    :param server_max_connection_age: if specified,
+        :py:class:`~grpclib.server.Server` sends GOAWAY frame when connection
+        exists for this time (seconds, randomized by 10%), so clients will
+        reconnect and requests will be spread across new server instances
+
+    :param server_max_connection_age_grace: if specified, requests, which
+        are still running after ``server_max_connection_age`` was reached,
+        are cancelled after this period of time (seconds); ``None`` means
+        that they can run until they are finished
+
+    :param server_max_connection_idle: if specified,
+        :py:class:`~grpclib.server.Server` sends GOAWAY frame and closes
+        connection, when there were no active requests during this time
+        (seconds)
+
+    :param codec_executor_threshold: if specified, messages of this size or
+        larger (in bytes) are encoded and decoded in the executor, so they
+        wouldn't block event loop, smaller messages are processed inline.
+        Size of the outgoing messages is known only if codec implements
+        :py:meth:`~grpclib.encoding.base.CodecBase.size_hint` method
+
+    :param compression_min_size: when compression is used, messages smaller
+        than this size (in bytes) are sent uncompressed
+
+    :param max_receive_message_size: if specified, incoming messages larger
+        than this size (in bytes) are rejected with RESOURCE_EXHAUSTED status
+        right after their length prefix is received, without buffering them,
+        and the stream is reset; size of the compressed messages is also
+        checked after decompression
+
+    :param max_send_message_size: if specified, sending messages larger than
+        this size (in bytes) fails with RESOURCE_EXHAUSTED status
+    """
+    __slots__ = tuple()
+
+    def __new__(cls, *, write_coalescing=False,
+                write_coalescing_limit=2 ** 16,
+                http2_stream_window_size=None,
+                http2_connection_window_size=None,
+                http2_max_frame_size=None,
+                http2_header_table_size=None,
+                http2_max_header_list_size=None,
+                http2_max_concurrent_streams=None,
+                http2_bdp_probe=False,
+                http2_bdp_max_window_size=2 ** 24,
+                http2_window_update_threshold=0.5,
+                channel_pool_size=1,
+                channel_pool_max_size=None,
+                channel_eager_connect=False,
+                channel_reconnect_min_delay=1.,
+                channel_reconnect_max_delay=120.,
+                keepalive_time=None,
+                keepalive_timeout=20.,
+                keepalive_permit_without_calls=False,
+                keepalive_min_recv_interval=None,
+                server_max_connection_age=None,
+                server_max_connection_age_grace=None,
+                server_max_connection_idle=None,
+                codec_executor_threshold=None,
+                compression_min_size=1024,
+                max_receive_message_size=None,
+                max_send_message_size=None):
+        if write_coalescing_limit is not None and write_coalescing_limit <= 0:
+            raise ValueError('Invalid write_coalescing_limit: {!r}'
+                             .format(write_coalescing_limit))
+        _validate('http2_stream_window_size', http2_stream_window_size,
+                  max_value=_MAX_WINDOW_SIZE)
+        _validate('http2_connection_window_size', http2_connection_window_size,
+                  min_value=_DEFAULT_WINDOW_SIZE, max_value=_MAX_WINDOW_SIZE)
+        _validate('http2_max_frame_size', http2_max_frame_size,
+                  min_value=_MIN_FRAME_SIZE, max_value=_MAX_FRAME_SIZE)
+        _validate('http2_header_table_size', http2_header_table_size)
+        _validate('http2_max_header_list_size', http2_max_header_list_size)
+        _validate('http2_max_concurrent_streams',
+                  http2_max_concurrent_streams)
+        _validate('http2_bdp_max_window_size', http2_bdp_max_window_size,
+                  min_value=_DEFAULT_WINDOW_SIZE, max_value=_MAX_WINDOW_SIZE)
+        if (
+            not isinstance(http2_window_update_threshold, (int, float))
+            or not 0 < http2_window_update_threshold <= 1
+        ):
+            raise ValueError('Invalid http2_window_update_threshold: {!r}'
+                             .format(http2_window_update_threshold))
+        if not isinstance(channel_pool_size, int) or channel_pool_size < 1:
+            raise ValueError('Invalid channel_pool_size: {!r}'
+                             .format(channel_pool_size))
+        _validate('channel_pool_max_size', channel_pool_max_size,
+                  min_value=channel_pool_size)
+        _validate_timeout('channel_reconnect_min_delay',
+                          channel_reconnect_min_delay, required=True)
+        _validate_timeout('channel_reconnect_max_delay',
+                          channel_reconnect_max_delay, required=True)
+        if channel_reconnect_max_delay < channel_reconnect_min_delay:
+            raise ValueError('Invalid channel_reconnect_max_delay: {!r}'
+                             .format(channel_reconnect_max_delay))
+        _validate_timeout('keepalive_time', keepalive_time)
+        _validate_timeout('keepalive_timeout', keepalive_timeout,
+                          required=True)
+        _validate_timeout('keepalive_min_recv_interval',
+                          keepalive_min_recv_interval)
+        _validate_timeout('server_max_connection_age',
+                          server_max_connection_age)
+        _validate_timeout('server_max_connection_age_grace',
+                          server_max_connection_age_grace)
+        _validate_timeout('server_max_connection_idle',
+                          server_max_connection_idle)
+        _validate('codec_executor_threshold', codec_executor_threshold)
+        if compression_min_size is None:
+            raise ValueError('Invalid compression_min_size: None')
+        _validate('compression_min_size', compression_min_size)
+        _validate('max_receive_message_size', max_receive_message_size)
+        _validate('max_send_message_size', max_send_message_size)
+        return super().__new__(cls, write_coalescing, write_coalescing_limit,
+                               http2_stream_window_size,
+                               http2_connection_window_size,
+                               http2_max_frame_size, http2_header_table_size,
+                               http2_max_header_list_size,
+                               http2_max_concurrent_streams, http2_bdp_probe,
+                               http2_bdp_max_window_size,
+                               http2_window_update_threshold,
+                               channel_pool_size, channel_pool_max_size,
+                               channel_eager_connect,
+                               channel_reconnect_min_delay,
+                               channel_reconnect_max_delay,
+                               keepalive_time, keepalive_timeout,
+                               keepalive_permit_without_calls,
+                               keepalive_min_recv_interval,
+                               server_max_connection_age,
+                               server_max_connection_age_grace,
+                               server_max_connection_idle,
+                               codec_executor_threshold,
+                               compression_min_size,
+                               max_receive_message_size,
+                               max_send_message_size)
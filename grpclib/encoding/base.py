@@ -1,10 +1,15 @@
 import abc
 
+from typing import Optional
+
 
 GRPC_CONTENT_TYPE = 'application/grpc'
 
 
 class CodecBase(abc.ABC):
+    #: Set to ``True`` if :py:meth:`decode` accepts any bytes-like object,
+    #: e.g. ``memoryview``, then received data is passed to it without copying
+    __buffer_protocol__ = False
 
     @property
     @abc.abstractmethod
@@ -18,3 +23,13 @@ class CodecBase(abc.ABC):
     @abc.abstractmethod
     def decode(self, data: bytes, message_type):
         pass
+
+    def size_hint(self, message) -> Optional[int]:
+        """Returns size of the encoded message, if it can be computed
+        without encoding it, otherwise ``None``
+
+        It is used to decide whether message should be encoded in the
+        executor, see ``codec_executor_threshold`` option of the
+        :py:class:`~grpclib.config.Configuration`.
+        """
+        return None
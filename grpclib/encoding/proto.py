@@ -3,6 +3,7 @@ from .base import CodecBase
 
 class ProtoCodec(CodecBase):
     __content_subtype__ = 'proto'
+    __buffer_protocol__ = True
 
     def encode(self, message, message_type):
         assert isinstance(message, message_type), type(message)
@@ -10,3 +11,6 @@ class ProtoCodec(CodecBase):
 
     def decode(self, data, message_type):
         return message_type.FromString(data)
+
+    def size_hint(self, message):
+        return message.ByteSize()
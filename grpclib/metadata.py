@@ -31,15 +31,13 @@ _UNITS = {
     'n': 10 ** -9,
 }
 
-_TIMEOUT_RE = re.compile(r'^(\d+)([{}])$'.format(''.join(_UNITS)))
-
 
 def decode_timeout(value):
-    match = _TIMEOUT_RE.match(value)
-    if match is None:
+    unit = _UNITS.get(value[-1:])
+    timeout = value[:-1]
+    if unit is None or not timeout.isdecimal():
         raise ValueError('Invalid timeout: {}'.format(value))
-    timeout, unit = match.groups()
-    return int(timeout) * _UNITS[unit]
+    return int(timeout) * unit
 
 
 def encode_timeout(timeout: float) -> str:
@@ -1,9 +1,11 @@
 import socket
+import struct
 
-from io import BytesIO
 from abc import ABC, abstractmethod
+from collections import deque
 from typing import Optional, List, Tuple, Dict  # noqa
 from asyncio import Transport, Protocol, Event, AbstractEventLoop
+from asyncio import CancelledError
 from asyncio import Queue, QueueEmpty
 
 from h2.errors import ErrorCodes
@@ -11,20 +13,19 @@ from h2.config import H2Configuration
 from h2.events import RequestReceived, DataReceived, StreamEnded, WindowUpdated
 from h2.events import ConnectionTerminated, RemoteSettingsChanged
 from h2.events import SettingsAcknowledged, ResponseReceived, TrailersReceived
-from h2.events import StreamReset, PriorityUpdated, PingAcknowledged
+from h2.events import StreamReset, PriorityUpdated, PingReceived
+from h2.events import PingAckReceived
 from h2.settings import SettingCodes
-from h2.connection import H2Connection, ConnectionState
+from h2.connection import H2Connection, ConnectionState, ConnectionInputs
+from h2.connection import H2ConnectionStateMachine
 from h2.exceptions import ProtocolError, TooManyStreamsError, StreamClosedError
+from h2.exceptions import StreamIDTooLowError
+from hyperframe.frame import GoAwayFrame, SettingsFrame
 
 from .utils import Wrapper
-from .exceptions import StreamTerminatedError
-
-
-try:
-    from h2.events import PingReceived, PingAckReceived
-except ImportError:
-    PingReceived = object()
-    PingAckReceived = object()
+from .const import Status
+from .config import Configuration
+from .exceptions import GRPCError, StreamTerminatedError
 
 
 if hasattr(socket, 'TCP_NODELAY'):
@@ -42,44 +43,88 @@ else:
         pass
 
 
-def _slice(chunks: List[bytes], size: int):
-    data, data_size, tail = [], 0, []
-    for chunk in chunks:
-        if data_size < size:
-            if data_size + len(chunk) <= size:
-                data.append(chunk)
-                data_size += len(chunk)
-            else:
-                slice_size = size - data_size
-                data.append(chunk[:slice_size])
-                tail.append(chunk[slice_size:])
-                data_size += slice_size
+_MESSAGE_PREFIX = struct.Struct('>?I')
+
+# maximum amount of serialized frames, written into the transport at once
+_WRITE_BATCH_SIZE = 2 ** 16
+
+
+def _take(views: List[memoryview], size: int):
+    parts = []
+    while size:
+        view = views[0]
+        if len(view) > size:
+            parts.append(view[:size])
+            views[0] = view[size:]
+            size = 0
         else:
-            tail.append(chunk)
-    return data, tail
+            parts.append(views.pop(0))
+            size -= len(view)
+    if len(parts) == 1:
+        return parts[0]
+    else:
+        return b''.join(parts)
 
 
 class Buffer:
+    """
+    Receive buffer for the stream's incoming DATA frames
 
-    def __init__(self, stream_id, connection, h2_connection,
+    Incoming data is stored in a single contiguous region. Reads return
+    memoryview slices of this region, so data is copied only once - when it
+    is received. Consumed bytes are dropped lazily, when the region is not
+    referenced by any of the returned views anymore.
+    """
+    def __init__(self, stream_id, connection,
                  *, loop: AbstractEventLoop) -> None:
         self._stream_id = stream_id
         self._connection = connection
-        self._h2_connection = h2_connection
-        self._chunks = []  # type: List[bytes]
+        self._unacked = 0
+        # received, but not yet acknowledged data
+        self._pending = 0
+        self._data = bytearray()
+        self._pos = 0
         self._size = 0
         self._read_size = None
         self._ready_event = Event(loop=loop)
         self._eof = False
+        self._discarded = False
 
     def _ack(self, size):
         if size:
-            self._h2_connection.acknowledge_received_data(size, self._stream_id)
-            self._connection.flush()
+            self._pending -= size
+            self._unacked += size
+            # stream's window isn't needed anymore after the stream was ended
+            # or when the rest of the data is discarded
+            stream_unacked = (0 if self._eof or self._discarded
+                              else self._unacked)
+            if self._connection.acknowledge(self._stream_id, size,
+                                            stream_unacked):
+                self._unacked = 0
+
+    def _consume(self, size):
+        view = memoryview(self._data)[self._pos:self._pos + size]
+        self._pos += len(view)
+        self._size -= len(view)
+        return view
 
     def append(self, data):
         size = len(data)
-        self._chunks.append(data)
+        self._pending += size
+        if self._discarded:
+            self._ack(size)
+            return
+        try:
+            if self._pos:
+                del self._data[:self._pos]
+                self._pos = 0
+            self._data += data
+        except BufferError:
+            # views into the current region are still referenced, so it
+            # can't be resized and unread bytes are moved into a new region
+            self._data = self._data[self._pos:]
+            self._data += data
+            self._pos = 0
         self._size += size
 
         if self._read_size is not None:
@@ -91,6 +136,25 @@ class Buffer:
         self._eof = True
         self._ready_event.set()
 
+    def discard(self):
+        """Drops buffered data and all the data, received afterwards
+
+        Only connection's flow-control window is restored, so the other party
+        wouldn't be able to send more data into this stream.
+        """
+        self._discarded = True
+        self._data = bytearray()
+        self._pos = 0
+        self._size = 0
+        self._ack(self._pending)
+
+    def _check_message_len(self, message_len, max_size):
+        if max_size is not None and message_len > max_size:
+            self.discard()
+            raise GRPCError(Status.RESOURCE_EXHAUSTED,
+                            'Received message larger than max ({} vs. {})'
+                            .format(message_len, max_size))
+
     async def read(self, size):
         if size < 0:
             raise ValueError('Size can not be negative')
@@ -109,25 +173,74 @@ class Buffer:
                 assert self._eof
                 self._ack(self._size)
 
-            data, self._chunks = _slice(self._chunks, size)
-            data_bytes = b''.join(data)
-            data_size = len(data_bytes)
-            self._size -= data_size
-
+            data = self._consume(size)
+            data_size = len(data)
             if 0 < data_size < size:
                 # TODO: proper exception
                 raise Exception('Incomplete data, {} instead of {}'
                                 .format(data_size, size))
-            return data_bytes
+            return data
+
+    async def read_message(self, *, max_size=None):
+        """Reads length-prefixed message
+
+        Returns tuple of the compressed flag and message data, or None if
+        stream was ended. Suspends only if the whole message wasn't received
+        yet, otherwise flow-control acknowledgement is sent once per message.
+
+        If message length exceeds ``max_size``, message data is discarded
+        without buffering and RESOURCE_EXHAUSTED error is raised.
+        """
+        prefix_size = _MESSAGE_PREFIX.size
+        if self._size >= prefix_size:
+            compressed_flag, message_len = \
+                _MESSAGE_PREFIX.unpack_from(self._data, self._pos)
+            self._check_message_len(message_len, max_size)
+            if self._size >= prefix_size + message_len:
+                self._ack(prefix_size + message_len)
+                self._pos += prefix_size
+                self._size -= prefix_size
+                return compressed_flag, self._consume(message_len)
+
+        prefix = await self.read(prefix_size)
+        if not prefix:
+            return None
+        compressed_flag, message_len = _MESSAGE_PREFIX.unpack(prefix)
+        prefix.release()
+        self._check_message_len(message_len, max_size)
+
+        data = await self.read(message_len)
+        assert len(data) == message_len, \
+            '{} != {}'.format(len(data), message_len)
+        return compressed_flag, data
 
 
 class StreamsLimit:
+    """
+    Limits the number of concurrent streams
 
+    Waiters are queued and woken up in FIFO order, exactly as many of them
+    as there are free slots.
+    """
     def __init__(self, limit=None, *, loop):
         self._limit = limit
         self._current = 0
         self._loop = loop
-        self._release = Event(loop=loop)
+        self._waiters = deque()  # type: deque
+        # waiters, which were woken up, but didn't occupy their slots yet
+        self._woken = 0
+
+    @property
+    def queued(self) -> int:
+        """Number of waiters in the queue"""
+        return len(self._waiters)
+
+    def available(self) -> Optional[int]:
+        """Number of free slots, ``None`` means that there is no limit"""
+        if self._limit is not None:
+            return max(self._limit - self._current, 0)
+        else:
+            return None
 
     def reached(self):
         if self._limit is not None:
@@ -135,23 +248,296 @@ class StreamsLimit:
         else:
             return False
 
-    async def wait(self):
-        # TODO: use FIFO queue for waiters
-        if self.reached():
-            self._release.clear()
-        await self._release.wait()
+    async def wait(self, *, retry=False):
+        """Waits for a free slot
+
+        Slot should be occupied right after this method returns, without
+        any async interruptions in between. If ``retry`` is ``True``, caller
+        failed to occupy a slot, which was considered as free, so it is
+        queued in front of other waiters.
+        """
+        if not retry and not self._waiters:
+            available = self.available()
+            if available is None or available > self._woken:
+                return
+
+        waiter = self._loop.create_future()
+        if retry:
+            self._waiters.appendleft(waiter)
+        else:
+            self._waiters.append(waiter)
+        try:
+            await waiter
+        except CancelledError:
+            if waiter.cancelled():
+                self._waiters.remove(waiter)
+            else:
+                # slot should be passed to the next waiter
+                self._woken -= 1
+                self.notify()
+            raise
+        else:
+            self._woken -= 1
+
+    def notify(self):
+        """Wakes up waiters, if there are free slots"""
+        if not self._waiters:
+            return
+        available = self.available()
+        while self._waiters and (available is None
+                                 or available > self._woken):
+            self._waiters.popleft().set_result(None)
+            self._woken += 1
 
     def acquire(self):
         self._current += 1
 
     def release(self):
         self._current -= 1
-        if not self.reached():
-            self._release.set()
+        self.notify()
 
     def set(self, value: Optional[int]):
         assert value is None or value >= 0, value
         self._limit = value
+        self.notify()
+
+
+class OutboundStreamsLimit(StreamsLimit):
+    """
+    Limits the number of concurrent outbound streams, as it was advertised
+    by the other party using SETTINGS_MAX_CONCURRENT_STREAMS setting
+
+    Current number of streams and the limit are maintained by the
+    H2Connection, so :py:meth:`notify` should be called when they are
+    changed.
+    """
+    def __init__(self, connection: H2Connection, *, loop) -> None:
+        super().__init__(loop=loop)
+        self._h2_connection = connection
+
+    def available(self):
+        return max(self._h2_connection.remote_settings.max_concurrent_streams
+                   - self._h2_connection.open_outbound_streams, 0)
+
+
+_DEFAULT_WINDOW_SIZE = 2 ** 16 - 1
+
+_BDP_PING_DATA = b'\x00bdp\x00\x00\x00\x00'
+_BDP_PING_MIN_DELAY = 0.1
+_BDP_PING_MAX_DELAY = 10
+
+_KEEPALIVE_PING_DATA = b'\x00keep\x00\x00\x00'
+_MAX_PING_STRIKES = 2
+
+_DRAIN_PING_DATA = b'\x00drain\x00\x00'
+_DRAIN_PING_TIMEOUT = 1
+_MAX_STREAM_ID = 2 ** 31 - 1
+
+
+class BDPEstimator:
+    """
+    Estimates bandwidth-delay product of the connection and grows
+    flow-control windows accordingly
+
+    PING frame is sent along with received DATA frame, and all the data,
+    received until PING acknowledgement, is considered as a BDP sample.
+    Windows are grown, when the sample is close to the current window size
+    and bandwidth is still growing. When there is nothing to grow, PING
+    frames are sent less frequently.
+    """
+    def __init__(self, connection: H2Connection, *, loop: AbstractEventLoop,
+                 window_size: int, connection_window_size: int,
+                 max_window_size: int) -> None:
+        self._h2_connection = connection
+        self._loop = loop
+        self._window_size = window_size
+        self._connection_window_size = connection_window_size
+        self._max_window_size = max_window_size
+
+        self._ping_sent_at = None  # type: Optional[float]
+        self._ping_delay = 0.
+        self._next_ping_at = 0.
+        self._sample = 0
+        self._bandwidth = 0.
+
+    @property
+    def connection_window_size(self):
+        return self._connection_window_size
+
+    def data_received(self, size):
+        if self._ping_sent_at is not None:
+            self._sample += size
+        elif (
+            self._window_size < self._max_window_size
+            and self._loop.time() >= self._next_ping_at
+        ):
+            self._h2_connection.ping(_BDP_PING_DATA)
+            self._ping_sent_at = self._loop.time()
+            self._sample = size
+
+    def ping_ack_received(self, data):
+        if data != _BDP_PING_DATA or self._ping_sent_at is None:
+            return
+
+        now = self._loop.time()
+        rtt = now - self._ping_sent_at
+        self._ping_sent_at = None
+
+        bandwidth = self._sample / rtt if rtt > 0 else float('inf')
+        if (
+            self._sample >= self._window_size * 2 / 3
+            and bandwidth > self._bandwidth
+        ):
+            self._bandwidth = bandwidth
+            self._ping_delay = 0.
+            self._grow(min(self._sample * 2, self._max_window_size))
+        else:
+            self._ping_delay = min(max(self._ping_delay * 2,
+                                       _BDP_PING_MIN_DELAY),
+                                   _BDP_PING_MAX_DELAY)
+        self._next_ping_at = now + self._ping_delay
+
+    def _grow(self, window_size):
+        if window_size <= self._window_size:
+            return
+        self._window_size = window_size
+        self._h2_connection.update_settings({
+            SettingCodes.INITIAL_WINDOW_SIZE: window_size,
+        })
+        if window_size > self._connection_window_size:
+            self._h2_connection.increment_flow_control_window(
+                window_size - self._connection_window_size
+            )
+            self._connection_window_size = window_size
+
+
+class Keepalive:
+    """
+    Sends PING frames to detect dead connections, and enforces limits on
+    PING frames, received from the other party
+
+    PING frame is sent only when nothing was received during keepalive time.
+    Connection is closed, if PING acknowledgement wasn't received in time.
+    Round-trip time, measured using these PING frames, is available as
+    :py:attr:`rtt` attribute, and on the client-side as
+    :py:attr:`grpclib.client.Channel.rtt` property.
+    """
+    _ping_handle = None
+    _timeout_handle = None
+    _ping_sent_at = None
+    _last_ping_received_at = None
+
+    #: last measured round-trip time (seconds)
+    rtt = None  # type: Optional[float]
+
+    def __init__(self, processor: 'EventsProcessor', *,
+                 loop: AbstractEventLoop, config: Configuration) -> None:
+        self._processor = processor
+        self._loop = loop
+        self._interval = config.keepalive_time
+        self._timeout = config.keepalive_timeout
+        self._permit_without_calls = config.keepalive_permit_without_calls
+        self._min_recv_interval = config.keepalive_min_recv_interval
+        self._strikes = 0
+        self._last_received_at = loop.time()
+        if self._interval is not None:
+            self._schedule(self._interval)
+
+    def _schedule(self, delay):
+        self._ping_handle = self._loop.call_later(delay, self._ping)
+
+    def _ping(self):
+        self._ping_handle = None
+        elapsed = self._loop.time() - self._last_received_at
+        if elapsed < self._interval:
+            self._schedule(self._interval - elapsed)
+        elif not self._permit_without_calls and not self._processor.streams:
+            self._schedule(self._interval)
+        else:
+            self._processor.connection.ping(_KEEPALIVE_PING_DATA)
+            self._ping_sent_at = self._loop.time()
+            self._timeout_handle = self._loop.call_later(self._timeout,
+                                                         self._timed_out)
+
+    def _timed_out(self):
+        self._timeout_handle = None
+        self._processor.close()
+
+    def data_received(self):
+        self._last_received_at = self._loop.time()
+
+    def headers_or_data_sent(self):
+        # other party is allowed to ping us again after we've sent something
+        self._strikes = 0
+        self._last_ping_received_at = None
+
+    def ping_ack_received(self, data):
+        if data != _KEEPALIVE_PING_DATA or self._ping_sent_at is None:
+            return
+        self.rtt = self._loop.time() - self._ping_sent_at
+        self._ping_sent_at = None
+        self._timeout_handle.cancel()
+        self._timeout_handle = None
+        self._schedule(self._interval)
+
+    def ping_received(self):
+        if self._min_recv_interval is None:
+            return
+        now = self._loop.time()
+        if (
+            (not self._permit_without_calls and not self._processor.streams)
+            or (self._last_ping_received_at is not None
+                and now - self._last_ping_received_at
+                < self._min_recv_interval)
+        ):
+            self._strikes += 1
+            if self._strikes > _MAX_PING_STRIKES:
+                self._processor.connection.terminate(
+                    ErrorCodes.ENHANCE_YOUR_CALM, b'too_many_pings',
+                )
+                self._processor.close()
+        self._last_ping_received_at = now
+
+    def close(self):
+        if self._ping_handle is not None:
+            self._ping_handle.cancel()
+            self._ping_handle = None
+        if self._timeout_handle is not None:
+            self._timeout_handle.cancel()
+            self._timeout_handle = None
+
+
+class _ConnectionStateMachine(H2ConnectionStateMachine):
+    """
+    H2Connection considers connection closed right after receiving GOAWAY
+    frame, and fails on any following frame, even when it was sent by the other
+    party in the same batch. This state machine keeps connection open, so
+    streams, which other party has already processed, can be finished
+    """
+    def process_input(self, input_):
+        if (
+            input_ is ConnectionInputs.RECV_GOAWAY
+            and self.state is not ConnectionState.CLOSED
+        ):
+            return []
+        return super().process_input(input_)
+
+
+class _H2Connection(H2Connection):
+    """
+    Other party may reset a stream right after sending END_STREAM flag, before
+    receiving END_STREAM flag from this party, e.g. server rejects request
+    right after receiving its headers. When these frames are crossed,
+    H2Connection receives RST_STREAM frame for a stream, closed by END_STREAM
+    flags, and treats it as a connection error. Such frames are ignored here
+    """
+    def _receive_rst_stream_frame(self, frame):
+        try:
+            return super()._receive_rst_stream_frame(frame)
+        except (StreamClosedError, StreamIDTooLowError):
+            if self._stream_is_closed_by_end(frame.stream_id):
+                return [], []
+            raise
 
 
 class Connection:
@@ -159,16 +545,60 @@ class Connection:
     Holds connection state (write_ready), and manages
     H2Connection <-> Transport communication
     """
+    _flush_handle = None
+    _drain_handle = None
+    _drain_callback = None
+
+    #: GOAWAY frame was sent or received, new streams are not allowed, but
+    #: existing streams can be finished
+    closing = False
+
+    #: connection was closed
+    closed = False
+
     def __init__(self, connection: H2Connection, transport: Transport,
-                 *, loop: AbstractEventLoop) -> None:
+                 *, loop: AbstractEventLoop,
+                 config: Optional[Configuration] = None) -> None:
         self._connection = connection
         self._transport = transport
         self._loop = loop
+        self._config = config or Configuration()
+
+        state_machine = _ConnectionStateMachine()
+        state_machine.state = connection.state_machine.state
+        connection.state_machine = state_machine
+
+        self._write_buffer = []  # type: List[bytes]
+        self._write_buffer_size = 0
+
+        self._window_size = (self._config.http2_connection_window_size
+                             or _DEFAULT_WINDOW_SIZE)
+        self._unacked = 0
+
+        self.keepalive = None  # type: Optional[Keepalive]
+
+        self.bdp_estimator = None  # type: Optional[BDPEstimator]
+        if self._config.http2_bdp_probe:
+            self.bdp_estimator = BDPEstimator(
+                connection, loop=loop,
+                window_size=(self._config.http2_stream_window_size
+                             or _DEFAULT_WINDOW_SIZE),
+                connection_window_size=(
+                    self._config.http2_connection_window_size
+                    or _DEFAULT_WINDOW_SIZE
+                ),
+                max_window_size=self._config.http2_bdp_max_window_size,
+            )
 
         self.write_ready = Event(loop=self._loop)
         self.write_ready.set()
 
-        self.stream_close_waiter = Event(loop=self._loop)
+        self.streams_limit = OutboundStreamsLimit(connection, loop=loop)
+        self.inbound_streams_limit = StreamsLimit(
+            self._config.http2_max_concurrent_streams, loop=loop,
+        )
+        # number of the incoming streams, refused with REFUSED_STREAM error
+        self.refused_streams = 0
 
     def feed(self, data):
         return self._connection.receive_data(data)
@@ -183,12 +613,159 @@ class Connection:
         return Stream(self, self._connection, self._transport, loop=self._loop,
                       stream_id=stream_id, wrapper=wrapper)
 
+    def _write_buffered(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        if self._write_buffer:
+            self._transport.writelines(self._write_buffer)
+            self._write_buffer = []
+            self._write_buffer_size = 0
+
+    def writelines(self, data: List[bytes]):
+        if not self._config.write_coalescing:
+            self._transport.writelines(data)
+            return
+
+        self._write_buffer.extend(data)
+        self._write_buffer_size += sum(map(len, data))
+        limit = self._config.write_coalescing_limit
+        if limit is not None and self._write_buffer_size >= limit:
+            self._write_buffered()
+        elif self._flush_handle is None:
+            self._flush_handle = self._loop.call_soon(self._write_buffered)
+
+    def acknowledge(self, stream_id, size, stream_unacked):
+        """Acknowledges consumed data to restore flow-control windows
+
+        Acknowledgements are accumulated, and WINDOW_UPDATE frames are sent
+        only when configured fraction of the window was consumed, or when
+        connection's window is exhausted, so readers wouldn't stall.
+        ``stream_unacked`` is a total size of the unacknowledged data of the
+        stream. Returns ``True`` if stream's window was updated.
+        """
+        if self._connection.state_machine.state is ConnectionState.CLOSED:
+            return False
+
+        threshold = self._config.http2_window_update_threshold
+        stream_updated = False
+        if stream_id is not None and stream_unacked:
+            window_size = self._connection.local_settings.initial_window_size
+            if stream_unacked >= window_size * threshold:
+                try:
+                    self._connection.increment_flow_control_window(
+                        stream_unacked, stream_id,
+                    )
+                except StreamClosedError:
+                    pass
+                stream_updated = True
+
+        self._unacked += size
+        if self.bdp_estimator is not None:
+            window_size = self.bdp_estimator.connection_window_size
+        else:
+            window_size = self._window_size
+        if self._unacked and (
+            self._unacked >= window_size * threshold
+            or not self._connection.inbound_flow_control_window
+        ):
+            self._connection.increment_flow_control_window(self._unacked)
+            self._unacked = 0
+            self.flush()
+        elif stream_updated:
+            self.flush()
+        return stream_updated
+
+    def _write(self, data: bytes):
+        if self._config.write_coalescing:
+            self.writelines([data])
+        else:
+            self._transport.write(data)
+
     def flush(self):
         data = self._connection.data_to_send()
         if data:
-            self._transport.write(data)
+            self._write(data)
+
+    def ping(self, data: bytes):
+        self._connection.ping(data)
+        self.flush()
+
+    def terminate(self, error_code, additional_data=None):
+        """Sends GOAWAY frame"""
+        if self._connection.state_machine.state is not ConnectionState.CLOSED:
+            self._connection.close_connection(error_code,
+                                              additional_data=additional_data)
+            self.flush()
+
+    def _send_goaway(self, last_stream_id):
+        # H2Connection closes connection right after sending GOAWAY frame, so
+        # this frame is serialized and sent bypassing H2Connection
+        frame = GoAwayFrame(0)
+        frame.last_stream_id = last_stream_id
+        frame.error_code = ErrorCodes.NO_ERROR
+        self._write(frame.serialize())
+
+    def drain(self, callback):
+        """Starts graceful shutdown, but keeps connection open, so existing
+        streams can be finished
+
+        First GOAWAY frame with the maximum stream id is sent along with the
+        PING frame. Streams, which other party has opened before receiving
+        this GOAWAY frame, are still accepted. When PING acknowledgement is
+        received (or after a timeout), final GOAWAY frame with the last
+        processed stream id is sent, and ``callback`` is called.
+        """
+        if self.closing or self._drain_callback is not None:
+            return
+        self._drain_callback = callback
+        self.flush()
+        self._send_goaway(_MAX_STREAM_ID)
+        self.ping(_DRAIN_PING_DATA)
+        self._drain_handle = self._loop.call_later(_DRAIN_PING_TIMEOUT,
+                                                   self._drained)
+
+    def advertise_max_concurrent_streams(self, value):
+        """Sends SETTINGS frame with the MAX_CONCURRENT_STREAMS limit
+
+        H2Connection enforces this limit by closing the whole connection, but
+        RFC 7540 requires to refuse only excess streams, so this frame is
+        serialized and sent bypassing H2Connection, H2Connection's own limit
+        should be lifted (see :py:meth:`H2Protocol.connection_made`), and the
+        limit is enforced by the :py:class:`EventsProcessor` with
+        REFUSED_STREAM error code.
+        """
+        frame = SettingsFrame(0)
+        frame.settings[SettingCodes.MAX_CONCURRENT_STREAMS] = value
+        self._write(frame.serialize())
+
+    def drain_ping_ack_received(self, data):
+        if data == _DRAIN_PING_DATA and self._drain_handle is not None:
+            self._drain_handle.cancel()
+            self._drained()
+
+    def _drained(self):
+        self._drain_handle = None
+        self.closing = True
+        self.flush()
+        self._send_goaway(self._connection.highest_inbound_stream_id)
+        self._drain_callback()
+
+    def goaway_received(self):
+        """Marks connection as closing after receiving GOAWAY frame, so new
+        streams will use another connection, and streams, which other party
+        has already processed, can be finished
+        """
+        self.closing = True
 
     def close(self):
+        self.closed = True
+        if self.keepalive is not None:
+            self.keepalive.close()
+        if self._drain_handle is not None:
+            self._drain_handle.cancel()
+            self._drain_handle = None
+        self._write_buffered()
         self._transport.close()
 
 
@@ -214,12 +791,16 @@ class Stream:
         if stream_id is not None:
             self.id = stream_id
             self.__buffer__ = Buffer(self.id, self._connection,
-                                     self._h2_connection, loop=self._loop)
+                                     loop=self._loop)
 
         self.__headers__ = Queue(loop=loop) \
             # type: Queue[List[Tuple[str, str]]]
         self.__window_updated__ = Event(loop=loop)
 
+    def _sent(self):
+        if self._connection.keepalive is not None:
+            self._connection.keepalive.headers_or_data_sent()
+
     async def recv_headers(self):
         return await self.__headers__.get()
 
@@ -232,8 +813,12 @@ class Stream:
     async def recv_data(self, size):
         return await self.__buffer__.read(size)
 
+    async def recv_message_data(self, *, max_size=None):
+        return await self.__buffer__.read_message(max_size=max_size)
+
     async def send_request(self, headers, end_stream=False, *, _processor):
         assert self.id is None, self.id
+        retry = False
         while True:
             # this is the first thing we should check before even trying to
             # create new stream, because this wait() can be cancelled by timeout
@@ -241,6 +826,11 @@ class Stream:
             if not self._connection.write_ready.is_set():
                 await self._connection.write_ready.wait()
 
+            # waiting in a FIFO queue, if there are no free stream slots;
+            # this wait() is also the last async interruption before the
+            # `connection.send_headers()` call
+            await self._connection.streams_limit.wait(retry=retry)
+
             # `get_next_available_stream_id()` should be as close to
             # `connection.send_headers()` as possible, without any async
             # interruptions in between, see the docs on the
@@ -250,24 +840,21 @@ class Stream:
                 self._h2_connection.send_headers(stream_id, headers,
                                                  end_stream=end_stream)
             except TooManyStreamsError:
-                # we're going to wait until any of currently opened streams will
-                # be closed, and we will be able to open a new one
-                # TODO: maybe implement FIFO for waiters, but this limit
-                #       shouldn't be reached in a normal case, so why bother
+                # streams limit was lowered or streams are not closed yet from
+                # the H2Connection's point of view, so we're going to wait in
+                # front of the queue until any of currently opened streams
+                # will be closed, and we will be able to open a new one
                 # TODO: maybe we should raise an exception here instead of
                 #       waiting, if timeout wasn't set for the current request
-                self._connection.stream_close_waiter.clear()
-                await self._connection.stream_close_waiter.wait()
-                # while we were trying to create a new stream, write buffer
-                # can became full, so we need to repeat checks from checking
-                # if we can write() data
+                retry = True
                 continue
             else:
                 self.id = stream_id
                 self.__buffer__ = Buffer(self.id, self._connection,
-                                         self._h2_connection, loop=self._loop)
+                                         loop=self._loop)
                 release_stream = _processor.register(self)
-                self._transport.write(self._h2_connection.data_to_send())
+                self._connection.flush()
+                self._sent()
                 return release_stream
 
     async def send_headers(self, headers, end_stream=False):
@@ -283,51 +870,76 @@ class Stream:
 
         self._h2_connection.send_headers(self.id, headers,
                                          end_stream=end_stream)
-        self._transport.write(self._h2_connection.data_to_send())
+        self._connection.flush()
+        self._sent()
 
     async def send_data(self, data, end_stream=False):
-        f = BytesIO(data)
-        f_pos, f_last = 0, len(data)
+        await self._send_buffers([data], end_stream=end_stream)
+
+    async def send_message_data(self, data, end_stream=False, *,
+                                compressed=False):
+        prefix = _MESSAGE_PREFIX.pack(compressed, len(data))
+        await self._send_buffers([prefix, data], end_stream=end_stream)
 
+    async def _send_buffers(self, buffers, end_stream=False):
+        views = [memoryview(b) for b in buffers if len(b)]
+        remaining = sum(map(len, views))
+
+        # frames are written into the transport in batches, until we have
+        # to wait for the transport or for the flow-control window
+        frames, frames_size = [], 0
         while True:
             if not self._connection.write_ready.is_set():
+                if frames:
+                    self._connection.writelines(frames)
+                    frames, frames_size = [], 0
                 await self._connection.write_ready.wait()
 
             window = self._h2_connection.local_flow_control_window(self.id)
             if not window:
+                if frames:
+                    self._connection.writelines(frames)
+                    frames, frames_size = [], 0
                 self.__window_updated__.clear()
                 await self.__window_updated__.wait()
                 window = self._h2_connection.local_flow_control_window(self.id)
 
             max_frame_size = self._h2_connection.max_outbound_frame_size
-            f_chunk = f.read(min(window, max_frame_size, f_last - f_pos))
-            f_pos = f.tell()
+            chunk_size = min(window, max_frame_size, remaining)
+            chunk = _take(views, chunk_size)
+            remaining -= chunk_size
 
-            if f_pos == f_last:
-                self._h2_connection.send_data(self.id, f_chunk,
+            if not remaining:
+                self._h2_connection.send_data(self.id, chunk,
                                               end_stream=end_stream)
-                self._transport.write(self._h2_connection.data_to_send())
+                frames.append(self._h2_connection.data_to_send())
+                self._connection.writelines(frames)
+                self._sent()
                 break
             else:
-                self._h2_connection.send_data(self.id, f_chunk)
-                self._transport.write(self._h2_connection.data_to_send())
+                self._h2_connection.send_data(self.id, chunk)
+                frames.append(self._h2_connection.data_to_send())
+                frames_size += chunk_size
+                if frames_size >= _WRITE_BATCH_SIZE:
+                    self._connection.writelines(frames)
+                    frames, frames_size = [], 0
 
     async def end(self):
         if not self._connection.write_ready.is_set():
             await self._connection.write_ready.wait()
         self._h2_connection.end_stream(self.id)
-        self._transport.write(self._h2_connection.data_to_send())
+        self._connection.flush()
 
     async def reset(self, error_code=ErrorCodes.NO_ERROR):
         if not self._connection.write_ready.is_set():
             await self._connection.write_ready.wait()
         self._h2_connection.reset_stream(self.id, error_code=error_code)
-        self._transport.write(self._h2_connection.data_to_send())
+        self._connection.flush()
 
     def reset_nowait(self, error_code=ErrorCodes.NO_ERROR):
         self._h2_connection.reset_stream(self.id, error_code=error_code)
         if self._connection.write_ready.is_set():
-            self._transport.write(self._h2_connection.data_to_send())
+            self._connection.flush()
 
     def __ended__(self):
         self.__buffer__.eof()
@@ -340,6 +952,8 @@ class Stream:
     def closable(self):
         if self._h2_connection.state_machine.state is ConnectionState.CLOSED:
             return False
+        if self._transport.is_closing():
+            return False
         stream = self._h2_connection.streams.get(self.id)
         if stream is None:
             return False
@@ -384,7 +998,6 @@ class EventsProcessor:
             ConnectionTerminated: self.process_connection_terminated,
             PingReceived: self.process_ping_received,
             PingAckReceived: self.process_ping_ack_received,
-            PingAcknowledged: self.process_ping_ack_received,  # deprecated
         }
 
         self.streams = {}  # type: Dict[int, Stream]
@@ -394,16 +1007,32 @@ class EventsProcessor:
         self.streams[stream.id] = stream
         return stream
 
-    def register(self, stream):
+    def register(self, stream, *, inbound=False):
         assert stream.id is not None
         self.streams[stream.id] = stream
+        if inbound:
+            self.connection.inbound_streams_limit.acquire()
 
         def release_stream(*, _streams=self.streams, _id=stream.id):
             _streams.pop(_id)
-            self.connection.stream_close_waiter.set()
+            if inbound:
+                self.connection.inbound_streams_limit.release()
+            self.connection.streams_limit.notify()
+            if self.connection.closing and not _streams:
+                self.close()
 
         return release_stream
 
+    def drain(self):
+        """Stops accepting new streams and closes connection when all
+        existing streams are finished
+        """
+        self.connection.drain(self._drained)
+
+    def _drained(self):
+        if not self.streams:
+            self.close()
+
     def close(self):
         self.connection.close()
         self.handler.close()
@@ -420,7 +1049,18 @@ class EventsProcessor:
 
     def process_request_received(self, event: RequestReceived):
         stream = self.connection.create_stream(stream_id=event.stream_id)
-        release_stream = self.register(stream)
+        if self.connection.closing:
+            # GOAWAY frame was sent, client will retry this request
+            self.connection.refused_streams += 1
+            stream.reset_nowait(ErrorCodes.REFUSED_STREAM)
+            return
+        if self.connection.inbound_streams_limit.reached():
+            # client could open streams before receiving advertised limit, or
+            # just ignore it
+            self.connection.refused_streams += 1
+            stream.reset_nowait(ErrorCodes.REFUSED_STREAM)
+            return
+        release_stream = self.register(stream, inbound=True)
         self.handler.accept(stream, event.headers, release_stream)
         # TODO: check EOF
 
@@ -430,6 +1070,8 @@ class EventsProcessor:
             stream.__headers__.put_nowait(event.headers)
 
     def process_remote_settings_changed(self, event: RemoteSettingsChanged):
+        if SettingCodes.MAX_CONCURRENT_STREAMS in event.changed_settings:
+            self.connection.streams_limit.notify()
         if SettingCodes.INITIAL_WINDOW_SIZE in event.changed_settings:
             for stream in self.streams.values():
                 stream.__window_updated__.set()
@@ -438,9 +1080,19 @@ class EventsProcessor:
         pass
 
     def process_data_received(self, event: DataReceived):
+        if self.connection.bdp_estimator is not None:
+            self.connection.bdp_estimator\
+                .data_received(event.flow_controlled_length)
         stream = self.streams.get(event.stream_id)
         if stream is not None:
             stream.__buffer__.append(event.data)
+            padding = event.flow_controlled_length - len(event.data)
+        else:
+            # data will never be consumed
+            padding = event.flow_controlled_length
+        # padding is acknowledged right away, this also sends pending
+        # acknowledgements if connection's window is exhausted
+        self.connection.acknowledge(None, padding, 0)
 
     def process_window_updated(self, event: WindowUpdated):
         if event.stream_id == 0:
@@ -476,23 +1128,61 @@ class EventsProcessor:
         pass
 
     def process_connection_terminated(self, event: ConnectionTerminated):
+        if (
+            event.error_code is ErrorCodes.NO_ERROR
+            and event.last_stream_id is not None
+        ):
+            # graceful shutdown, streams with higher ids were not processed
+            # by the other party, remaining streams can be finished
+            for stream in list(self.streams.values()):
+                if stream.id > event.last_stream_id:
+                    stream.__terminated__('Stream was not processed, '
+                                          'connection is closing')
+            if any(stream_id <= event.last_stream_id
+                   for stream_id in self.streams):
+                self.connection.goaway_received()
+                # new requests will use another connection
+                self.handler.close()
+                return
         self.close()
 
     def process_ping_received(self, event: PingReceived):
-        pass
+        if self.connection.keepalive is not None:
+            self.connection.keepalive.ping_received()
 
     def process_ping_ack_received(self, event: PingAckReceived):
-        pass
+        self.connection.drain_ping_ack_received(event.ping_data)
+        if self.connection.keepalive is not None:
+            self.connection.keepalive.ping_ack_received(event.ping_data)
+        if self.connection.bdp_estimator is not None:
+            self.connection.bdp_estimator.ping_ack_received(event.ping_data)
+
+
+def _local_settings(config: Configuration):
+    settings = {}
+    if config.http2_stream_window_size is not None:
+        settings[SettingCodes.INITIAL_WINDOW_SIZE] = \
+            config.http2_stream_window_size
+    if config.http2_max_frame_size is not None:
+        settings[SettingCodes.MAX_FRAME_SIZE] = config.http2_max_frame_size
+    if config.http2_header_table_size is not None:
+        settings[SettingCodes.HEADER_TABLE_SIZE] = \
+            config.http2_header_table_size
+    if config.http2_max_header_list_size is not None:
+        settings[SettingCodes.MAX_HEADER_LIST_SIZE] = \
+            config.http2_max_header_list_size
+    return settings
 
 
 class H2Protocol(Protocol):
     connection = None  # type: Optional[Connection]
     processor = None  # type: Optional[EventsProcessor]
 
-    def __init__(self, handler: AbstractHandler, config: H2Configuration,
-                 *, loop) -> None:
+    def __init__(self, handler: AbstractHandler, h2_config: H2Configuration,
+                 *, loop, config: Optional[Configuration] = None) -> None:
         self.handler = handler
-        self.config = config
+        self.h2_config = h2_config
+        self.config = config or Configuration()
         self.loop = loop
 
     def connection_made(self, transport: Transport):  # type: ignore
@@ -500,15 +1190,61 @@ class H2Protocol(Protocol):
         if sock is not None:
             _set_nodelay(sock)
 
-        h2_conn = H2Connection(config=self.config)
+        h2_conn = _H2Connection(config=self.h2_config)
         h2_conn.initiate_connection()
 
-        self.connection = Connection(h2_conn, transport, loop=self.loop)
+        if self.config.http2_max_concurrent_streams is not None:
+            # H2Connection's own limit (100 by default) is lifted without
+            # advertising it, configured limit is advertised and enforced
+            # separately, see Connection.advertise_max_concurrent_streams()
+            h2_conn.local_settings[SettingCodes.MAX_CONCURRENT_STREAMS] = \
+                _MAX_STREAM_ID
+            h2_conn.local_settings.acknowledge()
+
+        settings = _local_settings(self.config)
+        if settings:
+            h2_conn.update_settings(settings)
+            # h2 applies new limits only after receiving ACK, but other party
+            # can send ACK and frames, which rely on new settings, in the
+            # same packet; it is always safe to raise these limits earlier
+            if self.config.http2_max_frame_size is not None:
+                h2_conn.max_inbound_frame_size = max(
+                    h2_conn.max_inbound_frame_size,
+                    self.config.http2_max_frame_size,
+                )
+            if self.config.http2_header_table_size is not None:
+                h2_conn.decoder.max_allowed_table_size = max(
+                    h2_conn.decoder.max_allowed_table_size,
+                    self.config.http2_header_table_size,
+                )
+
+        if self.config.http2_connection_window_size is not None:
+            window_delta = (self.config.http2_connection_window_size
+                            - h2_conn.inbound_flow_control_window)
+            if window_delta > 0:
+                h2_conn.increment_flow_control_window(window_delta)
+
+        self.connection = Connection(h2_conn, transport, loop=self.loop,
+                                     config=self.config)
         self.connection.flush()
+        if self.config.http2_max_concurrent_streams is not None:
+            self.connection.advertise_max_concurrent_streams(
+                self.config.http2_max_concurrent_streams,
+            )
 
         self.processor = EventsProcessor(self.handler, self.connection)
 
+        if (
+            self.config.keepalive_time is not None
+            or self.config.keepalive_min_recv_interval is not None
+        ):
+            self.connection.keepalive = Keepalive(self.processor,
+                                                  loop=self.loop,
+                                                  config=self.config)
+
     def data_received(self, data: bytes):
+        if self.connection.keepalive is not None:
+            self.connection.keepalive.data_received()
         try:
             events = self.connection.feed(data)
         except ProtocolError:
@@ -517,6 +1253,8 @@ class H2Protocol(Protocol):
             self.connection.flush()
             for event in events:
                 self.processor.process(event)
+            # received events could close streams
+            self.connection.streams_limit.notify()
             self.connection.flush()
 
     def pause_writing(self):
@@ -0,0 +1,125 @@
+import abc
+import socket
+import asyncio
+import logging
+import ipaddress
+
+from typing import List, Tuple, Dict  # noqa
+
+
+log = logging.getLogger(__name__)
+
+DEFAULT_TTL = 60
+
+
+class ResolverBase(abc.ABC):
+    """
+    Base class for resolvers, which are used by the
+    :py:class:`~grpclib.client.Channel` to get addresses of the server
+    """
+
+    @abc.abstractmethod
+    async def resolve(self, host: str, port: int) -> List[Tuple[str, int]]:
+        """Returns non-empty list of ``(host, port)`` tuples, where every host
+        is an IP address
+
+        May raise :py:class:`OSError` if addresses can not be resolved.
+        """
+        pass
+
+
+class DNSResolver(ResolverBase):
+    """Resolves host names using
+    :py:meth:`~asyncio.AbstractEventLoop.getaddrinfo`
+    """
+
+    def __init__(self, *, loop):
+        self._loop = loop
+
+    async def resolve(self, host, port):
+        try:
+            ipaddress.ip_address(host)
+        except ValueError:
+            pass
+        else:
+            return [(host, port)]
+
+        infos = await self._loop.getaddrinfo(host, port,
+                                             type=socket.SOCK_STREAM)
+        addresses = []
+        for _, _, _, _, sockaddr in infos:
+            address = (sockaddr[0], sockaddr[1])
+            if address not in addresses:
+                addresses.append(address)
+        if not addresses:
+            raise OSError('No addresses found for {}'.format(host))
+        return addresses
+
+
+class CachingResolver(ResolverBase):
+    """Caches results of another resolver
+
+    Concurrent lookups of the same address are performed only once. When
+    cached result is expired, it is still returned, while fresh result is
+    resolved in the background. If background lookup fails, expired result
+    is used until the next attempt.
+
+    Addresses are resolved only on demand, there are no periodic lookups,
+    :py:class:`~grpclib.client.Channel` resolves them only when it creates
+    a new connection. So expired result is refreshed only on reconnect, and
+    established connections are kept even if their addresses were changed.
+
+    .. code-block:: python
+
+        resolver = CachingResolver(loop=loop, ttl=30)
+        # resolver can be shared between channels
+        channel = Channel('example.com', 50051, loop=loop, resolver=resolver)
+    """
+
+    def __init__(self, resolver=None, *, loop, ttl=DEFAULT_TTL):
+        """
+        :param resolver: :py:class:`ResolverBase` implementation,
+            :py:class:`DNSResolver` by default
+        :param loop: asyncio-compatible event loop
+        :param ttl: how long we can cache resolved addresses (seconds)
+        """
+        self._resolver = resolver or DNSResolver(loop=loop)
+        self._loop = loop
+        self._ttl = ttl
+        self._cache = {}  # type: Dict[Tuple[str, int], Tuple[float, List]]
+        self._pending = {}  # type: Dict[Tuple[str, int], asyncio.Task]
+
+    async def resolve(self, host, port):
+        key = (host, port)
+        cached = self._cache.get(key)
+        if cached is not None:
+            expires_at, addresses = cached
+            if self._loop.time() >= expires_at and key not in self._pending:
+                self._refresh(key)
+            return addresses
+
+        task = self._pending.get(key)
+        if task is None:
+            task = self._refresh(key)
+        # lookup is shared, so it shouldn't be cancelled with the caller
+        return await asyncio.shield(task, loop=self._loop)
+
+    def _refresh(self, key):
+        task = self._loop.create_task(self._lookup(key))
+        self._pending[key] = task
+        return task
+
+    async def _lookup(self, key):
+        try:
+            addresses = await self._resolver.resolve(*key)
+        except Exception:
+            stale = self._cache.get(key)
+            if stale is None:
+                raise
+            log.warning('Failed to resolve %s:%s, using previous result',
+                        *key, exc_info=True)
+            addresses = stale[1]
+        finally:
+            self._pending.pop(key, None)
+        self._cache[key] = (self._loop.time() + self._ttl, addresses)
+        return addresses
@@ -1,26 +1,39 @@
 import abc
+import random
 import socket
 import logging
 import asyncio
 import warnings
+import functools
+import threading
+import concurrent.futures
+
+from typing import Optional  # noqa
 
 import h2.config
 import h2.exceptions
 
 from .utils import DeadlineWrapper
 from .const import Status
-from .stream import send_message, recv_message
+from .config import Configuration
+from .stream import recv_message, recv_message_bin, encode_message
+from .stream import check_message_size
+from .stream import compress_message, compress_message_nowait
+from .stream import decompress_message, CodecExecutor
 from .stream import StreamIterator
-from .metadata import Deadline, encode_grpc_message
+from .metadata import Deadline, encode_grpc_message, decode_timeout
 from .metadata import encode_metadata, decode_metadata
 from .protocol import H2Protocol, AbstractHandler
 from .exceptions import GRPCError, ProtocolError
 from .encoding.base import GRPC_CONTENT_TYPE
 from .encoding.proto import ProtoCodec
+from . import compression as compression_registry
 
 
 log = logging.getLogger(__name__)
 
+_MAX_AGE_JITTER = 0.1
+
 
 class Stream(StreamIterator):
     """
@@ -46,15 +59,40 @@ class Stream(StreamIterator):
     _cancel_done = False
 
     def __init__(self, stream, cardinality, codec, recv_type, send_type,
-                 *, metadata, deadline=None):
+                 *, metadata=None, deadline=None, codec_executor=None,
+                 compressor=None, recv_compressor=None,
+                 compression_min_size=0, accept_encoding=None,
+                 max_receive_message_size=None, max_send_message_size=None,
+                 headers=None):
         self._stream = stream
         self._cardinality = cardinality
         self._codec = codec
+        self._codec_executor = codec_executor
+        self._compressor = compressor
+        self._recv_compressor = recv_compressor
+        self._compression_min_size = compression_min_size
+        self._accept_encoding = accept_encoding
+        self._max_receive_message_size = max_receive_message_size
+        self._max_send_message_size = max_send_message_size
         self._recv_type = recv_type
         self._send_type = send_type
-        self.metadata = metadata
+        self._metadata = metadata
+        self._headers = headers
         self.deadline = deadline
 
+    @property
+    def metadata(self):
+        """Request metadata, it is decoded from the request headers on
+        the first access
+        """
+        if self._metadata is None:
+            self._metadata = decode_metadata(self._headers or ())
+        return self._metadata
+
+    @metadata.setter
+    def metadata(self, value):
+        self._metadata = value
+
     @property
     def _content_type(self):
         return GRPC_CONTENT_TYPE + '+' + self._codec.__content_subtype__
@@ -84,7 +122,10 @@ class Stream(StreamIterator):
 
         :returns: message
         """
-        return await recv_message(self._stream, self._codec, self._recv_type)
+        return await recv_message(self._stream, self._codec, self._recv_type,
+                                  codec_executor=self._codec_executor,
+                                  compressor=self._recv_compressor,
+                                  max_size=self._max_receive_message_size)
 
     async def send_initial_metadata(self, *, metadata=None):
         """Coroutine to send headers with initial metadata to the client.
@@ -108,6 +149,10 @@ class Stream(StreamIterator):
             (':status', '200'),
             ('content-type', self._content_type),
         ]
+        if self._compressor is not None:
+            headers.append(('grpc-encoding', self._compressor.__encoding__))
+        if self._accept_encoding is not None:
+            headers.append(('grpc-accept-encoding', self._accept_encoding))
         if metadata is not None:
             headers.extend(encode_metadata(metadata))
 
@@ -131,6 +176,30 @@ class Stream(StreamIterator):
         end = kwargs.pop('end', False)
         assert not kwargs, kwargs
 
+        await self._send_message_bin(await encode_message(
+            self._codec, message, self._send_type,
+            codec_executor=self._codec_executor,
+        ))
+        if end:
+            await self.send_trailing_metadata()
+
+    async def _recv_message_bin(self):
+        message_bin = await recv_message_bin(
+            self._stream, compressor=self._recv_compressor,
+            codec_executor=self._codec_executor,
+            max_size=self._max_receive_message_size,
+        )
+        return None if message_bin is None else bytes(message_bin)
+
+    async def _send_message_bin(self, message_bin):
+        check_message_size(message_bin, self._max_send_message_size)
+        compressed, message_bin = await compress_message(
+            message_bin, self._compressor, self._compression_min_size,
+            codec_executor=self._codec_executor,
+        )
+        await self._send_message_data(message_bin, compressed)
+
+    async def _send_message_data(self, message_bin, compressed):
         if not self._send_initial_metadata_done:
             await self.send_initial_metadata()
 
@@ -139,11 +208,33 @@ class Stream(StreamIterator):
                 raise ProtocolError('Server should send exactly one message '
                                     'in response')
 
-        await send_message(self._stream, self._codec, message, self._send_type)
+        await self._stream.send_message_data(message_bin,
+                                             compressed=compressed)
         self._send_message_count += 1
 
-        if end:
-            await self.send_trailing_metadata()
+    async def _recv_message_data(self):
+        return await self._stream.recv_message_data(
+            max_size=self._max_receive_message_size,
+        )
+
+    # these methods are called from the executor thread, which runs blocking
+    # handler, so compression wouldn't wait for a free thread in the same
+    # executor
+    def _decompress_message(self, message_data):
+        if message_data is None:
+            return None
+        compressed_flag, message_bin = message_data
+        if compressed_flag:
+            message_bin = decompress_message(
+                self._recv_compressor, message_bin,
+                self._max_receive_message_size,
+            )
+        return bytes(message_bin)
+
+    def _compress_message(self, message_bin):
+        check_message_size(message_bin, self._max_send_message_size)
+        return compress_message_nowait(message_bin, self._compressor,
+                                       self._compression_min_size)
 
     async def send_trailing_metadata(self, *, status=Status.OK,
                                      status_message=None, metadata=None):
@@ -173,6 +264,9 @@ class Stream(StreamIterator):
         else:
             # trailers-only response
             headers = [(':status', '200')]
+            if self._accept_encoding is not None:
+                headers.append(('grpc-accept-encoding',
+                                self._accept_encoding))
 
         headers.append(('grpc-status', str(status.value)))
         if status_message is not None:
@@ -239,8 +333,186 @@ class Stream(StreamIterator):
         return True
 
 
-async def request_handler(mapping, _stream, headers, codec, release_stream):
+def blocking(func):
+    """Marks method handler as blocking, it will be called in the
+    executor, so it wouldn't block event loop
+
+    Blocking handler is a regular function, it accepts request message, or
+    an iterator of request messages if method accepts a stream, and returns
+    reply message, or an iterable of reply messages if method returns a
+    stream:
+
+    .. code-block:: python
+
+        class CoffeeMachine(cafe_grpc.CoffeeMachineBase):
+
+            @blocking
+            def MakeLatte(self, order):
+                ...
+                return empty_pb2.Empty()
+
+    Messages are decoded and encoded in the executor too, thread pool
+    executor also compresses and decompresses them in the thread, which runs
+    handler. Executor is configured using ``executor`` argument of the
+    :py:class:`~grpclib.server.Server`. When
+    :py:class:`~python:concurrent.futures.ProcessPoolExecutor` is used,
+    handler should be picklable, and all request messages are received
+    before calling handler, and all reply messages are sent after it
+    returns.
+    """
+    func.__blocking__ = True
+    return func
+
+
+def _call_blocking_func(func, cardinality, codec, request_type, reply_type,
+                        recv, send):
+    def requests():
+        while True:
+            message_bin = recv()
+            if message_bin is None:
+                return
+            yield codec.decode(message_bin, request_type)
+
+    if cardinality.client_streaming:
+        request = requests()
+    else:
+        request = next(requests(), None)
+
+    result = func(request)
+    replies = result if cardinality.server_streaming else [result]
+    for reply in replies:
+        send(codec.encode(reply, reply_type))
+
+
+def _call_in_process(func, cardinality, codec, request_type, reply_type,
+                     requests):
+    replies = []
+    _call_blocking_func(func, cardinality, codec, request_type, reply_type,
+                        functools.partial(next, iter(requests), None),
+                        replies.append)
+    return replies
+
+
+class _LoopBridge:
+    """Runs stream coroutines from the executor thread in the event loop"""
+
+    def __init__(self, *, loop):
+        self._loop = loop
+        self._lock = threading.Lock()
+        self._futures = set()
+        self._cancelled = False
+
+    def call(self, coro):
+        with self._lock:
+            if self._cancelled:
+                coro.close()
+                raise concurrent.futures.CancelledError()
+            future = asyncio.run_coroutine_threadsafe(coro, self._loop)
+            self._futures.add(future)
+        try:
+            return future.result()
+        finally:
+            with self._lock:
+                self._futures.discard(future)
+
+    def cancel(self):
+        with self._lock:
+            self._cancelled = True
+            for future in self._futures:
+                future.cancel()
+
+
+async def _blocking_handler(method, stream, *, loop, executor):
+    func = method.func
+    args = (func, method.cardinality, stream._codec, method.request_type,
+            method.reply_type)
+    if isinstance(executor, concurrent.futures.ProcessPoolExecutor):
+        requests = []
+        while not requests or method.cardinality.client_streaming:
+            message_bin = await stream._recv_message_bin()
+            if message_bin is None:
+                break
+            requests.append(message_bin)
+        replies = await loop.run_in_executor(executor, _call_in_process,
+                                             *args, requests)
+        for reply_bin in replies:
+            await stream._send_message_bin(reply_bin)
+    else:
+        bridge = _LoopBridge(loop=loop)
+
+        def recv():
+            message_data = bridge.call(stream._recv_message_data())
+            return stream._decompress_message(message_data)
+
+        def send(reply_bin):
+            compressed, reply_bin = stream._compress_message(reply_bin)
+            bridge.call(stream._send_message_data(reply_bin, compressed))
+
+        try:
+            await loop.run_in_executor(executor, _call_blocking_func, *args,
+                                       recv, send)
+        finally:
+            # handler will fail on the next attempt to receive or send
+            # message, if request was cancelled
+            bridge.cancel()
+
+
+def _peer(_stream):
+    peername = _stream._transport.get_extra_info('peername')
+    if isinstance(peername, (tuple, list)):
+        # port is different for every connection
+        return peername[0]
+    return peername
+
+
+async def _reject(_stream, release_stream, status, message):
     try:
+        await _stream.send_headers([
+            (':status', '200'),
+            ('grpc-status', str(status.value)),
+            ('grpc-message', message),
+        ], end_stream=True)
+        if _stream.closable:
+            _stream.reset_nowait()
+    except Exception:
+        log.exception('Server error')
+    finally:
+        release_stream()
+
+
+async def _scheduled(scheduler, _stream, headers, release_stream, handler):
+    priority = scheduler.classify(headers)
+    try:
+        await scheduler.acquire(priority)
+    except GRPCError as exc:
+        handler.close()
+        await _reject(_stream, release_stream, exc.status, exc.message)
+        return
+    except asyncio.CancelledError:
+        handler.close()
+        release_stream()
+        raise
+    try:
+        await handler
+    finally:
+        scheduler.release(priority)
+
+
+@functools.lru_cache()
+def _content_types(content_subtype):
+    """Returns accepted values of the content-type header"""
+    content_types = {GRPC_CONTENT_TYPE + '+' + content_subtype}
+    if content_subtype == ProtoCodec.__content_subtype__:
+        content_types.update((GRPC_CONTENT_TYPE, GRPC_CONTENT_TYPE + '+'))
+    return frozenset(content_types)
+
+
+async def request_handler(mapping, _stream, headers, codec, release_stream,
+                          *, codec_executor=None, compression=None,
+                          config=None):
+    try:
+        # single pass over the headers, validation and dispatch are
+        # performed using this mapping, metadata is decoded lazily
         headers_map = dict(headers)
 
         if headers_map[':method'] != 'POST':
@@ -262,12 +534,7 @@ async def request_handler(mapping, _stream, headers, codec, release_stream):
                 _stream.reset_nowait()
             return
 
-        base_content_type, _, sub_type = content_type.partition('+')
-        sub_type = sub_type or ProtoCodec.__content_subtype__
-        if (
-            base_content_type != GRPC_CONTENT_TYPE
-            or sub_type != codec.__content_subtype__
-        ):
+        if content_type not in _content_types(codec.__content_subtype__):
             await _stream.send_headers([
                 (':status', '415'),
                 ('grpc-status', str(Status.UNKNOWN.value)),
@@ -287,6 +554,38 @@ async def request_handler(mapping, _stream, headers, codec, release_stream):
                 _stream.reset_nowait()
             return
 
+        message_encoding = headers_map.get('grpc-encoding',
+                                           compression_registry.IDENTITY)
+        if message_encoding == compression_registry.IDENTITY:
+            recv_compressor = None
+        else:
+            recv_compressor = compression_registry.get(message_encoding)
+            if recv_compressor is None:
+                await _stream.send_headers([
+                    (':status', '200'),
+                    ('grpc-status', str(Status.UNIMPLEMENTED.value)),
+                    ('grpc-message', encode_grpc_message(
+                        'Unsupported grpc-encoding: {}'
+                        .format(message_encoding)
+                    )),
+                    ('grpc-accept-encoding',
+                     compression_registry.accept_encoding()),
+                ], end_stream=True)
+                if _stream.closable:
+                    _stream.reset_nowait()
+                return
+
+        accept_encoding = headers_map.get('grpc-accept-encoding')
+        compressor = None
+        if accept_encoding is not None:
+            if compression in compression_registry.parse_accept_encoding(
+                accept_encoding
+            ):
+                compressor = compression_registry.get(compression)
+            # compression-aware client, informing it about supported
+            # encodings
+            accept_encoding = compression_registry.accept_encoding()
+
         h2_path = headers_map[':path']
         method = mapping.get(h2_path)
         if method is None:
@@ -299,8 +598,10 @@ async def request_handler(mapping, _stream, headers, codec, release_stream):
                 _stream.reset_nowait()
             return
 
+        timeout = headers_map.get('grpc-timeout')
         try:
-            deadline = Deadline.from_headers(headers)
+            deadline = (None if timeout is None
+                        else Deadline.from_timeout(decode_timeout(timeout)))
         except ValueError:
             await _stream.send_headers([
                 (':status', '200'),
@@ -311,11 +612,25 @@ async def request_handler(mapping, _stream, headers, codec, release_stream):
                 _stream.reset_nowait()
             return
 
-        metadata = decode_metadata(headers)
-
         async with Stream(_stream, method.cardinality, codec,
                           method.request_type, method.reply_type,
-                          metadata=metadata, deadline=deadline) as stream:
+                          headers=headers, deadline=deadline,
+                          codec_executor=codec_executor,
+                          compressor=compressor,
+                          recv_compressor=recv_compressor,
+                          compression_min_size=(
+                              config.compression_min_size
+                              if config is not None else 0
+                          ),
+                          accept_encoding=accept_encoding,
+                          max_receive_message_size=(
+                              config.max_receive_message_size
+                              if config is not None else None
+                          ),
+                          max_send_message_size=(
+                              config.max_send_message_size
+                              if config is not None else None
+                          )) as stream:
             deadline_wrapper = None
             try:
                 if deadline:
@@ -366,13 +681,35 @@ class Handler(_GC, AbstractHandler):
     __gc_interval__ = 10
 
     closing = False
+    protocol = None  # type: Optional[H2Protocol]
 
-    def __init__(self, mapping, codec, *, loop):
+    _idle_handle = None
+    _age_handle = None
+    _grace_handle = None
+
+    def __init__(self, mapping, codec, *, loop, config=None,
+                 codec_executor=None, compression=None, admission=None,
+                 scheduler=None, rate_limiter=None):
         self.mapping = mapping
         self.codec = codec
+        self.codec_executor = codec_executor
+        self.compression = compression
+        self.admission = admission
+        self.scheduler = scheduler
+        self.rate_limiter = rate_limiter
         self.loop = loop
+        self.config = config or Configuration()
         self._tasks = {}
         self._cancelled = set()
+        self._running = 0
+
+        if self.config.server_max_connection_age is not None:
+            jitter = random.uniform(-_MAX_AGE_JITTER, _MAX_AGE_JITTER)
+            self._age_handle = self.loop.call_later(
+                self.config.server_max_connection_age * (1 + jitter),
+                self._max_age_reached,
+            )
+        self._schedule_idle()
 
     def __gc_collect__(self):
         self._tasks = {s: t for s, t in self._tasks.items()
@@ -380,33 +717,105 @@ class Handler(_GC, AbstractHandler):
         self._cancelled = {t for t in self._cancelled
                            if not t.done()}
 
+    def _schedule_idle(self):
+        if self.config.server_max_connection_idle is not None:
+            self._idle_handle = self.loop.call_later(
+                self.config.server_max_connection_idle, self.drain,
+            )
+
+    def _max_age_reached(self):
+        self._age_handle = None
+        self.drain()
+        grace = self.config.server_max_connection_age_grace
+        if grace is not None and not self.closing:
+            self._grace_handle = self.loop.call_later(grace, self.close)
+
+    def _request_done(self, task):
+        self._running -= 1
+        if not self._running and not self.closing:
+            self._schedule_idle()
+
     def accept(self, stream, headers, release_stream):
         self.__gc_step__()
-        self._tasks[stream] = self.loop.create_task(
-            request_handler(self.mapping, stream, headers, self.codec,
-                            release_stream)
-        )
+        if self._idle_handle is not None:
+            self._idle_handle.cancel()
+            self._idle_handle = None
+        rejection = path = None
+        if self.rate_limiter is not None:
+            peer = _peer(stream) if self.rate_limiter.by_peer else None
+            rejection = self.rate_limiter.check(headers, peer)
+        if rejection is None and self.admission is not None:
+            path = dict(headers).get(':path')
+            rejection = self.admission.admit(path)
+        if rejection is not None:
+            status, message = rejection
+            task = self.loop.create_task(
+                _reject(stream, release_stream, status, message)
+            )
+        else:
+            handler = request_handler(self.mapping, stream, headers,
+                                      self.codec, release_stream,
+                                      codec_executor=self.codec_executor,
+                                      compression=self.compression,
+                                      config=self.config)
+            if self.scheduler is not None:
+                handler = _scheduled(self.scheduler, stream, headers,
+                                     release_stream, handler)
+            task = self.loop.create_task(handler)
+            if self.admission is not None:
+                task.add_done_callback(
+                    lambda _: self.admission.release(path)
+                )
+        task.add_done_callback(self._request_done)
+        self._running += 1
+        self._tasks[stream] = task
 
     def cancel(self, stream):
         task = self._tasks.pop(stream)
         task.cancel()
         self._cancelled.add(task)
 
+    def drain(self):
+        """Sends GOAWAY frame, connection is closed when all currently
+        running requests are finished
+        """
+        if self._idle_handle is not None:
+            self._idle_handle.cancel()
+            self._idle_handle = None
+        if (
+            not self.closing
+            and self.protocol is not None
+            and self.protocol.processor is not None
+        ):
+            self.protocol.processor.drain()
+
     def close(self):
+        for handle in (self._idle_handle, self._age_handle,
+                       self._grace_handle):
+            if handle is not None:
+                handle.cancel()
+        self._idle_handle = self._age_handle = self._grace_handle = None
         for task in self._tasks.values():
             task.cancel()
         self._cancelled.update(self._tasks.values())
         self.closing = True
 
     async def wait_closed(self):
-        if self._cancelled:
-            await asyncio.wait(self._cancelled, loop=self.loop)
+        tasks = set(self._tasks.values()) | self._cancelled
+        if tasks:
+            await asyncio.wait(tasks, loop=self.loop)
 
     def check_closed(self):
         self.__gc_collect__()
         return not self._tasks and not self._cancelled
 
 
+def _refused_streams(handler):
+    if handler.protocol is None or handler.protocol.connection is None:
+        return 0
+    return handler.protocol.connection.refused_streams
+
+
 class Server(_GC, asyncio.AbstractServer):
     """
     HTTP/2 server, which uses gRPC service handlers to handle requests.
@@ -427,35 +836,98 @@ class Server(_GC, asyncio.AbstractServer):
     """
     __gc_interval__ = 10
 
-    def __init__(self, handlers, *, loop, codec=None):
+    def __init__(self, handlers, *, loop, codec=None, config=None,
+                 executor=None, compression=None, admission=None,
+                 scheduler=None, rate_limiter=None):
         """
         :param handlers: list of handlers
         :param loop: asyncio-compatible event loop
+        :param config: :py:class:`~grpclib.config.Configuration` object to
+            tune connection options
+        :param executor: :py:class:`~python:concurrent.futures.Executor`
+            to run :py:func:`blocking` method handlers and to encode and
+            decode large messages (see ``codec_executor_threshold`` option),
+            default executor of the event loop is used by default
+        :param compression: name of the encoding to compress replies
+            (e.g. ``'gzip'``), if client supports it, see
+            :py:mod:`grpclib.compression`
+        :param admission: :py:class:`~grpclib.admission.AdmissionControl`
+            object to reject new requests, when server is overloaded
+        :param scheduler: :py:class:`~grpclib.admission.PriorityScheduler`
+            object to run requests according to their priority
+        :param rate_limiter: :py:class:`~grpclib.admission.RateLimiter`
+            object to limit rate of the requests
         """
         mapping = {}
         for handler in handlers:
             mapping.update(handler.__mapping__())
+        for name, method in mapping.items():
+            func = getattr(method, 'func', None)
+            if getattr(func, '__blocking__', False):
+                mapping[name] = method._replace(func=functools.partial(
+                    _blocking_handler, method, loop=loop, executor=executor,
+                ))
 
         self._mapping = mapping
         self._loop = loop
         self._codec = codec or ProtoCodec()
-        self._config = h2.config.H2Configuration(
+        compression_registry.validate(compression)
+        self._compression = compression
+        self._admission = admission
+        self._scheduler = scheduler
+        self._rate_limiter = rate_limiter
+        self._config = config or Configuration()
+        self._codec_executor = None
+        if self._config.codec_executor_threshold is not None:
+            if isinstance(executor, concurrent.futures.ProcessPoolExecutor):
+                # messages would be encoded once again to pass them
+                # between processes
+                executor = None
+            self._codec_executor = CodecExecutor(
+                self._config.codec_executor_threshold, loop=loop,
+                executor=executor,
+            )
+        self._h2_config = h2.config.H2Configuration(
             client_side=False,
             header_encoding='ascii',
         )
 
         self._server = None
         self._handlers = set()
+        # refused streams of the already collected handlers
+        self._refused_streams = 0
 
     def __gc_collect__(self):
-        self._handlers = {h for h in self._handlers
-                          if not (h.closing and h.check_closed())}
+        handlers = set()
+        for handler in self._handlers:
+            if handler.closing and handler.check_closed():
+                self._refused_streams += _refused_streams(handler)
+            else:
+                handlers.add(handler)
+        self._handlers = handlers
+
+    @property
+    def refused_streams(self) -> int:
+        """Number of incoming streams, refused with REFUSED_STREAM error
+        code, because of the ``http2_max_concurrent_streams`` limit or
+        graceful shutdown
+        """
+        return self._refused_streams + sum(map(_refused_streams,
+                                               self._handlers))
 
     def _protocol_factory(self):
         self.__gc_step__()
-        handler = Handler(self._mapping, self._codec, loop=self._loop)
+        handler = Handler(self._mapping, self._codec, loop=self._loop,
+                          config=self._config,
+                          codec_executor=self._codec_executor,
+                          compression=self._compression,
+                          admission=self._admission,
+                          scheduler=self._scheduler,
+                          rate_limiter=self._rate_limiter)
         self._handlers.add(handler)
-        return H2Protocol(handler, self._config, loop=self._loop)
+        handler.protocol = H2Protocol(handler, self._h2_config,
+                                      loop=self._loop, config=self._config)
+        return handler.protocol
 
     async def start(self, host=None, port=None, *, path=None,
                     family=socket.AF_UNSPEC, flags=socket.AI_PASSIVE,
@@ -515,14 +987,30 @@ class Server(_GC, asyncio.AbstractServer):
                 reuse_address=reuse_address, reuse_port=reuse_port
             )
 
-    def close(self):
+    def close(self, *, grace=None):
         """Stops accepting new connections, cancels all currently running
         requests. Request handlers are able to handle `CancelledError` and
         exit properly.
+
+        :param grace: if specified, server sends GOAWAY frame to every client
+            and refuses new requests, currently running requests are able to
+            finish during this period of time (seconds), and only then they
+            are cancelled. Connections are closed as soon as all their
+            requests are finished.
         """
         if self._server is None:
             raise RuntimeError('Server is not started')
         self._server.close()
+        if self._admission is not None:
+            self._admission.close()
+        if grace is None:
+            self._cancel_handlers()
+        else:
+            for handler in self._handlers:
+                handler.drain()
+            self._loop.call_later(grace, self._cancel_handlers)
+
+    def _cancel_handlers(self):
         for handler in self._handlers:
             handler.close()
 
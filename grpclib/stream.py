@@ -1,34 +1,147 @@
 import sys
 import abc
-import struct
+
+from .const import Status
+from .exceptions import GRPCError
 
 
 _PY352 = (sys.version_info >= (3, 5, 2))
 
 
-async def recv_message(stream, codec, message_type):
-    meta = await stream.recv_data(5)
-    if not meta:
+def check_message_size(message_bin, max_size):
+    if max_size is not None and len(message_bin) > max_size:
+        raise GRPCError(Status.RESOURCE_EXHAUSTED,
+                        'Sending message larger than max ({} vs. {})'
+                        .format(len(message_bin), max_size))
+
+
+async def recv_message_bin(stream, *, compressor=None, codec_executor=None,
+                           max_size=None):
+    message_data = await stream.recv_message_data(max_size=max_size)
+    if message_data is None:
         return
 
-    compressed_flag = struct.unpack('?', meta[:1])[0]
+    compressed_flag, message_bin = message_data
     if compressed_flag:
-        raise NotImplementedError('Compression not implemented')
-
-    message_len = struct.unpack('>I', meta[1:])[0]
-    message_bin = await stream.recv_data(message_len)
-    assert len(message_bin) == message_len, \
-        '{} != {}'.format(len(message_bin), message_len)
-    message = codec.decode(message_bin, message_type)
-    return message
-
-
-async def send_message(stream, codec, message, message_type, *, end=False):
-    reply_bin = codec.encode(message, message_type)
-    reply_data = (struct.pack('?', False)
-                  + struct.pack('>I', len(reply_bin))
-                  + reply_bin)
-    await stream.send_data(reply_data, end_stream=end)
+        if codec_executor is not None:
+            message_bin = await codec_executor.decompress(
+                compressor, message_bin, max_size,
+            )
+        else:
+            message_bin = decompress_message(compressor, message_bin,
+                                             max_size)
+    return message_bin
+
+
+def decompress_message(compressor, message_bin, max_size):
+    if compressor is None:
+        raise GRPCError(Status.INTERNAL,
+                        'Compressed message received, but compression '
+                        'was not negotiated')
+    message_bin = compressor.decompress(bytes(message_bin),
+                                        max_length=max_size)
+    if max_size is not None and len(message_bin) > max_size:
+        # decompression could be stopped as soon as limit was exceeded
+        raise GRPCError(Status.RESOURCE_EXHAUSTED,
+                        'Received message larger than max ({})'
+                        .format(max_size))
+    return message_bin
+
+
+class CodecExecutor:
+    """Encodes and decodes large messages in the executor, so they wouldn't
+    block event loop, small messages are processed inline
+    """
+
+    def __init__(self, threshold, *, loop, executor=None):
+        self._threshold = threshold
+        self._loop = loop
+        self._executor = executor
+
+    async def encode(self, codec, message, message_type):
+        size = codec.size_hint(message)
+        if size is not None and size >= self._threshold:
+            return await self._loop.run_in_executor(
+                self._executor, codec.encode, message, message_type,
+            )
+        return codec.encode(message, message_type)
+
+    async def decode(self, codec, data, message_type):
+        if len(data) >= self._threshold:
+            return await self._loop.run_in_executor(
+                self._executor, codec.decode, data, message_type,
+            )
+        return codec.decode(data, message_type)
+
+    async def compress(self, compressor, data):
+        if len(data) >= self._threshold:
+            return await self._loop.run_in_executor(
+                self._executor, compressor.compress, data,
+            )
+        return compressor.compress(data)
+
+    async def decompress(self, compressor, data, max_size=None):
+        if len(data) >= self._threshold:
+            return await self._loop.run_in_executor(
+                self._executor, decompress_message, compressor, data, max_size,
+            )
+        return decompress_message(compressor, data, max_size)
+
+
+async def encode_message(codec, message, message_type, *,
+                         codec_executor=None):
+    if codec_executor is not None:
+        return await codec_executor.encode(codec, message, message_type)
+    return codec.encode(message, message_type)
+
+
+async def compress_message(message_bin, compressor, min_size, *,
+                           codec_executor=None):
+    """Returns tuple of the compressed flag and message data"""
+    if (
+        codec_executor is None
+        or compressor is None
+        or len(message_bin) < min_size
+    ):
+        return compress_message_nowait(message_bin, compressor, min_size)
+    message_bin = await codec_executor.compress(compressor, message_bin)
+    return True, message_bin
+
+
+def compress_message_nowait(message_bin, compressor, min_size):
+    """Returns tuple of the compressed flag and message data"""
+    if compressor is None or len(message_bin) < min_size:
+        return False, message_bin
+    return True, compressor.compress(message_bin)
+
+
+async def recv_message(stream, codec, message_type, *, codec_executor=None,
+                       compressor=None, max_size=None):
+    message_bin = await recv_message_bin(stream, compressor=compressor,
+                                         codec_executor=codec_executor,
+                                         max_size=max_size)
+    if message_bin is None:
+        return
+
+    if not codec.__buffer_protocol__:
+        message_bin = bytes(message_bin)
+    if codec_executor is not None:
+        return await codec_executor.decode(codec, message_bin, message_type)
+    return codec.decode(message_bin, message_type)
+
+
+async def send_message(stream, codec, message, message_type, *, end=False,
+                       codec_executor=None, compressor=None,
+                       compression_min_size=0, max_size=None):
+    reply_bin = await encode_message(codec, message, message_type,
+                                     codec_executor=codec_executor)
+    check_message_size(reply_bin, max_size)
+    compressed, reply_bin = await compress_message(
+        reply_bin, compressor, compression_min_size,
+        codec_executor=codec_executor,
+    )
+    await stream.send_message_data(reply_bin, end_stream=end,
+                                   compressed=compressed)
 
 
 async def _ident(value):
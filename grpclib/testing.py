@@ -50,6 +50,7 @@ class ChannelFor:
             assert response.message == 'Hello, Dr. Strange!'
     """
     _channel = None
+    _channel_protocol = None
     _server = None
     _server_protocol = None
 
@@ -70,18 +71,19 @@ class ChannelFor:
         self._server_protocol = self._server._protocol_factory()
 
         self._channel = Channel(loop=loop)
-        self._channel._protocol = self._channel._protocol_factory()
+        self._channel_protocol = self._channel._protocol_factory()
+        self._channel._protocols = [self._channel_protocol]
 
-        self._channel._protocol.connection_made(
+        self._channel_protocol.connection_made(
             _InMemoryTransport(self._server_protocol, loop=loop)
         )
         self._server_protocol.connection_made(
-            _InMemoryTransport(self._channel._protocol, loop=loop)
+            _InMemoryTransport(self._channel_protocol, loop=loop)
         )
         return self._channel
 
     async def __aexit__(self, exc_type, exc_val, exc_tb):
-        self._channel._protocol.connection_lost(None)
+        self._channel_protocol.connection_lost(None)
         self._channel.close()
 
         self._server_protocol.connection_lost(None)
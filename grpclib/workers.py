@@ -0,0 +1,340 @@
+import os
+import time
+import signal
+import socket
+import asyncio
+import logging
+import multiprocessing
+import multiprocessing.connection
+
+from typing import Dict, List, Optional  # noqa
+
+from .server import Server
+
+
+log = logging.getLogger(__name__)
+
+DEFAULT_GRACE = 10.
+DEFAULT_STATS_INTERVAL = 5.
+
+_RESTART_DELAY = 1.
+_MAX_RESTART_DELAY = 30.
+# worker, which exited sooner than this, is considered as crashing on start
+_MIN_UPTIME = 1.
+# additional time for the workers to exit after grace period
+_EXIT_TIMEOUT = 5.
+
+_STOP_SIGNALS = (signal.SIGTERM, signal.SIGINT)
+
+
+def _server_stats(server):
+    handlers = [h for h in server._handlers if not h.closing]
+    return {
+        'pid': os.getpid(),
+        'connections': len(handlers),
+        'requests': sum(h._running for h in handlers),
+        'refused_streams': server.refused_streams,
+    }
+
+
+async def _serve(handlers_factory, host, port, start_kwargs, *, loop, codec,
+                 config, rate_limiter, server_kwargs_factory, grace,
+                 stats_interval, stats_conn):
+    server_kwargs = {}
+    if server_kwargs_factory is not None:
+        server_kwargs = server_kwargs_factory(loop)
+    server = Server(handlers_factory(loop), loop=loop, codec=codec,
+                    config=config, rate_limiter=rate_limiter, **server_kwargs)
+    await server.start(host, port, reuse_port=True, **start_kwargs)
+
+    stop = asyncio.Event(loop=loop)
+    for sig in _STOP_SIGNALS:
+        loop.add_signal_handler(sig, stop.set)
+
+    while not stop.is_set():
+        stats_conn.send(_server_stats(server))
+        try:
+            await asyncio.wait_for(stop.wait(), stats_interval, loop=loop)
+        except asyncio.TimeoutError:
+            pass
+
+    server.close(grace=grace)
+    await server.wait_closed()
+
+
+def _worker_main(handlers_factory, host, port, start_kwargs, *, codec, config,
+                 rate_limiter, server_kwargs_factory, grace, stats_interval,
+                 stats_conn):
+    # signal handlers of the parent process are inherited
+    for sig in _STOP_SIGNALS:
+        signal.signal(sig, signal.SIG_DFL)
+    signal.set_wakeup_fd(-1)
+
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    try:
+        loop.run_until_complete(_serve(
+            handlers_factory, host, port, start_kwargs, loop=loop,
+            codec=codec, config=config, rate_limiter=rate_limiter,
+            server_kwargs_factory=server_kwargs_factory, grace=grace,
+            stats_interval=stats_interval, stats_conn=stats_conn,
+        ))
+    finally:
+        loop.close()
+
+
+class _Worker:
+    process = None
+    stats_conn = None
+    started_at = None
+    restart_at = None
+    restart_delay = _RESTART_DELAY
+
+    def __init__(self, index):
+        self.index = index
+        self.restarts = 0
+        self.stats = {}  # type: Dict
+
+
+class Workers:
+    """
+    Runs :py:class:`~grpclib.server.Server` in multiple worker processes,
+    to use all CPU cores
+
+    .. code-block:: python
+
+        def handlers_factory(loop):
+            return [CoffeeMachine(loop=loop)]
+
+        workers = Workers(handlers_factory, workers=4)
+        workers.run('0.0.0.0', 50051)
+
+    Every worker process runs it's own event loop and
+    :py:class:`~grpclib.server.Server`, bound to the same port using
+    ``SO_REUSEPORT`` socket option, so the kernel distributes incoming
+    connections between workers. This option is supported only on Linux
+    and recent BSD systems, and workers are created using ``fork``, so
+    Windows is not supported.
+
+    Parent process restarts crashed workers, and on ``SIGTERM`` or ``SIGINT``
+    it asks workers to shut down gracefully: every worker sends GOAWAY frame
+    to it's clients and waits for running requests to finish.
+    """
+
+    def __init__(self, handlers_factory, *, workers=None, codec=None,
+                 config=None, rate_limiter=None, server_kwargs_factory=None,
+                 grace=DEFAULT_GRACE, stats_interval=DEFAULT_STATS_INTERVAL,
+                 on_stats=None):
+        """
+        :param handlers_factory: callable, which accepts event loop and
+            returns list of handlers, it is called in every worker process
+        :param workers: number of worker processes, number of CPU cores by
+            default
+        :param codec: codec, used by every server
+        :param config: :py:class:`~grpclib.config.Configuration` object,
+            used by every server
+        :param rate_limiter: :py:class:`~grpclib.admission.RateLimiter`
+            object, used by every server, with
+            :py:class:`~grpclib.admission.SharedMemoryBackend` workers
+            enforce one combined limit
+        :param server_kwargs_factory: callable, which accepts event loop and
+            returns dict of additional :py:class:`~grpclib.server.Server`
+            keyword arguments, like ``admission``, ``scheduler``,
+            ``executor`` or ``compression``, it is called in every worker
+            process
+        :param grace: how long workers wait for running requests to finish
+            during graceful shutdown (seconds)
+        :param stats_interval: how often workers report their stats
+            (seconds)
+        :param on_stats: callable, which is called in the parent process
+            with aggregated stats (see :py:meth:`stats`), when they are
+            updated
+        """
+        if workers is None:
+            workers = os.cpu_count() or 1
+        if not isinstance(workers, int) or workers < 1:
+            raise ValueError('Invalid workers: {!r}'.format(workers))
+        if not hasattr(socket, 'SO_REUSEPORT'):
+            raise RuntimeError('SO_REUSEPORT is not supported on this '
+                               'platform')
+        self._handlers_factory = handlers_factory
+        self._codec = codec
+        self._config = config
+        self._rate_limiter = rate_limiter
+        self._server_kwargs_factory = server_kwargs_factory
+        self._grace = grace
+        self._stats_interval = stats_interval
+        self._on_stats = on_stats
+        self._context = multiprocessing.get_context('fork')
+        self._workers = [_Worker(i) for i in range(workers)]
+        self._stopping = False
+
+    def stats(self) -> Dict:
+        """Returns last stats, reported by workers
+
+        Stats contain total number of ``connections``, running
+        ``requests`` and ``refused_streams``, number of worker
+        ``restarts``, and stats of every worker in the ``workers`` list.
+        """
+        workers = []
+        for worker in self._workers:
+            stats = dict(worker.stats, restarts=worker.restarts)
+            if worker.process is not None:
+                stats['pid'] = worker.process.pid
+            workers.append(stats)
+        return {
+            'connections': sum(w.get('connections', 0) for w in workers),
+            'requests': sum(w.get('requests', 0) for w in workers),
+            'refused_streams': sum(w.get('refused_streams', 0)
+                                   for w in workers),
+            'restarts': sum(w['restarts'] for w in workers),
+            'workers': workers,
+        }
+
+    def _start(self, worker, host, port, start_kwargs):
+        stats_conn, child_conn = self._context.Pipe(duplex=False)
+        process = self._context.Process(
+            target=_worker_main,
+            args=(self._handlers_factory, host, port, start_kwargs),
+            kwargs=dict(codec=self._codec, config=self._config,
+                        rate_limiter=self._rate_limiter,
+                        server_kwargs_factory=self._server_kwargs_factory,
+                        grace=self._grace,
+                        stats_interval=self._stats_interval,
+                        stats_conn=child_conn),
+            name='grpclib-worker-{}'.format(worker.index),
+        )
+        process.start()
+        child_conn.close()
+        worker.process = process
+        worker.stats_conn = stats_conn
+        worker.started_at = time.monotonic()
+        worker.restart_at = None
+        worker.stats = {}
+
+    def _exited(self, worker):
+        exitcode = worker.process.exitcode
+        worker.process = None
+        worker.stats_conn.close()
+        worker.stats_conn = None
+        worker.stats = {}
+        if self._stopping:
+            return
+        log.warning('Worker %d exited with code %r, restarting',
+                    worker.index, exitcode)
+        # crashing workers are restarted with a growing delay
+        if time.monotonic() - worker.started_at < _MIN_UPTIME:
+            worker.restart_at = time.monotonic() + worker.restart_delay
+            worker.restart_delay = min(worker.restart_delay * 2,
+                                       _MAX_RESTART_DELAY)
+        else:
+            worker.restart_at = time.monotonic()
+            worker.restart_delay = _RESTART_DELAY
+        worker.restarts += 1
+
+    def _receive_stats(self, worker):
+        updated = False
+        try:
+            while worker.stats_conn.poll():
+                worker.stats = worker.stats_conn.recv()
+                updated = True
+        except (EOFError, OSError):
+            pass
+        return updated
+
+    def _stop(self):
+        if self._stopping:
+            return
+        self._stopping = True
+        log.info('Stopping workers')
+        for worker in self._workers:
+            if worker.process is not None and worker.process.is_alive():
+                os.kill(worker.process.pid, signal.SIGTERM)
+
+    def run(self, host=None, port=None, **kwargs):
+        """Starts workers and supervises them until ``SIGTERM`` or
+        ``SIGINT`` is received, this method blocks until all workers exit
+
+        Accepts same arguments as :py:meth:`Server.start()
+        <grpclib.server.Server.start>`, except ``reuse_port``, which is
+        always enabled.
+        """
+        if 'reuse_port' in kwargs:
+            raise ValueError("The 'reuse_port' parameter is always enabled")
+
+        wakeup_r, wakeup_w = socket.socketpair()
+        wakeup_r.setblocking(False)
+        wakeup_w.setblocking(False)
+        received = []
+        prev_handlers = {sig: signal.signal(sig, lambda s, f: received
+                                            .append(s))
+                         for sig in _STOP_SIGNALS}
+        prev_wakeup_fd = signal.set_wakeup_fd(wakeup_w.fileno())
+        try:
+            for worker in self._workers:
+                self._start(worker, host, port, kwargs)
+            self._supervise(host, port, kwargs, wakeup_r, received)
+        finally:
+            signal.set_wakeup_fd(prev_wakeup_fd)
+            for sig, handler in prev_handlers.items():
+                signal.signal(sig, handler)
+            wakeup_r.close()
+            wakeup_w.close()
+            for worker in self._workers:
+                if worker.process is not None and worker.process.is_alive():
+                    worker.process.kill()
+                    worker.process.join()
+
+    def _supervise(self, host, port, start_kwargs, wakeup, received):
+        stop_deadline = None
+        while True:
+            if received:
+                del received[:]
+                self._stop()
+                stop_deadline = (time.monotonic() + self._grace
+                                 + _EXIT_TIMEOUT)
+
+            now = time.monotonic()
+            running = [w for w in self._workers if w.process is not None]
+            if self._stopping:
+                if not running:
+                    return
+                if now >= stop_deadline:
+                    log.warning('Workers did not exit in time, killing them')
+                    return
+                timeout = stop_deadline - now
+            else:
+                for worker in self._workers:
+                    if worker.process is None and worker.restart_at <= now:
+                        self._start(worker, host, port, start_kwargs)
+                restart_at = [w.restart_at for w in self._workers
+                              if w.process is None]
+                timeout = max(min(restart_at) - now, 0) if restart_at \
+                    else None
+
+            objects = [wakeup]  # type: List
+            for worker in self._workers:
+                if worker.process is not None:
+                    objects.extend((worker.process.sentinel,
+                                    worker.stats_conn))
+            ready = multiprocessing.connection.wait(objects, timeout)
+
+            if wakeup in ready:
+                try:
+                    while wakeup.recv(4096):
+                        pass
+                except BlockingIOError:
+                    pass
+
+            updated = False
+            for worker in self._workers:
+                if worker.process is None:
+                    continue
+                if worker.stats_conn in ready:
+                    updated = self._receive_stats(worker) or updated
+                if worker.process.sentinel in ready:
+                    worker.process.join()
+                    self._exited(worker)
+                    updated = True
+            if updated and self._on_stats is not None:
+                self._on_stats(self.stats())
@@ -21,7 +21,7 @@ setup(
     packages=find_packages(),
     license='BSD',
     python_requires='>=3.5',
-    install_requires=['h2', 'multidict'],
+    install_requires=['h2>=3.1.0', 'multidict'],
     entry_points={
         'console_scripts': [
             'protoc-gen-python_grpc=grpclib.plugin.main:main',
@@ -12,6 +12,13 @@ from grpclib.encoding.proto import ProtoCodec
 from stubs import TransportStub, ChannelStub, DummyHandler
 
 
+def free_port():
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.bind(('127.0.0.1', 0))
+        _, port = s.getsockname()
+    return port
+
+
 def grpc_encode(message, message_type=None, codec=ProtoCodec()):
     message_bin = codec.encode(message, message_type)
     header = struct.pack('?', False) + struct.pack('>I', len(message_bin))
@@ -131,9 +138,7 @@ class ClientServer:
 
     async def __aenter__(self):
         host = '127.0.0.1'
-        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-            s.bind(('127.0.0.1', 0))
-            _, port = s.getsockname()
+        port = free_port()
 
         handler = self.handler_cls()
         self.server = server.Server([handler], loop=self.loop, codec=self.codec)
@@ -6,6 +6,7 @@ from grpclib.protocol import AbstractHandler
 
 
 class TransportStub(asyncio.Transport):
+    closed = False
 
     def __init__(self, connection):
         super().__init__()
@@ -36,10 +37,11 @@ class TransportStub(asyncio.Transport):
             self._events.extend(self._connection.receive_data(data))
 
     def is_closing(self):
-        return self._connection.state_machine.state is ConnectionState.CLOSED
+        return (self.closed or self._connection.state_machine.state
+                is ConnectionState.CLOSED)
 
     def close(self):
-        pass
+        self.closed = True
 
 
 class DummyHandler(AbstractHandler):
@@ -0,0 +1,364 @@
+import time
+import asyncio
+import multiprocessing
+
+from unittest.mock import patch
+
+import pytest
+
+from grpclib.const import Status
+from grpclib.client import Channel
+from grpclib.server import Server
+from grpclib.admission import AdmissionControl, PriorityScheduler
+from grpclib.admission import PriorityClass, RateLimiter, RateLimit
+from grpclib.admission import LocalBackend, SharedMemoryBackend
+from grpclib.exceptions import GRPCError
+
+from dummy_pb2 import DummyRequest, DummyReply
+from dummy_grpc import DummyServiceStub
+from test_functional import DummyService
+from conn import free_port
+
+
+UNARY = '/dummy.DummyService/UnaryUnary'
+STREAM = '/dummy.DummyService/StreamStream'
+
+
+def test_invalid_arguments(loop):
+    with pytest.raises(ValueError):
+        AdmissionControl(max_in_flight=0, loop=loop)
+    with pytest.raises(ValueError):
+        AdmissionControl(max_loop_lag=0, loop=loop)
+    with pytest.raises(ValueError):
+        AdmissionControl(lag_interval=0, loop=loop)
+    with pytest.raises(ValueError):
+        AdmissionControl(method_limits={UNARY: 0}, loop=loop)
+
+
+def test_max_in_flight(loop):
+    admission = AdmissionControl(max_in_flight=2, method_limits={
+        UNARY: 1,
+        STREAM: None,
+    }, loop=loop)
+    assert admission.admit(UNARY) is None
+    assert admission.admit(UNARY) == (Status.RESOURCE_EXHAUSTED,
+                                      'Too many requests')
+    assert admission.admit('/dummy.DummyService/UnaryStream') is None
+    assert admission.admit('/dummy.DummyService/UnaryStream') == \
+        (Status.RESOURCE_EXHAUSTED, 'Too many requests')
+    # exempt method
+    assert admission.admit(STREAM) is None
+    assert admission.in_flight == 2
+
+    admission.release(UNARY)
+    admission.release(STREAM)
+    assert admission.in_flight == 1
+    assert admission.admit(UNARY) is None
+
+
+@pytest.mark.asyncio
+async def test_loop_lag(loop):
+    admission = AdmissionControl(max_loop_lag=0.01, lag_interval=0.05,
+                                 loop=loop)
+    try:
+        assert admission.admit(UNARY) is None
+
+        # short burst is tolerated
+        time.sleep(0.03)
+        await asyncio.sleep(0, loop=loop)
+        assert not admission.overloaded
+
+        # standing queue
+        for _ in range(10):
+            time.sleep(0.02)
+            await asyncio.sleep(0, loop=loop)
+        assert admission.overloaded
+        assert admission.admit(UNARY) == (Status.UNAVAILABLE,
+                                          'Server is overloaded')
+
+        await asyncio.sleep(0.02, loop=loop)
+        assert not admission.overloaded
+        assert admission.admit(UNARY) is None
+    finally:
+        admission.close()
+
+
+@pytest.mark.asyncio
+async def test_server(loop):
+    port = free_port()
+    admission = AdmissionControl(max_in_flight=1, loop=loop)
+    service = DummyService()
+    server = Server([service], loop=loop, admission=admission)
+    await server.start('127.0.0.1', port)
+    channel = Channel('127.0.0.1', port, loop=loop)
+    stub = DummyServiceStub(channel)
+    try:
+        async with stub.StreamStream.open() as stream:
+            await stream.send_message(DummyRequest(value='ping'))
+            assert await stream.recv_message() == DummyReply(value='ping')
+
+            with pytest.raises(GRPCError) as err:
+                await stub.UnaryUnary(DummyRequest(value='ping'))
+            assert err.value.status == Status.RESOURCE_EXHAUSTED
+            assert err.value.message == 'Too many requests'
+            # rejected request wasn't decoded and handled
+            assert service.log == [DummyRequest(value='ping')]
+
+            await stream.end()
+            assert await stream.recv_message() is None
+
+        await asyncio.sleep(0.01, loop=loop)
+        assert admission.in_flight == 0
+        reply = await stub.UnaryUnary(DummyRequest(value='ping'))
+        assert reply == DummyReply(value='pong')
+    finally:
+        channel.close()
+        server.close()
+        await server.wait_closed()
+
+
+def create_scheduler(loop, **kwargs):
+    return PriorityScheduler([PriorityClass('high', 3),
+                              PriorityClass('low', 1)],
+                             loop=loop, **kwargs)
+
+
+def test_classify(loop):
+    scheduler = create_scheduler(loop, max_concurrency=1,
+                                 methods={UNARY: 'high'},
+                                 metadata_key='x-priority')
+    assert scheduler.classify([(':path', UNARY)]) == 'high'
+    assert scheduler.classify([(':path', STREAM)]) == 'low'
+    assert scheduler.classify([(':path', STREAM),
+                               ('x-priority', 'high')]) == 'high'
+    assert scheduler.classify([(':path', UNARY),
+                               ('x-priority', 'low')]) == 'low'
+    assert scheduler.classify([(':path', UNARY),
+                               ('x-priority', 'unknown')]) == 'high'
+
+    with pytest.raises(ValueError):
+        create_scheduler(loop, max_concurrency=1, methods={UNARY: 'unknown'})
+    with pytest.raises(ValueError):
+        PriorityScheduler([('high', 0)], max_concurrency=1, loop=loop)
+
+
+@pytest.mark.asyncio
+async def test_weighted_scheduling(loop):
+    scheduler = create_scheduler(loop, max_concurrency=4, max_queued=100)
+    order = []
+
+    async def request(name):
+        await scheduler.acquire(name)
+        order.append(name)
+
+    for _ in range(4):
+        await scheduler.acquire('low')
+    tasks = [loop.create_task(request(name))
+             for name in ['low'] * 4 + ['high'] * 4]
+    await asyncio.sleep(0, loop=loop)
+    assert scheduler.queued == 8
+
+    # high priority class gets 3 slots of 4
+    for _ in range(4):
+        scheduler.release('low')
+    await asyncio.sleep(0, loop=loop)
+    assert sorted(order) == ['high', 'high', 'high', 'low']
+
+    for name in order[:]:
+        scheduler.release(name)
+    await asyncio.wait(tasks, loop=loop)
+    assert scheduler.running == 4
+    assert scheduler.queued == 0
+
+
+@pytest.mark.asyncio
+async def test_shedding(loop):
+    scheduler = create_scheduler(loop, max_concurrency=1, max_queued=1)
+    await scheduler.acquire('high')
+
+    low = loop.create_task(scheduler.acquire('low'))
+    await asyncio.sleep(0, loop=loop)
+
+    # queued request of the lower class is shed
+    high = loop.create_task(scheduler.acquire('high'))
+    await asyncio.sleep(0, loop=loop)
+    with pytest.raises(GRPCError) as err:
+        await low
+    assert err.value.status == Status.RESOURCE_EXHAUSTED
+
+    # nothing to shed
+    with pytest.raises(GRPCError):
+        await scheduler.acquire('high')
+
+    # cancelled request frees its place in the queue
+    high.cancel()
+    await asyncio.sleep(0, loop=loop)
+    assert scheduler.queued == 0
+    scheduler.release('high')
+    assert scheduler.running == 0
+
+
+@pytest.mark.asyncio
+async def test_scheduler_server(loop):
+    port = free_port()
+    scheduler = create_scheduler(loop, max_concurrency=1, max_queued=1)
+    server = Server([DummyService()], loop=loop, scheduler=scheduler)
+    await server.start('127.0.0.1', port)
+    channel = Channel('127.0.0.1', port, loop=loop)
+    stub = DummyServiceStub(channel)
+    try:
+        async with stub.StreamStream.open() as stream:
+            await stream.send_message(DummyRequest(value='ping'))
+            assert await stream.recv_message() == DummyReply(value='ping')
+
+            queued = loop.create_task(
+                stub.UnaryUnary(DummyRequest(value='ping')),
+            )
+            await asyncio.sleep(0.05, loop=loop)
+            assert scheduler.queued == 1
+
+            with pytest.raises(GRPCError) as err:
+                await stub.UnaryUnary(DummyRequest(value='ping'))
+            assert err.value.status == Status.RESOURCE_EXHAUSTED
+            assert not queued.done()
+
+            await stream.end()
+            assert await stream.recv_message() is None
+
+        reply = await asyncio.wait_for(queued, 1, loop=loop)
+        assert reply == DummyReply(value='pong')
+    finally:
+        channel.close()
+        server.close()
+        await server.wait_closed()
+
+
+def test_rate_limit():
+    with pytest.raises(ValueError):
+        RateLimit(0)
+    with pytest.raises(ValueError):
+        RateLimit(1, burst=0.5)
+    assert RateLimit(10) == RateLimit(10, burst=1)
+
+
+@pytest.mark.parametrize('backend_type', [LocalBackend, SharedMemoryBackend])
+def test_token_bucket(backend_type):
+    backend = backend_type()
+    limit = RateLimit(10, burst=2)
+    with patch('grpclib.admission.time.monotonic', return_value=1.):
+        assert backend.consume('foo', limit)
+        assert backend.consume('foo', limit)
+        assert not backend.consume('foo', limit)
+        assert backend.consume('bar', limit)
+    with patch('grpclib.admission.time.monotonic', return_value=1.15):
+        assert backend.consume('foo', limit)
+        assert not backend.consume('foo', limit)
+    with patch('grpclib.admission.time.monotonic', return_value=10.):
+        assert backend.consume('foo', limit)
+        assert backend.consume('foo', limit)
+        assert not backend.consume('foo', limit)
+
+
+def test_local_backend_max_keys():
+    with pytest.raises(ValueError):
+        LocalBackend(max_keys=0)
+    backend = LocalBackend(max_keys=2)
+    limit = RateLimit(10, burst=2)
+    with patch('grpclib.admission.time.monotonic', return_value=1.):
+        assert backend.consume('foo', limit)
+        assert backend.consume('bar', limit)
+        assert backend.consume('foo', limit)
+        # least recently used bucket of the "bar" key is dropped
+        assert backend.consume('baz', limit)
+        assert list(backend._buckets) == ['foo', 'baz']
+        assert not backend.consume('foo', limit)
+        assert backend.consume('bar', limit)
+        assert list(backend._buckets) == ['foo', 'bar']
+
+
+def test_shared_memory_backend_collisions():
+    backend = SharedMemoryBackend(size=2)
+    limit = RateLimit(10, burst=1)
+    # all keys have the same hash
+    fingerprints = {'foo': 2, 'bar': 4, 'baz': 6}
+    with patch('grpclib.admission._fingerprint', fingerprints.get), \
+            patch('grpclib.admission.time.monotonic', return_value=1.):
+        assert backend.consume('foo', limit)
+        # keys have separate buckets
+        assert backend.consume('bar', limit)
+        assert list(backend._keys) == [2, 4]
+        assert not backend.consume('foo', limit)
+        assert not backend.consume('bar', limit)
+        # table is full, local bucket is used
+        assert backend.consume('baz', limit)
+        assert not backend.consume('baz', limit)
+        assert list(backend._keys) == [2, 4]
+    with patch('grpclib.admission._fingerprint', fingerprints.get), \
+            patch('grpclib.admission.time.monotonic', return_value=1.1):
+        # fully refilled buckets are replaced
+        assert backend.consume('baz', limit)
+        assert list(backend._keys) == [6, 4]
+        assert not backend.consume('baz', limit)
+        assert backend.consume('foo', limit)
+        assert list(backend._keys) == [6, 2]
+
+
+def _consume(backend, count):
+    for _ in range(count):
+        backend.consume('foo', RateLimit(0.001, burst=10))
+
+
+def test_shared_memory_backend():
+    backend = SharedMemoryBackend()
+    process = multiprocessing.get_context('fork').Process(
+        target=_consume, args=(backend, 9),
+    )
+    process.start()
+    process.join()
+    assert backend.consume('foo', RateLimit(0.001, burst=10))
+    assert not backend.consume('foo', RateLimit(0.001, burst=10))
+
+
+def test_rate_limiter_keys():
+    limiter = RateLimiter(default=RateLimit(0.001), methods={STREAM: None},
+                          metadata_keys=['x-tenant'], by_peer=True)
+    foo = [(':path', UNARY), ('x-tenant', 'foo')]
+    bar = [(':path', UNARY), ('x-tenant', 'bar')]
+    assert limiter.check(foo, '10.0.0.1') is None
+    assert limiter.check(foo, '10.0.0.1') == (Status.RESOURCE_EXHAUSTED,
+                                              'Rate limit exceeded')
+    assert limiter.check(foo, '10.0.0.2') is None
+    assert limiter.check(bar, '10.0.0.1') is None
+    assert limiter.check([(':path', '/dummy.DummyService/UnaryStream'),
+                          ('x-tenant', 'foo')], '10.0.0.1') is None
+    for _ in range(3):
+        assert limiter.check([(':path', STREAM)], '10.0.0.1') is None
+
+
+@pytest.mark.asyncio
+async def test_rate_limiter_server(loop):
+    port = free_port()
+    limiter = RateLimiter(methods={UNARY: RateLimit(0.001, burst=2)})
+    service = DummyService()
+    server = Server([service], loop=loop, rate_limiter=limiter)
+    await server.start('127.0.0.1', port)
+    channel = Channel('127.0.0.1', port, loop=loop)
+    stub = DummyServiceStub(channel)
+    try:
+        for _ in range(2):
+            reply = await stub.UnaryUnary(DummyRequest(value='ping'))
+            assert reply == DummyReply(value='pong')
+        with pytest.raises(GRPCError) as err:
+            await stub.UnaryUnary(DummyRequest(value='ping'))
+        assert err.value.status == Status.RESOURCE_EXHAUSTED
+        assert err.value.message == 'Rate limit exceeded'
+        assert len(service.log) == 2
+
+        reply = await stub.UnaryStream(DummyRequest(value='ping'))
+        assert reply == [DummyReply(value='pong1'),
+                         DummyReply(value='pong2'),
+                         DummyReply(value='pong3')]
+    finally:
+        channel.close()
+        server.close()
+        await server.wait_closed()
@@ -0,0 +1,116 @@
+import pytest
+
+from grpclib.server import Server
+from grpclib.balancing import BalancedChannel, Subchannel
+from grpclib.balancing import RoundRobin, PowerOfTwoChoices, EWMA
+
+from dummy_pb2 import DummyRequest, DummyReply
+from dummy_grpc import DummyServiceStub
+from test_functional import DummyService
+from conn import free_port
+
+
+class _SubchannelStub:
+
+    def __init__(self, in_flight):
+        self.in_flight = in_flight
+
+
+def test_round_robin():
+    subchannels = [_SubchannelStub(0) for _ in range(3)]
+    policy = RoundRobin()
+    picked = [policy.pick(subchannels) for _ in range(6)]
+    assert picked == subchannels * 2
+
+
+def test_power_of_two_choices():
+    idle, busy = _SubchannelStub(0), _SubchannelStub(10)
+    policy = PowerOfTwoChoices()
+    assert policy.pick([busy]) is busy
+    for _ in range(10):
+        assert policy.pick([busy, idle]) is idle
+
+
+def test_ewma():
+    fast, slow, new = _SubchannelStub(0), _SubchannelStub(0), _SubchannelStub(0)
+    policy = EWMA(alpha=0.5)
+    policy.observe(fast, 0.1)
+    policy.observe(slow, 0.2)
+    # subchannels without observations are tried first
+    assert policy.pick([fast, slow, new]) is new
+    assert policy.pick([fast, slow]) is fast
+
+    policy.observe(fast, 0.5)
+    assert policy.pick([fast, slow]) is slow
+
+    # in-flight requests are taken into account
+    slow.in_flight = 2
+    assert policy.pick([fast, slow]) is fast
+
+    with pytest.raises(ValueError):
+        EWMA(alpha=0)
+
+
+def test_invalid_arguments(loop):
+    with pytest.raises(ValueError):
+        BalancedChannel(loop=loop)
+    with pytest.raises(ValueError):
+        BalancedChannel([], loop=loop)
+    with pytest.raises(ValueError):
+        BalancedChannel(resolver=lambda: None, loop=loop)
+
+
+@pytest.mark.asyncio
+async def test_round_robin_across_servers(loop):
+    services = [DummyService(), DummyService()]
+    servers = [Server([service], loop=loop) for service in services]
+    ports = [free_port(), free_port()]
+    for server, port in zip(servers, ports):
+        await server.start('127.0.0.1', port)
+
+    async def resolver():
+        return [('127.0.0.1', port) for port in ports]
+
+    channel = BalancedChannel(resolver=resolver, authority='test.com',
+                              policy=RoundRobin(), loop=loop)
+    stub = DummyServiceStub(channel)
+    try:
+        for _ in range(4):
+            reply = await stub.UnaryUnary(DummyRequest(value='ping'))
+            assert reply == DummyReply(value='pong')
+        assert [len(service.log) for service in services] == [2, 2]
+    finally:
+        channel.close()
+        for server in servers:
+            server.close()
+            await server.wait_closed()
+
+
+@pytest.mark.asyncio
+async def test_failed_endpoint(loop):
+    port, dead_port = free_port(), free_port()
+    service = DummyService()
+    server = Server([service], loop=loop)
+    await server.start('127.0.0.1', port)
+
+    channel = BalancedChannel([('127.0.0.1', dead_port),
+                               ('127.0.0.1', port)],
+                              policy=RoundRobin(), loop=loop)
+    stub = DummyServiceStub(channel)
+    try:
+        with pytest.raises(ConnectionRefusedError):
+            await stub.UnaryUnary(DummyRequest(value='ping'))
+
+        dead, alive = channel._subchannels
+        assert isinstance(dead, Subchannel)
+        assert not dead.available and alive.available
+
+        # failed endpoint is taken out of rotation
+        for _ in range(3):
+            reply = await stub.UnaryUnary(DummyRequest(value='ping'))
+            assert reply == DummyReply(value='pong')
+        assert len(service.log) == 3
+    finally:
+        channel.close()
+        server.close()
+        await server.wait_closed()
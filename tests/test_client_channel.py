@@ -1,14 +1,16 @@
 import asyncio
-from unittest.mock import patch, ANY
+from unittest.mock import Mock, patch, ANY
 
 import pytest
 
 from grpclib.client import Channel
+from grpclib.config import Configuration
 from grpclib.testing import ChannelFor
+from grpclib.protocol import StreamsLimit
 
 from dummy_pb2 import DummyRequest, DummyReply
 from dummy_grpc import DummyServiceStub
-from test_functional import DummyService
+from test_functional import DummyService, ClientServer
 
 
 async def _create_connection(protocol):
@@ -31,8 +33,117 @@ async def test_concurrent_connect(loop):
     stub = DummyServiceStub(channel)
     async with ChannelFor([DummyService()]) as _channel:
         with patch.object(loop, 'create_connection') as po:
-            po.side_effect = _create_connection_gen(_channel._protocol)
+            po.side_effect = _create_connection_gen(
+                _channel._protocols[0]
+            )
             tasks = [loop.create_task(stub.UnaryUnary(req)) for req in reqs]
             replies = await asyncio.gather(*tasks)
     assert replies == reps
     po.assert_called_once_with(ANY, '127.0.0.1', 50051, ssl=None)
+
+
+async def _coro(value):
+    return value
+
+
+class _ProtocolStub:
+
+    class handler:
+        connection_lost = False
+
+    def __init__(self, streams, limit, *, loop):
+        self.processor = Mock(streams=dict.fromkeys(range(streams)))
+        self.connection = Mock(streams_limit=StreamsLimit(limit, loop=loop))
+        for _ in range(streams):
+            self.connection.streams_limit.acquire()
+
+
+@pytest.mark.asyncio
+async def test_pool_least_loaded(loop):
+    config = Configuration(channel_pool_size=3)
+    channel = Channel(loop=loop, config=config)
+    channel._protocols = [_ProtocolStub(3, 10, loop=loop),
+                          _ProtocolStub(1, 10, loop=loop),
+                          _ProtocolStub(2, 10, loop=loop)]
+    with patch.object(channel, '_create_connection') as create_connection:
+        assert await channel.__connect__() is channel._protocols[1]
+    create_connection.assert_not_called()
+    channel._protocols = []
+
+
+@pytest.mark.asyncio
+async def test_pool_growth(loop):
+    config = Configuration(channel_pool_max_size=2)
+    channel = Channel(loop=loop, config=config)
+    saturated = _ProtocolStub(5, 5, loop=loop)
+    new = _ProtocolStub(0, 5, loop=loop)
+    channel._protocols = [saturated]
+    with patch.object(channel, '_create_connection') as create_connection:
+        create_connection.side_effect = [_coro(new)]
+        assert await channel.__connect__() is new
+        # maximum pool size is reached
+        new.processor.streams = dict.fromkeys(range(5))
+        new.connection.streams_limit.set(0)
+        assert await channel.__connect__() in (saturated, new)
+    create_connection.assert_called_once_with()
+    assert channel._protocols == [saturated, new]
+    channel._protocols = []
+
+
+@pytest.mark.asyncio
+async def test_pool_connections(loop):
+    config = Configuration(channel_pool_size=3)
+    client_server = ClientServer(loop=loop, config=config)
+    async with client_server as (handler, stub):
+        replies = await asyncio.gather(*[
+            stub.UnaryUnary(DummyRequest(value='ping')) for _ in range(10)
+        ], loop=loop)
+        assert replies == [DummyReply(value='pong')] * 10
+        assert len(client_server.channel._protocols) == 3
+
+
+@pytest.mark.asyncio
+async def test_eager_connect(loop):
+    config = Configuration(channel_pool_size=2, channel_eager_connect=True,
+                           channel_reconnect_min_delay=0.01)
+    client_server = ClientServer(loop=loop, config=config)
+    async with client_server as (handler, stub):
+        channel = client_server.channel
+        await asyncio.wait_for(channel.ready(), 1, loop=loop)
+        while len(channel._protocols) < 2:
+            await asyncio.sleep(0.01, loop=loop)
+        protocols = list(channel._protocols)
+
+        # lost connection is reestablished in the background
+        protocols[0].processor.close()
+        await asyncio.sleep(0.1, loop=loop)
+        assert len(channel._protocols) == 2
+        assert protocols[0] not in channel._protocols
+        assert protocols[1] in channel._protocols
+
+        reply = await stub.UnaryUnary(DummyRequest(value='ping'))
+        assert reply == DummyReply(value='pong')
+
+
+@pytest.mark.asyncio
+async def test_reconnect_backoff(loop):
+    config = Configuration(channel_eager_connect=True,
+                           channel_reconnect_min_delay=0.01,
+                           channel_reconnect_max_delay=0.02)
+    with patch.object(Channel, '_create_connection') as create_connection:
+        create_connection.side_effect = ConnectionRefusedError
+        channel = Channel(loop=loop, config=config)
+        try:
+            with pytest.raises(asyncio.TimeoutError):
+                await asyncio.wait_for(channel.ready(), 0.1, loop=loop)
+            # every attempt is delayed by 0.008-0.024 seconds
+            assert 4 <= create_connection.call_count <= 12
+
+            protocol = Mock()
+            protocol.handler.connection_lost = False
+            create_connection.side_effect = [_coro(protocol)]
+            await asyncio.wait_for(channel.ready(), 0.1, loop=loop)
+            assert channel._protocols == [protocol]
+        finally:
+            channel._protocols = []
+            channel.close()
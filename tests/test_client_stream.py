@@ -128,7 +128,7 @@ async def test_ctx_exit_with_error_and_closed_connection(cs):
     with pytest.raises(ClientError):
         async with cs.client_stream as stream:
             await stream.send_request()
-            cs.client_conn.server_h2c.close_connection()
+            cs.client_conn.server_h2c.close_connection(last_stream_id=0)
             cs.client_conn.server_flush()
             raise ClientError()
 
@@ -358,7 +358,7 @@ async def test_connection_close_during_send_message(loop, cs: ClientStream):
             task = loop.create_task(
                 stream.send_message(DummyRequest(value='ping'), end=True)
             )
-            cs.client_conn.server_h2c.close_connection()
+            cs.client_conn.server_h2c.close_connection(last_stream_id=0)
             cs.client_conn.server_flush()
 
             try:
@@ -0,0 +1,151 @@
+import zlib
+
+import pytest
+
+from grpclib import compression
+from grpclib.const import Status
+from grpclib.config import Configuration
+from grpclib.compression import CompressorBase, GzipCompressor
+from grpclib.compression import DeflateCompressor
+from grpclib.exceptions import GRPCError
+
+from dummy_pb2 import DummyRequest, DummyReply
+from test_functional import ClientServer
+
+
+class CountingCompressor(CompressorBase):
+    __encoding__ = 'counting'
+
+    def __init__(self):
+        self.compressed = []
+        self.decompressed = []
+
+    def compress(self, data):
+        self.compressed.append(data)
+        return data[::-1]
+
+    def decompress(self, data, max_length=None):
+        self.decompressed.append(data)
+        return data[::-1]
+
+
+@pytest.fixture(name='compressor')
+def compressor_fixture():
+    compressor = CountingCompressor()
+    compression.register(compressor)
+    try:
+        yield compressor
+    finally:
+        compression._registry.pop(compressor.__encoding__)
+
+
+@pytest.mark.parametrize('compressor_cls',
+                         [GzipCompressor, DeflateCompressor])
+def test_compressors(compressor_cls):
+    compressor = compressor_cls()
+    data = b'ping' * 100
+    assert len(compressor.compress(data)) < len(data)
+    assert compressor.decompress(compressor.compress(data)) == data
+    assert compression.get(compressor.__encoding__) is not None
+
+
+@pytest.mark.parametrize('compressor_cls',
+                         [GzipCompressor, DeflateCompressor])
+def test_decompress_max_length(compressor_cls):
+    compressor = compressor_cls()
+    data = b'x' * 10 ** 6
+    compressed = compressor.compress(data)
+    # decompression is stopped as soon as limit is exceeded
+    assert len(compressor.decompress(compressed, max_length=100)) == 101
+    assert compressor.decompress(compressed, max_length=len(data)) == data
+    with pytest.raises(zlib.error):
+        compressor.decompress(compressed[:len(compressed) // 2])
+
+
+def test_registry(compressor):
+    assert compression.get('counting') is compressor
+    assert compression.get('unknown') is None
+    assert compression.accept_encoding() == \
+        'identity,counting,deflate,gzip'
+    assert compression.parse_accept_encoding('identity, gzip,') == \
+        {'identity', 'gzip'}
+    compression.validate('counting')
+    compression.validate('identity')
+    with pytest.raises(ValueError):
+        compression.validate('unknown')
+
+
+@pytest.mark.asyncio
+async def test_compression(loop, compressor):
+    config = Configuration(compression_min_size=10)
+    client_server = ClientServer(loop=loop, config=config,
+                                 server_config=config,
+                                 compression='counting',
+                                 server_compression='counting')
+    async with client_server as (service, stub):
+        # small messages are not compressed
+        reply = await stub.UnaryUnary(DummyRequest(value='ping'))
+        assert reply == DummyReply(value='pong')
+        assert compressor.compressed == []
+        assert compressor.decompressed == []
+
+        async with stub.StreamStream.open() as stream:
+            await stream.send_message(DummyRequest(value='x' * 100),
+                                      end=True)
+            assert await stream.recv_message() == \
+                DummyReply(value='x' * 100)
+            assert await stream.recv_message() is None
+            assert stream.initial_metadata == {}
+        # request and reply were compressed
+        assert len(compressor.compressed) == 2
+        assert len(compressor.decompressed) == 2
+
+        # per-call setting
+        async with stub.StreamStream.open(compression='identity') as stream:
+            await stream.send_message(DummyRequest(value='x' * 100),
+                                      end=True)
+            assert await stream.recv_message() == \
+                DummyReply(value='x' * 100)
+            assert await stream.recv_message() is None
+        # only reply was compressed
+        assert len(compressor.compressed) == 3
+        assert len(compressor.decompressed) == 3
+
+        with pytest.raises(ValueError):
+            await stub.UnaryUnary(DummyRequest(value='ping'),
+                                  compression='unknown')
+
+
+@pytest.mark.asyncio
+async def test_negotiation(loop, compressor):
+    config = Configuration(compression_min_size=0)
+    client_server = ClientServer(loop=loop, config=config,
+                                 compression='counting')
+    async with client_server as (service, stub):
+        # server is not compressing replies by default
+        reply = await stub.UnaryUnary(DummyRequest(value='ping'))
+        assert reply == DummyReply(value='pong')
+        assert len(compressor.compressed) == 1
+        assert compressor.decompressed == [b'\n\x04ping'[::-1]]
+        protocol, = client_server.channel._protocols
+        assert protocol.handler.accept_encoding == \
+            {'identity', 'counting', 'deflate', 'gzip'}
+
+        # encoding, which is not supported by the server, isn't used
+        protocol.handler.accept_encoding = frozenset(['identity', 'gzip'])
+        reply = await stub.UnaryUnary(DummyRequest(value='ping'))
+        assert reply == DummyReply(value='pong')
+        assert len(compressor.compressed) == 1
+
+
+@pytest.mark.asyncio
+async def test_max_receive_message_size(loop):
+    client_server = ClientServer(
+        loop=loop, compression='gzip',
+        server_config=Configuration(max_receive_message_size=1000),
+    )
+    async with client_server as (service, stub):
+        with pytest.raises(GRPCError) as err:
+            await stub.UnaryUnary(DummyRequest(value='x' * 10 ** 6))
+        assert err.value.status == Status.RESOURCE_EXHAUSTED
+        assert not service.log
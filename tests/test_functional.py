@@ -1,11 +1,17 @@
 import os
 import socket
+import asyncio
 import tempfile
 
+from unittest.mock import patch
+
 import pytest
 
 from grpclib.client import Channel, _to_list
+from grpclib.config import Configuration
+from grpclib.const import Status
 from grpclib.server import Server
+from grpclib.exceptions import GRPCError, StreamTerminatedError
 
 from dummy_pb2 import DummyRequest, DummyReply
 from dummy_grpc import DummyServiceBase, DummyServiceStub
@@ -44,8 +50,13 @@ class ClientServer:
     server = None
     channel = None
 
-    def __init__(self, *, loop):
+    def __init__(self, *, loop, config=None, server_config=None,
+                 compression=None, server_compression=None):
         self.loop = loop
+        self.config = config
+        self.server_config = server_config
+        self.compression = compression
+        self.server_compression = server_compression
 
     async def __aenter__(self):
         host = '127.0.0.1'
@@ -55,10 +66,14 @@ class ClientServer:
 
         dummy_service = DummyService()
 
-        self.server = Server([dummy_service], loop=self.loop)
+        self.server = Server([dummy_service], loop=self.loop,
+                             config=self.server_config,
+                             compression=self.server_compression)
         await self.server.start(host, port)
 
-        self.channel = Channel(host=host, port=port, loop=self.loop)
+        self.channel = Channel(host=host, port=port, loop=self.loop,
+                               config=self.config,
+                               compression=self.compression)
         dummy_stub = DummyServiceStub(self.channel)
         return dummy_service, dummy_stub
 
@@ -211,3 +226,269 @@ async def test_stream_stream_advanced(loop):
             assert await stream.recv_message() == DummyReply(value='baz')
 
             assert await stream.recv_message() is None
+
+
+@pytest.mark.asyncio
+async def test_graceful_shutdown(loop):
+    client_server = ClientServer(loop=loop)
+    async with client_server as (service, stub):
+        channel = client_server.channel
+        async with stub.StreamUnary.open() as stream:
+            await stream.send_message(DummyRequest(value='ping'))
+            while not service.log:
+                await asyncio.sleep(0.01, loop=loop)
+            protocol, = channel._protocols
+
+            client_server.server.close(grace=1)
+            while not protocol.handler.connection_lost:
+                await asyncio.sleep(0.01, loop=loop)
+            # new requests will use new connection
+            assert not channel._connected
+
+            # running request is able to finish
+            await stream.send_message(DummyRequest(value='ping'), end=True)
+            assert await stream.recv_message() == DummyReply(value='pong')
+
+        await asyncio.wait_for(client_server.server.wait_closed(), 0.5,
+                               loop=loop)
+        assert protocol.processor.streams == {}
+
+
+@pytest.mark.asyncio
+async def test_graceful_shutdown_timeout(loop):
+    client_server = ClientServer(loop=loop)
+    async with client_server as (service, stub):
+        async with stub.StreamUnary.open() as stream:
+            await stream.send_message(DummyRequest(value='ping'))
+            while not service.log:
+                await asyncio.sleep(0.01, loop=loop)
+
+            client_server.server.close(grace=0.1)
+            # request was cancelled after grace period
+            await asyncio.wait_for(client_server.server.wait_closed(), 1,
+                                   loop=loop)
+            with pytest.raises((GRPCError, StreamTerminatedError)):
+                await stream.recv_message()
+
+
+@pytest.mark.asyncio
+async def test_max_connection_idle(loop):
+    config = Configuration(server_max_connection_idle=0.1)
+    client_server = ClientServer(loop=loop, server_config=config)
+    async with client_server as (_, stub):
+        channel = client_server.channel
+        reply = await stub.UnaryUnary(DummyRequest(value='ping'))
+        assert reply == DummyReply(value='pong')
+        protocol, = channel._protocols
+
+        await asyncio.sleep(0.05, loop=loop)
+        reply = await stub.UnaryUnary(DummyRequest(value='ping'))
+        assert reply == DummyReply(value='pong')
+        assert channel._protocols == [protocol]
+
+        await asyncio.sleep(0.2, loop=loop)
+        assert protocol.handler.connection_lost
+        reply = await stub.UnaryUnary(DummyRequest(value='ping'))
+        assert reply == DummyReply(value='pong')
+        assert protocol not in channel._protocols
+
+
+@pytest.mark.asyncio
+async def test_max_connection_age(loop):
+    config = Configuration(server_max_connection_age=0.1,
+                           server_max_connection_age_grace=0.1)
+    client_server = ClientServer(loop=loop, server_config=config)
+    async with client_server as (service, stub):
+        channel = client_server.channel
+        async with stub.StreamUnary.open() as stream:
+            await stream.send_message(DummyRequest(value='ping'))
+            while not service.log:
+                await asyncio.sleep(0.01, loop=loop)
+            protocol, = channel._protocols
+
+            # GOAWAY frame was sent, new requests will use new connection
+            await asyncio.sleep(0.12, loop=loop)
+            assert protocol.handler.connection_lost
+            reply = await stub.UnaryUnary(DummyRequest(value='ping'))
+            assert reply == DummyReply(value='pong')
+
+            # running request was cancelled after grace period
+            with pytest.raises((GRPCError, StreamTerminatedError)):
+                await asyncio.wait_for(stream.recv_message(), 1, loop=loop)
+
+
+@pytest.mark.asyncio
+async def test_close_draining_connection(loop):
+    config = Configuration(server_max_connection_age=0.1,
+                           server_max_connection_age_grace=10)
+    client_server = ClientServer(loop=loop, server_config=config)
+    async with client_server as (service, stub):
+        channel = client_server.channel
+        async with stub.StreamUnary.open() as stream:
+            await stream.send_message(DummyRequest(value='ping'))
+            while not service.log:
+                await asyncio.sleep(0.01, loop=loop)
+            protocol, = channel._protocols
+
+            # GOAWAY frame was received, connection is draining
+            await asyncio.sleep(0.2, loop=loop)
+            assert channel._draining == {protocol}
+            assert not protocol.connection.closed
+
+            channel.close()
+            assert protocol.connection.closed
+            assert not channel._draining
+            with pytest.raises(StreamTerminatedError):
+                await asyncio.wait_for(stream.recv_message(), 1, loop=loop)
+
+
+@pytest.mark.asyncio
+async def test_draining_connection_lost(loop):
+    config = Configuration(server_max_connection_age=0.1,
+                           server_max_connection_age_grace=10)
+    client_server = ClientServer(loop=loop, server_config=config)
+    async with client_server as (service, stub):
+        channel = client_server.channel
+        async with stub.StreamUnary.open() as stream:
+            await stream.send_message(DummyRequest(value='ping'))
+            await asyncio.sleep(0.2, loop=loop)
+            protocol, = channel._draining
+
+            # connection is closed by the server after the last stream
+            await stream.send_message(DummyRequest(value='ping'), end=True)
+            assert await stream.recv_message() == DummyReply(value='pong')
+        await asyncio.sleep(0.05, loop=loop)
+        assert protocol.connection.closed
+        assert not channel._draining
+
+
+@pytest.mark.asyncio
+async def test_codec_executor(loop):
+    config = Configuration(codec_executor_threshold=1024)
+    client_server = ClientServer(loop=loop, config=config,
+                                 server_config=config)
+    calls = []
+    run_in_executor = loop.run_in_executor
+
+    def run_in_executor_wrapper(executor, func, *args):
+        calls.append(func.__name__)
+        return run_in_executor(executor, func, *args)
+
+    async with client_server as (_, stub):
+        with patch.object(loop, 'run_in_executor', run_in_executor_wrapper):
+            async with stub.StreamStream.open() as stream:
+                # small messages are processed inline
+                await stream.send_message(DummyRequest(value='foo'))
+                assert await stream.recv_message() == DummyReply(value='foo')
+                assert calls == []
+
+                await stream.send_message(DummyRequest(value='x' * 1024),
+                                          end=True)
+                reply = await stream.recv_message()
+                assert reply == DummyReply(value='x' * 1024)
+                assert await stream.recv_message() is None
+    assert sorted(calls) == ['decode', 'decode', 'encode', 'encode']
+
+
+@pytest.mark.asyncio
+async def test_max_receive_message_size(loop):
+    client_server = ClientServer(
+        loop=loop,
+        config=Configuration(max_receive_message_size=100),
+        server_config=Configuration(max_receive_message_size=1000),
+    )
+    async with client_server as (_, stub):
+        # connection's window is restored, when message is discarded
+        for _ in range(3):
+            with pytest.raises(GRPCError) as err:
+                await stub.UnaryUnary(DummyRequest(value='x' * 50000))
+            assert err.value.status == Status.RESOURCE_EXHAUSTED
+        reply = await stub.UnaryUnary(DummyRequest(value='ping'))
+        assert reply == DummyReply(value='pong')
+
+        with pytest.raises(GRPCError) as err:
+            async with stub.StreamStream.open() as stream:
+                await stream.send_message(DummyRequest(value='x' * 500))
+                await stream.recv_message()
+        assert err.value.status == Status.RESOURCE_EXHAUSTED
+
+
+@pytest.mark.asyncio
+async def test_max_concurrent_streams_above_default(loop):
+    # H2Connection's default limit is 100
+    client_server = ClientServer(
+        loop=loop,
+        server_config=Configuration(http2_max_concurrent_streams=200),
+    )
+    async with client_server as (service, stub):
+        done = asyncio.Event(loop=loop)
+
+        async def call():
+            async with stub.StreamStream.open() as stream:
+                await stream.send_message(DummyRequest(value='ping'))
+                assert await stream.recv_message() == DummyReply(value='ping')
+                if len(service.log) == 150:
+                    done.set()
+                # all streams are open at the same time
+                await done.wait()
+                await stream.end()
+                assert await stream.recv_message() is None
+
+        await asyncio.wait_for(asyncio.gather(*[call() for _ in range(150)],
+                                              loop=loop), 5, loop=loop)
+        server_handler, = client_server.server._handlers
+        assert server_handler.protocol.connection.refused_streams == 0
+
+
+@pytest.mark.asyncio
+async def test_channel_rtt(loop):
+    client_server = ClientServer(
+        loop=loop,
+        config=Configuration(keepalive_time=0.01,
+                             keepalive_permit_without_calls=True),
+    )
+    async with client_server as (_, stub):
+        assert client_server.channel.rtt is None
+        reply = await stub.UnaryUnary(DummyRequest(value='ping'))
+        assert reply == DummyReply(value='pong')
+        await asyncio.sleep(0.1, loop=loop)
+        assert 0 < client_server.channel.rtt < 0.1
+
+
+@pytest.mark.asyncio
+async def test_max_send_message_size(loop):
+    client_server = ClientServer(
+        loop=loop, config=Configuration(max_send_message_size=1000),
+    )
+    async with client_server as (_, stub):
+        with pytest.raises(GRPCError) as err:
+            await stub.UnaryUnary(DummyRequest(value='x' * 1000))
+        assert err.value.status == Status.RESOURCE_EXHAUSTED
+        reply = await stub.UnaryUnary(DummyRequest(value='ping'))
+        assert reply == DummyReply(value='pong')
+
+
+@pytest.mark.asyncio
+async def test_max_concurrent_streams(loop):
+    client_server = ClientServer(
+        loop=loop,
+        server_config=Configuration(http2_max_concurrent_streams=1),
+    )
+    async with client_server as (_, stub):
+        async with stub.StreamStream.open() as stream:
+            await stream.send_message(DummyRequest(value='ping'))
+            assert await stream.recv_message() == DummyReply(value='ping')
+
+            # waiting for a free slot on the client-side
+            request = loop.create_task(
+                stub.UnaryUnary(DummyRequest(value='ping')),
+            )
+            await asyncio.sleep(0.05, loop=loop)
+            assert not request.done()
+
+            await stream.end()
+            assert await stream.recv_message() is None
+
+        assert await asyncio.wait_for(request, 1, loop=loop) == \
+            DummyReply(value='pong')
+        assert client_server.server.refused_streams == 0
@@ -34,6 +34,12 @@ def test_decode_timeout(value, expected):
     assert decode_timeout(value) == expected
 
 
+@pytest.mark.parametrize('value', ['', 'S', '5', '-5S', '5s', '5 S', '5S\n'])
+def test_decode_invalid_timeout(value):
+    with pytest.raises(ValueError):
+        decode_timeout(value)
+
+
 def test_deadline():
     assert Deadline.from_timeout(1) < Deadline.from_timeout(2)
 
@@ -1,20 +1,30 @@
-import pytest
+import struct
 import asyncio
 
+import pytest
+
 from h2.config import H2Configuration
 from h2.events import StreamEnded, WindowUpdated, PingAcknowledged
+from h2.events import DataReceived, RemoteSettingsChanged
+from h2.events import ConnectionTerminated, StreamReset
+from h2.errors import ErrorCodes
 from h2.settings import SettingCodes
 from h2.connection import H2Connection
+from hyperframe.frame import SettingsFrame
 from h2.exceptions import StreamClosedError
 
+from grpclib.const import Status
+from grpclib.config import Configuration
 from grpclib.metadata import Request
-from grpclib.protocol import _slice, Connection, EventsProcessor
+from grpclib.exceptions import GRPCError
+from grpclib.protocol import Buffer, Connection, EventsProcessor, H2Protocol
+from grpclib.protocol import StreamsLimit, Keepalive, _H2Connection
 
 from stubs import TransportStub, DummyHandler
 
 
 def create_connections(*, connection_window=None, stream_window=None,
-                       max_frame_size=None):
+                       max_frame_size=None, max_concurrent_streams=None):
     server_conn = H2Connection(H2Configuration(client_side=False,
                                                header_encoding='ascii'))
     server_conn.initiate_connection()
@@ -39,6 +49,11 @@ def create_connections(*, connection_window=None, stream_window=None,
             SettingCodes.MAX_FRAME_SIZE: max_frame_size
         })
 
+    if max_concurrent_streams is not None:
+        server_conn.update_settings({
+            SettingCodes.MAX_CONCURRENT_STREAMS: max_concurrent_streams
+        })
+
     client_conn = H2Connection(H2Configuration(client_side=True,
                                                header_encoding='ascii'))
     client_conn.initiate_connection()
@@ -50,30 +65,106 @@ def create_connections(*, connection_window=None, stream_window=None,
     return client_conn, server_conn
 
 
-def test_slice():
-    data, tail = _slice([b'a', b'b', b'c', b'd', b'e', b'f'], 5)
-    assert data == [b'a', b'b', b'c', b'd', b'e']
-    assert tail == [b'f']
+class ConnectionStub:
+
+    def __init__(self):
+        self.acknowledged = []
 
-    data, tail = _slice([b'a', b'b', b'cdef'], 5)
-    assert data == [b'a', b'b', b'cde']
-    assert tail == [b'f']
+    def acknowledge(self, stream_id, size, stream_unacked):
+        self.acknowledged.append(size)
+        return False
 
-    data, tail = _slice([b'abc', b'def', b'gh'], 5)
-    assert data == [b'abc', b'de']
-    assert tail == [b'f', b'gh']
 
-    data, tail = _slice([b'abcde', b'fgh'], 5)
-    assert data == [b'abcde']
-    assert tail == [b'fgh']
+def create_buffer(loop):
+    return Buffer(1, ConnectionStub(), loop=loop)
 
-    data, tail = _slice([b'abcdefgh', b'ij'], 5)
-    assert data == [b'abcde']
-    assert tail == [b'fgh', b'ij']
 
-    data, tail = _slice([b'abcdefgh', b'ij'], 100)
-    assert data == [b'abcdefgh', b'ij']
-    assert tail == []
+@pytest.mark.asyncio
+async def test_buffer_read(loop):
+    buffer = create_buffer(loop)
+    buffer.append(b'ab')
+    buffer.append(b'cdef')
+    buffer.append(b'gh')
+
+    data = await buffer.read(5)
+    assert isinstance(data, memoryview)
+    assert data == b'abcde'
+    assert await buffer.read(3) == b'fgh'
+    assert buffer._size == 0
+    assert buffer._connection.acknowledged == [5, 3]
+
+
+@pytest.mark.asyncio
+async def test_buffer_append_while_data_is_referenced(loop):
+    buffer = create_buffer(loop)
+    buffer.append(b'abcdef')
+
+    data = await buffer.read(4)
+    buffer.append(b'gh')
+    assert data == b'abcd'
+    assert await buffer.read(4) == b'efgh'
+
+    del data
+    buffer.append(b'ij')
+    assert await buffer.read(2) == b'ij'
+
+
+@pytest.mark.asyncio
+async def test_buffer_read_eof(loop):
+    buffer = create_buffer(loop)
+    buffer.append(b'abc')
+    buffer.eof()
+    with pytest.raises(Exception) as err:
+        await buffer.read(5)
+    err.match('Incomplete data, 3 instead of 5')
+    assert not await buffer.read(5)
+
+
+@pytest.mark.asyncio
+async def test_buffer_read_message(loop):
+    buffer = create_buffer(loop)
+    buffer.append(struct.pack('>?I', False, 3) + b'foo')
+    buffer.append(struct.pack('>?I', True, 3) + b'bar')
+
+    assert await buffer.read_message() == (False, b'foo')
+    assert await buffer.read_message() == (True, b'bar')
+    # acknowledged once per message
+    assert buffer._connection.acknowledged == [8, 8]
+
+    buffer.eof()
+    assert await buffer.read_message() is None
+
+
+@pytest.mark.asyncio
+async def test_buffer_read_message_partial(loop):
+    buffer = create_buffer(loop)
+    buffer.append(struct.pack('>?I', False, 6) + b'foo')
+
+    read_task = loop.create_task(buffer.read_message())
+    await asyncio.wait([read_task], timeout=0.01, loop=loop)
+    assert not read_task.done()
+
+    buffer.append(b'bar')
+    assert await asyncio.wait_for(read_task, 0.01, loop=loop) == \
+        (False, b'foobar')
+
+
+@pytest.mark.asyncio
+async def test_buffer_read_message_max_size(loop):
+    buffer = create_buffer(loop)
+    buffer.append(struct.pack('>?I', False, 3) + b'foo')
+    buffer.append(struct.pack('>?I', False, 6) + b'foo')
+
+    assert await buffer.read_message(max_size=3) == (False, b'foo')
+    with pytest.raises(GRPCError) as err:
+        await buffer.read_message(max_size=3)
+    assert err.value.status == Status.RESOURCE_EXHAUSTED
+    assert buffer._size == 0
+
+    # the rest of the data is discarded, but acknowledged
+    buffer.append(b'bar')
+    assert buffer._size == 0
+    assert buffer._connection.acknowledged == [8, 8, 3]
 
 
 @pytest.mark.asyncio
@@ -93,6 +184,31 @@ async def test_send_data_larger_than_frame_size(loop):
     await stream.send_data(b'0' * (client_h2c.max_outbound_frame_size + 1))
 
 
+@pytest.mark.asyncio
+async def test_send_message_data(loop):
+    client_h2c, server_h2c = create_connections()
+
+    transport = TransportStub(server_h2c)
+    conn = Connection(client_h2c, transport, loop=loop)
+    stream = conn.create_stream()
+
+    request = Request(method='POST', scheme='http', path='/',
+                      content_type='application/grpc+proto',
+                      authority='test.com')
+    processor = EventsProcessor(DummyHandler(), conn)
+
+    await stream.send_request(request.to_headers(), _processor=processor)
+    transport.events()
+
+    data = b'0' * (client_h2c.max_outbound_frame_size * 2)
+    await stream.send_message_data(data, end_stream=True)
+    events = transport.events()
+    received = b''.join(e.data for e in events if isinstance(e, DataReceived))
+    assert received == struct.pack('>?I', False, len(data)) + data
+    assert len([e for e in events if isinstance(e, DataReceived)]) == 3
+    assert isinstance(events[-1], StreamEnded)
+
+
 @pytest.mark.asyncio
 async def test_recv_data_larger_than_window_size(loop):
     client_h2c, server_h2c = create_connections()
@@ -150,6 +266,144 @@ async def test_recv_data_larger_than_window_size(loop):
     assert server_stream.__buffer__._size == 0
 
 
+@pytest.mark.asyncio
+async def test_batched_window_updates(loop):
+    client_h2c, server_h2c = create_connections()
+
+    to_client_transport = TransportStub(client_h2c)
+    server_conn = Connection(server_h2c, to_client_transport, loop=loop)
+
+    to_server_transport = TransportStub(server_h2c)
+    client_conn = Connection(client_h2c, to_server_transport, loop=loop)
+
+    client_processor = EventsProcessor(DummyHandler(), client_conn)
+    client_stream = client_conn.create_stream()
+
+    request = Request(method='POST', scheme='http', path='/',
+                      content_type='application/grpc+proto',
+                      authority='test.com')
+    await client_stream.send_request(request.to_headers(),
+                                     _processor=client_processor)
+
+    server_processor = EventsProcessor(DummyHandler(), server_conn)
+    for event in to_server_transport.events():
+        server_processor.process(event)
+    server_stream, = server_processor.streams.values()
+
+    initial_window = server_h2c.local_settings.initial_window_size
+    message = b'0' * 1000
+    count = initial_window // 2 // (len(message) + 5)
+    for _ in range(count):
+        await client_stream.send_message_data(message)
+        for event in to_server_transport.events():
+            server_processor.process(event)
+        assert await server_stream.recv_message_data() == (False, message)
+
+    # consumed less than a half of the window, nothing was acknowledged yet
+    assert not to_client_transport.events()
+
+    await client_stream.send_message_data(message)
+    for event in to_server_transport.events():
+        server_processor.process(event)
+    assert await server_stream.recv_message_data() == (False, message)
+
+    # stream and connection windows are updated at once
+    stream_update, conn_update = sorted(to_client_transport.events(),
+                                        key=lambda e: -e.stream_id)
+    assert isinstance(stream_update, WindowUpdated)
+    assert stream_update.stream_id == client_stream.id
+    assert stream_update.delta == (count + 1) * (len(message) + 5)
+    assert isinstance(conn_update, WindowUpdated)
+    assert conn_update.stream_id == 0
+    assert conn_update.delta == (count + 1) * (len(message) + 5)
+    assert (client_h2c.local_flow_control_window(client_stream.id)
+            == initial_window)
+
+
+@pytest.mark.asyncio
+async def test_streams_limit_fifo(loop):
+    limit = StreamsLimit(1, loop=loop)
+    await limit.wait()
+    limit.acquire()
+
+    order = []
+
+    async def worker(i):
+        await limit.wait()
+        limit.acquire()
+        order.append(i)
+
+    tasks = [loop.create_task(worker(i)) for i in range(4)]
+    await asyncio.sleep(0.01, loop=loop)
+    assert limit.queued == 4
+
+    tasks[1].cancel()
+    for _ in range(3):
+        limit.release()
+        await asyncio.sleep(0.01, loop=loop)
+    assert order == [0, 2, 3]
+    assert limit.queued == 0
+
+
+@pytest.mark.asyncio
+async def test_streams_limit_cancelled_after_wakeup(loop):
+    limit = StreamsLimit(1, loop=loop)
+    limit.acquire()
+
+    async def worker():
+        await limit.wait()
+        limit.acquire()
+
+    first = loop.create_task(worker())
+    second = loop.create_task(worker())
+    await asyncio.sleep(0.01, loop=loop)
+
+    limit.release()
+    # first waiter was woken up, but was cancelled before it's slot was
+    # occupied, so the slot should be passed to the next waiter
+    first.cancel()
+    await asyncio.sleep(0.01, loop=loop)
+    assert first.cancelled()
+    assert second.done()
+    assert limit.reached()
+
+
+@pytest.mark.asyncio
+async def test_concurrent_streams_fifo(loop):
+    client_h2c, server_h2c = create_connections(max_concurrent_streams=1)
+
+    to_server_transport = TransportStub(server_h2c)
+    client_conn = Connection(client_h2c, to_server_transport, loop=loop)
+    client_processor = EventsProcessor(DummyHandler(), client_conn)
+
+    request = Request(method='POST', scheme='http', path='/',
+                      content_type='application/grpc+proto',
+                      authority='test.com')
+
+    streams = [client_conn.create_stream() for _ in range(3)]
+    release_first = await streams[0].send_request(
+        request.to_headers(), _processor=client_processor,
+    )
+    tasks = [loop.create_task(stream.send_request(request.to_headers(),
+                                                  _processor=client_processor))
+             for stream in streams[1:]]
+    await asyncio.sleep(0.01, loop=loop)
+    assert client_conn.streams_limit.queued == 2
+
+    client_h2c.reset_stream(streams[0].id)
+    release_first()
+    await asyncio.sleep(0.01, loop=loop)
+    # exactly one waiter was woken up, in FIFO order
+    assert tasks[0].done() and not tasks[1].done()
+    assert client_conn.streams_limit.queued == 1
+
+    client_h2c.reset_stream(streams[1].id)
+    tasks[0].result()()
+    await asyncio.sleep(0.01, loop=loop)
+    assert tasks[1].done()
+    assert client_conn.streams_limit.queued == 0
+
+
 @pytest.mark.asyncio
 async def test_stream_release(loop):
     client_h2c, server_h2c = create_connections()
@@ -205,6 +459,49 @@ async def test_stream_release(loop):
     assert not client_processor.streams
 
 
+@pytest.mark.asyncio
+async def test_max_concurrent_streams(loop):
+    client_h2c, server_h2c = create_connections()
+
+    to_client_transport = TransportStub(client_h2c)
+    server_conn = Connection(server_h2c, to_client_transport, loop=loop,
+                             config=Configuration(
+                                 http2_max_concurrent_streams=1,
+                             ))
+
+    to_server_transport = TransportStub(server_h2c)
+    client_conn = Connection(client_h2c, to_server_transport, loop=loop)
+
+    client_processor = EventsProcessor(DummyHandler(), client_conn)
+    server_processor = EventsProcessor(DummyHandler(), server_conn)
+
+    request = Request(method='POST', scheme='http', path='/',
+                      content_type='application/grpc+proto',
+                      authority='test.com')
+
+    async def send_request():
+        stream = client_conn.create_stream()
+        await stream.send_request(request.to_headers(),
+                                  _processor=client_processor)
+        to_server_transport.process(server_processor)
+        return stream
+
+    # client doesn't know about the limit yet
+    stream1 = await send_request()
+    stream2 = await send_request()
+    assert list(server_processor.streams) == [stream1.id]
+    assert server_conn.refused_streams == 1
+    reset, = to_client_transport.events()
+    assert isinstance(reset, StreamReset)
+    assert reset.stream_id == stream2.id
+    assert reset.error_code == ErrorCodes.REFUSED_STREAM
+
+    server_processor.handler.release_stream()
+    stream3 = await send_request()
+    assert list(server_processor.streams) == [stream3.id]
+    assert server_conn.refused_streams == 1
+
+
 @pytest.mark.asyncio
 async def test_initial_window_size_update(loop):
     client_h2c, server_h2c = create_connections()
@@ -280,6 +577,36 @@ async def test_send_headers_into_closed_stream(loop):
         await server_stream.send_headers([(':status', '200')])
 
 
+def test_reset_crossed_with_end_stream():
+    server_conn = H2Connection(H2Configuration(client_side=False,
+                                               header_encoding='ascii'))
+    server_conn.initiate_connection()
+    client_conn = _H2Connection(H2Configuration(client_side=True,
+                                                header_encoding='ascii'))
+    client_conn.initiate_connection()
+    client_conn.receive_data(server_conn.data_to_send())
+    server_conn.receive_data(client_conn.data_to_send())
+    client_conn.receive_data(server_conn.data_to_send())
+
+    request = Request(method='POST', scheme='http', path='/',
+                      content_type='application/grpc+proto',
+                      authority='test.com')
+    client_conn.send_headers(1, request.to_headers())
+    server_conn.receive_data(client_conn.data_to_send())
+    # request is rejected right after receiving its headers, while client
+    # finishes sending its request
+    client_conn.send_data(1, b'', end_stream=True)
+    client_conn.data_to_send()
+    server_conn.send_headers(1, [(':status', '200'), ('grpc-status', '8')],
+                             end_stream=True)
+    server_conn.reset_stream(1, ErrorCodes.NO_ERROR)
+
+    # RST_STREAM frame is ignored, connection isn't terminated
+    events = client_conn.receive_data(server_conn.data_to_send())
+    assert isinstance(events[-1], StreamEnded)
+    assert client_conn.data_to_send() == b''
+
+
 @pytest.mark.asyncio
 async def test_ping(loop):
     client_h2c, server_h2c = create_connections()
@@ -302,3 +629,419 @@ async def test_ping(loop):
     ping_ack, = to_client_transport.process(client_processor)
     assert isinstance(ping_ack, PingAcknowledged)
     assert ping_ack.ping_data == b'12345678'
+
+
+class ClosableTransport(TransportStub):
+    closed = False
+
+    def close(self):
+        self.closed = True
+
+
+def create_keepalive_connections(loop, client_config, server_config=None):
+    client_h2c, server_h2c = create_connections()
+
+    to_client_transport = ClosableTransport(client_h2c)
+    server_conn = Connection(server_h2c, to_client_transport, loop=loop)
+
+    to_server_transport = ClosableTransport(server_h2c)
+    client_conn = Connection(client_h2c, to_server_transport, loop=loop)
+
+    client_processor = EventsProcessor(DummyHandler(), client_conn)
+    server_processor = EventsProcessor(DummyHandler(), server_conn)
+    client_conn.keepalive = Keepalive(client_processor, loop=loop,
+                                      config=client_config)
+    if server_config is not None:
+        server_conn.keepalive = Keepalive(server_processor, loop=loop,
+                                          config=server_config)
+    return client_processor, server_processor
+
+
+@pytest.mark.asyncio
+async def test_keepalive(loop):
+    config = Configuration(keepalive_time=0.01, keepalive_timeout=0.05,
+                           keepalive_permit_without_calls=True)
+    client_processor, server_processor = \
+        create_keepalive_connections(loop, config)
+    to_server_transport = client_processor.connection._transport
+    to_client_transport = server_processor.connection._transport
+
+    await asyncio.sleep(0.02, loop=loop)
+    to_server_transport.process(server_processor)
+    server_processor.connection.flush()
+    ping_ack, = to_client_transport.process(client_processor)
+    assert isinstance(ping_ack, PingAcknowledged)
+
+    keepalive = client_processor.connection.keepalive
+    assert 0 < keepalive.rtt < 0.05
+
+    # acknowledgement wasn't received in time
+    await asyncio.sleep(0.1, loop=loop)
+    assert to_server_transport.closed
+
+
+@pytest.mark.asyncio
+async def test_keepalive_without_calls(loop):
+    config = Configuration(keepalive_time=0.01)
+    client_processor, server_processor = \
+        create_keepalive_connections(loop, config)
+    await asyncio.sleep(0.05, loop=loop)
+    assert not client_processor.connection._transport.events()
+    client_processor.close()
+
+
+@pytest.mark.asyncio
+async def test_keepalive_enforcement(loop):
+    client_config = Configuration(keepalive_time=0.01,
+                                  keepalive_permit_without_calls=True)
+    server_config = Configuration(keepalive_min_recv_interval=10)
+    client_processor, server_processor = \
+        create_keepalive_connections(loop, client_config, server_config)
+    to_server_transport = client_processor.connection._transport
+    to_client_transport = server_processor.connection._transport
+
+    # two strikes are tolerated
+    for _ in range(2):
+        await asyncio.sleep(0.02, loop=loop)
+        to_server_transport.process(server_processor)
+        server_processor.connection.flush()
+        assert not to_client_transport.closed
+        to_client_transport.process(client_processor)
+
+    await asyncio.sleep(0.02, loop=loop)
+    to_server_transport.process(server_processor)
+    assert to_client_transport.closed
+    goaway = to_client_transport.events()[-1]
+    assert isinstance(goaway, ConnectionTerminated)
+    assert goaway.error_code == ErrorCodes.ENHANCE_YOUR_CALM
+    assert goaway.additional_data == b'too_many_pings'
+    client_processor.close()
+
+
+@pytest.mark.asyncio
+async def test_keepalive_enforcement_with_streams(loop):
+    client_config = Configuration(keepalive_time=0.01)
+    server_config = Configuration(keepalive_min_recv_interval=10)
+    client_processor, server_processor = \
+        create_keepalive_connections(loop, client_config, server_config)
+    to_server_transport = client_processor.connection._transport
+    to_client_transport = server_processor.connection._transport
+
+    # idle stream doesn't permit to send PING frames too often
+    request = Request(method='POST', scheme='http', path='/',
+                      content_type='application/grpc+proto',
+                      authority='test.com')
+    client_stream = client_processor.connection.create_stream()
+    await client_stream.send_request(request.to_headers(),
+                                     _processor=client_processor)
+    to_server_transport.process(server_processor)
+    assert server_processor.streams
+
+    # first PING is permitted, two violations are tolerated
+    for _ in range(3):
+        await asyncio.sleep(0.02, loop=loop)
+        to_server_transport.process(server_processor)
+        server_processor.connection.flush()
+        assert not to_client_transport.closed
+        to_client_transport.process(client_processor)
+
+    await asyncio.sleep(0.02, loop=loop)
+    to_server_transport.process(server_processor)
+    assert to_client_transport.closed
+    goaway = to_client_transport.events()[-1]
+    assert isinstance(goaway, ConnectionTerminated)
+    assert goaway.error_code == ErrorCodes.ENHANCE_YOUR_CALM
+    client_processor.close()
+
+
+@pytest.mark.asyncio
+async def test_keepalive_strikes_reset(loop):
+    client_config = Configuration(keepalive_time=0.01,
+                                  keepalive_permit_without_calls=True)
+    server_config = Configuration(keepalive_min_recv_interval=10)
+    client_processor, server_processor = \
+        create_keepalive_connections(loop, client_config, server_config)
+    to_server_transport = client_processor.connection._transport
+    to_client_transport = server_processor.connection._transport
+
+    async def ping():
+        await asyncio.sleep(0.02, loop=loop)
+        to_server_transport.process(server_processor)
+        server_processor.connection.flush()
+        to_client_transport.process(client_processor)
+
+    for _ in range(2):
+        await ping()
+    assert not to_client_transport.closed
+
+    # sending headers forgives previous violations
+    request = Request(method='POST', scheme='http', path='/',
+                      content_type='application/grpc+proto',
+                      authority='test.com')
+    client_stream = client_processor.connection.create_stream()
+    await client_stream.send_request(request.to_headers(), end_stream=True,
+                                     _processor=client_processor)
+    to_server_transport.process(server_processor)
+    server_stream = server_processor.handler.stream
+    await server_stream.send_headers([(':status', '200')], end_stream=True)
+    server_processor.handler.release_stream()
+    to_client_transport.process(client_processor)
+
+    for _ in range(2):
+        await ping()
+    assert not to_client_transport.closed
+
+    await ping()
+    assert to_client_transport.closed
+    client_processor.close()
+
+
+class BufferedTransport(ClosableTransport):
+
+    def __init__(self, connection):
+        super().__init__(connection)
+        self._buffer = []
+
+    def write(self, data):
+        self._buffer.append(data)
+
+    def deliver(self):
+        data = b''.join(self._buffer)
+        del self._buffer[:]
+        self._events.extend(self._connection.receive_data(data))
+
+
+@pytest.mark.asyncio
+async def test_drain_in_flight_stream(loop):
+    client_h2c, server_h2c = create_connections()
+
+    to_client_transport = BufferedTransport(client_h2c)
+    server_conn = Connection(server_h2c, to_client_transport, loop=loop)
+    server_processor = EventsProcessor(DummyHandler(), server_conn)
+
+    to_server_transport = ClosableTransport(server_h2c)
+    client_conn = Connection(client_h2c, to_server_transport, loop=loop)
+    client_processor = EventsProcessor(DummyHandler(), client_conn)
+
+    server_processor.drain()
+
+    # request was sent before client received GOAWAY frame
+    request = Request(method='POST', scheme='http', path='/',
+                      content_type='application/grpc+proto',
+                      authority='test.com')
+    client_stream = client_conn.create_stream()
+    await client_stream.send_request(request.to_headers(), end_stream=True,
+                                     _processor=client_processor)
+    to_server_transport.process(server_processor)
+    assert server_conn.refused_streams == 0
+    server_stream = server_processor.handler.stream
+    assert server_stream.id == client_stream.id
+
+    to_client_transport.deliver()
+    goaway, _ = to_client_transport.process(client_processor)
+    assert goaway.last_stream_id == 2 ** 31 - 1
+    assert client_conn.closing
+    client_conn.flush()
+
+    # PING acknowledgement is received, final GOAWAY frame is sent
+    to_server_transport.process(server_processor)
+    to_client_transport.deliver()
+    goaway, = to_client_transport.process(client_processor)
+    assert isinstance(goaway, ConnectionTerminated)
+    assert goaway.last_stream_id == client_stream.id
+    assert client_stream.id in client_processor.streams
+
+    # new streams are refused after final GOAWAY frame
+    await client_conn.create_stream().send_request(
+        request.to_headers(), end_stream=True, _processor=client_processor,
+    )
+    to_server_transport.process(server_processor)
+    assert server_conn.refused_streams == 1
+
+    await server_stream.send_headers([(':status', '200')], end_stream=True)
+    assert not to_client_transport.closed
+    server_processor.handler.release_stream()
+    assert to_client_transport.closed
+
+
+@pytest.mark.asyncio
+async def test_max_concurrent_streams_after_ack(loop):
+    client_h2c = H2Connection(H2Configuration(client_side=True,
+                                              header_encoding='ascii'))
+    client_h2c.initiate_connection()
+    to_client_transport = BufferedTransport(client_h2c)
+
+    protocol = H2Protocol(DummyHandler(),
+                          H2Configuration(client_side=False,
+                                          header_encoding='ascii'),
+                          loop=loop,
+                          config=Configuration(http2_max_concurrent_streams=1))
+    protocol.connection_made(to_client_transport)
+
+    # client acknowledges advertised limit, but doesn't respect it
+    ack = SettingsFrame(0, flags=['ACK']).serialize()
+    protocol.data_received(client_h2c.data_to_send() + ack)
+    request = Request(method='POST', scheme='http', path='/',
+                      content_type='application/grpc+proto',
+                      authority='test.com')
+    for _ in range(2):
+        client_h2c.send_headers(client_h2c.get_next_available_stream_id(),
+                                request.to_headers())
+    protocol.data_received(client_h2c.data_to_send())
+    assert list(protocol.processor.streams) == [1]
+    assert protocol.connection.refused_streams == 1
+
+    to_client_transport.deliver()
+    events = to_client_transport.events()
+    assert not to_client_transport.closed
+    assert not any(isinstance(e, ConnectionTerminated) for e in events)
+    reset, = [e for e in events if isinstance(e, StreamReset)]
+    assert reset.stream_id == 3
+    assert reset.error_code == ErrorCodes.REFUSED_STREAM
+
+
+class WritesCounter(TransportStub):
+    writes = 0
+
+    def writelines(self, list_of_data):
+        self.writes += 1
+        super().writelines(list_of_data)
+
+
+@pytest.mark.asyncio
+async def test_write_coalescing(loop):
+    client_h2c, server_h2c = create_connections()
+
+    transport = WritesCounter(server_h2c)
+    config = Configuration(write_coalescing=True)
+    conn = Connection(client_h2c, transport, loop=loop, config=config)
+    processor = EventsProcessor(DummyHandler(), conn)
+
+    request = Request(method='POST', scheme='http', path='/',
+                      content_type='application/grpc+proto',
+                      authority='test.com')
+    for _ in range(3):
+        stream = conn.create_stream()
+        await stream.send_request(request.to_headers(), _processor=processor)
+        await stream.send_message_data(b'data', end_stream=True)
+    assert transport.writes == 0
+
+    await asyncio.sleep(0, loop=loop)
+    assert transport.writes == 1
+    events = transport.events()
+    assert len([e for e in events if isinstance(e, StreamEnded)]) == 3
+
+
+@pytest.mark.asyncio
+async def test_write_coalescing_limit(loop):
+    client_h2c, server_h2c = create_connections()
+
+    transport = WritesCounter(server_h2c)
+    config = Configuration(write_coalescing=True, write_coalescing_limit=100)
+    conn = Connection(client_h2c, transport, loop=loop, config=config)
+    processor = EventsProcessor(DummyHandler(), conn)
+
+    request = Request(method='POST', scheme='http', path='/',
+                      content_type='application/grpc+proto',
+                      authority='test.com')
+    stream = conn.create_stream()
+    await stream.send_request(request.to_headers(), _processor=processor)
+    assert transport.writes == 0
+    await stream.send_message_data(b'0' * 100)
+    assert transport.writes == 1
+
+
+@pytest.mark.asyncio
+async def test_http2_settings(loop):
+    server_h2c = H2Connection(H2Configuration(client_side=False,
+                                              header_encoding='ascii'))
+    server_h2c.initiate_connection()
+    transport = TransportStub(server_h2c)
+
+    config = Configuration(
+        http2_stream_window_size=2 ** 20,
+        http2_connection_window_size=2 ** 22,
+        http2_max_frame_size=2 ** 15,
+        http2_header_table_size=2 ** 13,
+        http2_max_header_list_size=2 ** 17,
+        http2_max_concurrent_streams=100,
+    )
+    protocol = H2Protocol(DummyHandler(),
+                          H2Configuration(client_side=True,
+                                          header_encoding='ascii'),
+                          loop=loop, config=config)
+    protocol.connection_made(transport)
+
+    events = transport.events()
+    settings = {}
+    for event in events:
+        if isinstance(event, RemoteSettingsChanged):
+            settings.update({k: v.new_value
+                             for k, v in event.changed_settings.items()})
+    assert settings[SettingCodes.INITIAL_WINDOW_SIZE] == 2 ** 20
+    assert settings[SettingCodes.MAX_FRAME_SIZE] == 2 ** 15
+    assert settings[SettingCodes.HEADER_TABLE_SIZE] == 2 ** 13
+    assert settings[SettingCodes.MAX_HEADER_LIST_SIZE] == 2 ** 17
+    assert settings[SettingCodes.MAX_CONCURRENT_STREAMS] == 100
+
+    window_updated, = [e for e in events if isinstance(e, WindowUpdated)]
+    assert window_updated.stream_id == 0
+    assert server_h2c.outbound_flow_control_window == 2 ** 22
+
+
+def test_invalid_configuration():
+    with pytest.raises(ValueError) as err:
+        Configuration(http2_connection_window_size=100)
+    err.match('Invalid http2_connection_window_size: 100')
+    with pytest.raises(ValueError) as err:
+        Configuration(http2_max_frame_size=2 ** 24)
+    err.match('Invalid http2_max_frame_size')
+    with pytest.raises(ValueError) as err:
+        Configuration(http2_window_update_threshold=0)
+    err.match('Invalid http2_window_update_threshold: 0')
+
+
+@pytest.mark.asyncio
+async def test_bdp_estimation(loop):
+    client_h2c, server_h2c = create_connections()
+
+    to_client_transport = TransportStub(client_h2c)
+    server_conn = Connection(server_h2c, to_client_transport, loop=loop)
+
+    to_server_transport = TransportStub(server_h2c)
+    config = Configuration(http2_bdp_probe=True)
+    client_conn = Connection(client_h2c, to_server_transport, loop=loop,
+                             config=config)
+
+    client_processor = EventsProcessor(DummyHandler(), client_conn)
+    server_processor = EventsProcessor(DummyHandler(), server_conn)
+
+    client_stream = client_conn.create_stream()
+    request = Request(method='POST', scheme='http', path='/',
+                      content_type='application/grpc+proto',
+                      authority='test.com')
+    await client_stream.send_request(request.to_headers(),
+                                     _processor=client_processor)
+    to_server_transport.process(server_processor)
+    server_stream, = server_processor.streams.values()
+    await server_stream.send_headers([(':status', '200')])
+
+    initial_window = client_h2c.local_settings.initial_window_size
+    await server_stream.send_data(b'0' * 60000)
+
+    # client sends PING along with received DATA
+    to_client_transport.process(client_processor)
+    client_conn.flush()
+    to_server_transport.process(server_processor)
+
+    # server acknowledges PING, client grows windows
+    server_conn.flush()
+    to_client_transport.process(client_processor)
+    client_conn.flush()
+    to_server_transport.process(server_processor)
+
+    assert initial_window < 120000
+    assert server_h2c.remote_settings.initial_window_size == 120000
+    # connection window was grown up to the same size, 60000 bytes are
+    # still not consumed
+    assert server_h2c.outbound_flow_control_window == 120000 - 60000
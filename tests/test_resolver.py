@@ -0,0 +1,165 @@
+import asyncio
+
+import pytest
+
+from grpclib.client import Channel
+from grpclib.config import Configuration
+from grpclib.server import Server
+from grpclib.resolver import ResolverBase, DNSResolver, CachingResolver
+
+from dummy_pb2 import DummyRequest, DummyReply
+from dummy_grpc import DummyServiceStub
+from test_functional import DummyService
+from conn import free_port
+
+
+class ResolverStub(ResolverBase):
+
+    def __init__(self, addresses, *, loop):
+        self.addresses = addresses
+        self.calls = 0
+        self.error = None
+        self._loop = loop
+
+    async def resolve(self, host, port):
+        self.calls += 1
+        await asyncio.sleep(0.01, loop=self._loop)
+        if self.error is not None:
+            raise self.error
+        return self.addresses
+
+
+@pytest.mark.asyncio
+async def test_dns_resolver(loop):
+    resolver = DNSResolver(loop=loop)
+    assert await resolver.resolve('127.0.0.1', 50051) == [('127.0.0.1', 50051)]
+    assert await resolver.resolve('::1', 50051) == [('::1', 50051)]
+    assert ('127.0.0.1', 50051) in await resolver.resolve('localhost', 50051)
+
+
+@pytest.mark.asyncio
+async def test_concurrent_lookups(loop):
+    stub = ResolverStub([('10.0.0.1', 50051)], loop=loop)
+    resolver = CachingResolver(stub, loop=loop)
+    results = await asyncio.gather(*[
+        resolver.resolve('example.com', 50051) for _ in range(5)
+    ], loop=loop)
+    assert results == [[('10.0.0.1', 50051)]] * 5
+    assert stub.calls == 1
+
+    assert await resolver.resolve('example.com', 50051) == [('10.0.0.1', 50051)]
+    assert stub.calls == 1
+
+
+@pytest.mark.asyncio
+async def test_background_refresh(loop):
+    stub = ResolverStub([('10.0.0.1', 50051)], loop=loop)
+    resolver = CachingResolver(stub, loop=loop, ttl=0)
+    assert await resolver.resolve('example.com', 50051) == [('10.0.0.1', 50051)]
+
+    # expired result is returned, while fresh one is resolved
+    stub.addresses = [('10.0.0.2', 50051)]
+    assert await resolver.resolve('example.com', 50051) == [('10.0.0.1', 50051)]
+    await asyncio.sleep(0.02, loop=loop)
+    assert await resolver.resolve('example.com', 50051) == [('10.0.0.2', 50051)]
+
+    # expired result is used, when lookup fails
+    await asyncio.sleep(0.02, loop=loop)
+    stub.error = OSError('Temporary failure in name resolution')
+    assert await resolver.resolve('example.com', 50051) == [('10.0.0.2', 50051)]
+    await asyncio.sleep(0.02, loop=loop)
+    assert stub.calls == 4
+    assert await resolver.resolve('example.com', 50051) == [('10.0.0.2', 50051)]
+
+
+@pytest.mark.asyncio
+async def test_lookup_error(loop):
+    stub = ResolverStub([], loop=loop)
+    stub.error = OSError('Name or service not known')
+    resolver = CachingResolver(stub, loop=loop)
+    with pytest.raises(OSError):
+        await resolver.resolve('example.com', 50051)
+    with pytest.raises(OSError):
+        await resolver.resolve('example.com', 50051)
+    assert stub.calls == 2
+
+
+@pytest.mark.asyncio
+async def test_connections_spread_across_addresses(loop):
+    services = [DummyService(), DummyService()]
+    servers = [Server([service], loop=loop) for service in services]
+    ports = [free_port(), free_port()]
+    for server, port in zip(servers, ports):
+        await server.start('127.0.0.1', port)
+
+    resolver = ResolverStub([('127.0.0.1', port) for port in ports],
+                            loop=loop)
+    channel = Channel('example.com', 50051, loop=loop, resolver=resolver,
+                      config=Configuration(channel_pool_size=2))
+    stub = DummyServiceStub(channel)
+    try:
+        for _ in range(2):
+            reply = await stub.UnaryUnary(DummyRequest(value='ping'))
+            assert reply == DummyReply(value='pong')
+        assert [len(service.log) for service in services] == [1, 1]
+
+        # unavailable address is skipped
+        servers[0].close()
+        await servers[0].wait_closed()
+        channel.close()
+        for _ in range(2):
+            reply = await stub.UnaryUnary(DummyRequest(value='ping'))
+            assert reply == DummyReply(value='pong')
+        assert [len(service.log) for service in services] == [1, 3]
+    finally:
+        channel.close()
+        for server in servers:
+            server.close()
+            await server.wait_closed()
+
+
+@pytest.mark.asyncio
+async def test_resolved_on_reconnect(loop):
+    port = free_port()
+    server = Server([DummyService()], loop=loop)
+    await server.start('127.0.0.1', port)
+
+    stub = ResolverStub([('127.0.0.1', port)], loop=loop)
+    resolver = CachingResolver(stub, loop=loop, ttl=0.01)
+    channel = Channel('example.com', 50051, loop=loop, resolver=resolver)
+    dummy_stub = DummyServiceStub(channel)
+    try:
+        reply = await dummy_stub.UnaryUnary(DummyRequest(value='ping'))
+        assert reply == DummyReply(value='pong')
+        assert stub.calls == 1
+
+        # established connection is used after TTL expiration
+        await asyncio.sleep(0.05, loop=loop)
+        reply = await dummy_stub.UnaryUnary(DummyRequest(value='ping'))
+        assert reply == DummyReply(value='pong')
+        await asyncio.sleep(0.05, loop=loop)
+        assert stub.calls == 1
+
+        # expired result is refreshed on reconnect
+        channel.close()
+        reply = await dummy_stub.UnaryUnary(DummyRequest(value='ping'))
+        assert reply == DummyReply(value='pong')
+        await asyncio.sleep(0.05, loop=loop)
+        assert stub.calls == 2
+    finally:
+        channel.close()
+        server.close()
+        await server.wait_closed()
+
+
+@pytest.mark.asyncio
+async def test_no_addresses(loop):
+    resolver = ResolverStub([], loop=loop)
+    channel = Channel('example.com', 50051, loop=loop, resolver=resolver)
+    try:
+        with pytest.raises(OSError) as err:
+            await DummyServiceStub(channel)\
+                .UnaryUnary(DummyRequest(value='ping'))
+        err.match('No addresses resolved for example.com:50051')
+    finally:
+        channel.close()
@@ -0,0 +1,167 @@
+import time
+import asyncio
+import threading
+import concurrent.futures
+
+import pytest
+
+from grpclib.client import Channel
+from grpclib.config import Configuration
+from grpclib.server import Server, blocking
+
+from dummy_pb2 import DummyRequest, DummyReply
+from dummy_grpc import DummyServiceBase, DummyServiceStub
+from conn import free_port
+
+
+class BlockingService(DummyServiceBase):
+
+    def __init__(self):
+        self.threads = set()
+        self.done = threading.Event()
+
+    @blocking
+    def UnaryUnary(self, request):
+        self.threads.add(threading.get_ident())
+        if request.value == 'sleep':
+            time.sleep(0.2)
+        return DummyReply(value='pong')
+
+    @blocking
+    def UnaryStream(self, request):
+        for i in range(3):
+            yield DummyReply(value='{}{}'.format(request.value, i))
+
+    @blocking
+    def StreamUnary(self, requests):
+        try:
+            values = [request.value for request in requests]
+        finally:
+            self.done.set()
+        return DummyReply(value=''.join(values))
+
+    @blocking
+    def StreamStream(self, requests):
+        for request in requests:
+            yield DummyReply(value=request.value)
+
+    def __getstate__(self):
+        return {}
+
+    def __setstate__(self, state):
+        self.__init__()
+
+
+class ServerFor:
+
+    def __init__(self, service, *, loop, executor=None, config=None,
+                 compression=None):
+        self.service = service
+        self.loop = loop
+        self.executor = executor
+        self.config = config
+        self.compression = compression
+
+    async def __aenter__(self):
+        port = free_port()
+        self.server = Server([self.service], loop=self.loop,
+                             executor=self.executor, config=self.config,
+                             compression=self.compression)
+        await self.server.start('127.0.0.1', port)
+        self.channel = Channel('127.0.0.1', port, loop=self.loop,
+                               compression=self.compression)
+        return DummyServiceStub(self.channel)
+
+    async def __aexit__(self, *exc_info):
+        self.channel.close()
+        self.server.close()
+        await self.server.wait_closed()
+
+
+@pytest.mark.asyncio
+async def test_thread_executor(loop):
+    service = BlockingService()
+    with concurrent.futures.ThreadPoolExecutor(2) as executor:
+        async with ServerFor(service, loop=loop, executor=executor) as stub:
+            reply = await stub.UnaryUnary(DummyRequest(value='ping'))
+            assert reply == DummyReply(value='pong')
+            assert threading.get_ident() not in service.threads
+
+            replies = await stub.UnaryStream(DummyRequest(value='ping'))
+            assert replies == [DummyReply(value='ping0'),
+                               DummyReply(value='ping1'),
+                               DummyReply(value='ping2')]
+
+            reply = await stub.StreamUnary([DummyRequest(value='foo'),
+                                            DummyRequest(value='bar')])
+            assert reply == DummyReply(value='foobar')
+
+            async with stub.StreamStream.open() as stream:
+                await stream.send_message(DummyRequest(value='foo'))
+                assert await stream.recv_message() == DummyReply(value='foo')
+                await stream.send_message(DummyRequest(value='bar'),
+                                          end=True)
+                assert await stream.recv_message() == DummyReply(value='bar')
+                assert await stream.recv_message() is None
+
+
+@pytest.mark.asyncio
+async def test_compression_with_single_thread(loop):
+    config = Configuration(codec_executor_threshold=1024)
+    with concurrent.futures.ThreadPoolExecutor(1) as executor:
+        async with ServerFor(BlockingService(), loop=loop, executor=executor,
+                             config=config, compression='gzip') as stub:
+            value = 'x' * 4096
+            reply = await asyncio.wait_for(
+                stub.UnaryStream(DummyRequest(value=value)), 1, loop=loop,
+            )
+            assert reply == [DummyReply(value='{}{}'.format(value, i))
+                             for i in range(3)]
+            reply = await asyncio.wait_for(
+                stub.StreamStream([DummyRequest(value=value)]), 1, loop=loop,
+            )
+            assert reply == [DummyReply(value=value)]
+
+
+@pytest.mark.asyncio
+async def test_event_loop_is_not_blocked(loop):
+    service = BlockingService()
+    async with ServerFor(service, loop=loop) as stub:
+        slow = loop.create_task(stub.UnaryUnary(DummyRequest(value='sleep')))
+        await asyncio.sleep(0.05, loop=loop)
+        started_at = loop.time()
+        reply = await stub.UnaryUnary(DummyRequest(value='ping'))
+        assert reply == DummyReply(value='pong')
+        assert loop.time() - started_at < 0.1
+        assert not slow.done()
+        assert await slow == DummyReply(value='pong')
+
+
+@pytest.mark.asyncio
+async def test_cancelled_request(loop):
+    service = BlockingService()
+    async with ServerFor(service, loop=loop) as stub:
+        async with stub.StreamUnary.open() as stream:
+            await stream.send_message(DummyRequest(value='foo'))
+            await asyncio.sleep(0.05, loop=loop)
+            await stream.cancel()
+        # blocking handler is not waiting for the next message forever
+        assert await loop.run_in_executor(None, service.done.wait, 1)
+
+
+@pytest.mark.asyncio
+async def test_process_executor(loop):
+    service = BlockingService()
+    with concurrent.futures.ProcessPoolExecutor(1) as executor:
+        async with ServerFor(service, loop=loop, executor=executor) as stub:
+            reply = await stub.UnaryUnary(DummyRequest(value='ping'))
+            assert reply == DummyReply(value='pong')
+
+            replies = await stub.UnaryStream(DummyRequest(value='ping'))
+            assert replies == [DummyReply(value='ping0'),
+                               DummyReply(value='ping1'),
+                               DummyReply(value='ping2')]
+
+            reply = await stub.StreamUnary([DummyRequest(value='foo'),
+                                            DummyRequest(value='bar')])
+            assert reply == DummyReply(value='foobar')
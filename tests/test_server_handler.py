@@ -156,3 +156,56 @@ async def test_deadline(loop):
         ], end_stream=True),
         Reset(ErrorCodes.NO_ERROR),
     ]
+
+
+@pytest.mark.asyncio
+async def test_unsupported_encoding(loop):
+    stream = H2StreamStub(loop=loop)
+    headers = [
+        (':method', 'POST'),
+        (':path', '/package.Service/Method'),
+        ('te', 'trailers'),
+        ('content-type', 'application/grpc'),
+        ('grpc-encoding', 'unknown'),
+    ]
+    await request_handler({}, stream, headers, ProtoCodec(), release_stream)
+    assert stream.__events__ == [
+        SendHeaders(headers=[
+            (':status', '200'),
+            ('grpc-status', '12'),  # UNIMPLEMENTED
+            ('grpc-message', 'Unsupported grpc-encoding: unknown'),
+            ('grpc-accept-encoding', 'identity,deflate,gzip'),
+        ], end_stream=True),
+        Reset(ErrorCodes.NO_ERROR),
+    ]
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize('content_type',
+                         ['application/grpc', 'application/grpc+proto'])
+async def test_metadata(content_type, loop):
+    stream = H2StreamStub(loop=loop)
+    headers = [
+        (':method', 'POST'),
+        (':path', '/package.Service/Method'),
+        ('te', 'trailers'),
+        ('content-type', content_type),
+        ('user-agent', 'test'),
+        ('x-request-id', '1'),
+        ('x-data-bin', 'AAE'),
+    ]
+    metadata = []
+
+    async def _method(stream_):
+        metadata.append(stream_.metadata)
+        await stream_.send_message(DummyReply(value='pong'))
+
+    methods = {'/package.Service/Method': Handler(
+        _method,
+        Cardinality.UNARY_UNARY,
+        DummyRequest,
+        DummyReply,
+    )}
+    await request_handler(methods, stream, headers, ProtoCodec(),
+                          release_stream)
+    assert metadata == [{'x-request-id': '1', 'x-data-bin': b'\x00\x01'}]
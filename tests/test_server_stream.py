@@ -62,6 +62,11 @@ class H2StreamStub:
     async def send_data(self, data, end_stream=False):
         self.__events__.append(SendData(data, end_stream))
 
+    async def send_message_data(self, data, end_stream=False, *,
+                                compressed=False):
+        prefix = struct.pack('?', compressed) + struct.pack('>I', len(data))
+        self.__events__.append(SendData(prefix + data, end_stream))
+
     async def end(self):
         self.__events__.append(End())
 
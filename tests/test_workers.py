@@ -0,0 +1,138 @@
+import os
+import sys
+import json
+import signal
+import subprocess
+
+import pytest
+
+from grpclib.const import Status
+from grpclib.client import Channel
+from grpclib.workers import Workers
+from grpclib.exceptions import GRPCError
+
+from dummy_pb2 import DummyRequest, DummyReply
+from dummy_grpc import DummyServiceStub
+from conn import free_port
+
+
+SCRIPT = """
+import sys
+import json
+
+from grpclib.workers import Workers
+from grpclib.admission import AdmissionControl
+
+from test_functional import DummyService
+
+
+def on_stats(stats):
+    print(json.dumps(stats), flush=True)
+
+
+def server_kwargs_factory(loop):
+    return {'admission': AdmissionControl(max_in_flight=1, loop=loop)}
+
+
+workers = Workers(lambda loop: [DummyService()], workers=2, grace=1,
+                  server_kwargs_factory=server_kwargs_factory,
+                  stats_interval=0.1, on_stats=on_stats)
+workers.run('127.0.0.1', int(sys.argv[1]))
+"""
+
+
+class WorkersProcess:
+
+    def __init__(self, port, *, loop):
+        self.port = port
+        self.loop = loop
+
+    def __enter__(self):
+        tests_dir = os.path.dirname(os.path.abspath(__file__))
+        env = dict(os.environ,
+                   PYTHONPATH=os.pathsep.join([os.path.dirname(tests_dir),
+                                               tests_dir]))
+        self.process = subprocess.Popen(
+            [sys.executable, '-c', SCRIPT, str(self.port)],
+            stdout=subprocess.PIPE, cwd=tests_dir, env=env,
+            start_new_session=True,
+        )
+        return self
+
+    def __exit__(self, *exc_info):
+        # workers are in the same process group, they are killed along
+        # with the supervisor, so they can't outlive the test
+        try:
+            os.killpg(self.process.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+        self.process.wait()
+        self.process.stdout.close()
+
+    async def stats(self, predicate):
+        while True:
+            line = await self.loop.run_in_executor(
+                None, self.process.stdout.readline,
+            )
+            assert line, 'Process exited unexpectedly'
+            stats = json.loads(line.decode('utf-8'))
+            if predicate(stats):
+                return stats
+
+
+def _all_started(stats):
+    return all('connections' in w for w in stats['workers'])
+
+
+def test_invalid_arguments():
+    with pytest.raises(ValueError):
+        Workers(lambda loop: [], workers=0)
+    with pytest.raises(ValueError):
+        Workers(lambda loop: []).run('127.0.0.1', 50051, reuse_port=True)
+
+
+@pytest.mark.asyncio
+async def test_workers(loop):
+    port = free_port()
+    with WorkersProcess(port, loop=loop) as workers:
+        stats = await workers.stats(_all_started)
+        assert len(stats['workers']) == 2
+
+        for _ in range(4):
+            channel = Channel('127.0.0.1', port, loop=loop)
+            try:
+                reply = await DummyServiceStub(channel)\
+                    .UnaryUnary(DummyRequest(value='ping'))
+                assert reply == DummyReply(value='pong')
+            finally:
+                channel.close()
+
+        # every worker has it's own admission control
+        channel = Channel('127.0.0.1', port, loop=loop)
+        stub = DummyServiceStub(channel)
+        try:
+            async with stub.StreamStream.open() as stream:
+                await stream.send_message(DummyRequest(value='ping'))
+                assert await stream.recv_message() == DummyReply(value='ping')
+                await workers.stats(lambda s: s['requests'] == 1)
+                with pytest.raises(GRPCError) as err:
+                    await stub.UnaryUnary(DummyRequest(value='ping'))
+                assert err.value.status == Status.RESOURCE_EXHAUSTED
+                await stream.end()
+                assert await stream.recv_message() is None
+        finally:
+            channel.close()
+
+        # crashed worker is restarted
+        crashed_pid = stats['workers'][0]['pid']
+        os.kill(crashed_pid, signal.SIGKILL)
+        stats = await workers.stats(
+            lambda s: s['restarts'] == 1 and _all_started(s),
+        )
+        pids = [w['pid'] for w in stats['workers']]
+        assert crashed_pid not in pids
+
+        # workers are stopped gracefully
+        workers.process.send_signal(signal.SIGTERM)
+        exitcode = await loop.run_in_executor(None, workers.process.wait)
+        assert exitcode == 0